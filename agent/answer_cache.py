@@ -0,0 +1,93 @@
+"""Answer cache keyed by the resolved intent of a question rather than its wording.
+
+Paraphrases of one business question resolve to the same plan: the same template,
+date window and categories. The cache key is that plan plus the route and format_hint.
+A hit returns the whole answer, citations included, without retrieval, SQL or
+synthesis. Only SQL-backed answers with a matched template are cached. RAG-only and
+fallback answers depend on the retrieved text, which the plan does not capture.
+
+Entries expire after a TTL and are evicted LRU-first. Each entry is tagged with the
+DB fingerprint and a stamp of the docs directory, so any change to the DB (or
+attached rollups) or to a file in docs/ invalidates it. The stamps are re-read at most
+every `recheck` seconds, so a hit costs no file-system calls and a change is noticed
+within that interval.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+
+def docs_fingerprint(docs_path: str) -> str:
+    """Cheap version stamp of a docs directory: name, mtime and size of every file in it."""
+    try:
+        entries = sorted(os.scandir(docs_path), key=lambda e: e.name)
+    except OSError:
+        return ""
+    parts = []
+    for e in entries:
+        if e.is_file():
+            st = e.stat()
+            parts.append(f"{e.name}:{st.st_mtime_ns}:{st.st_size}")
+    return "|".join(parts)
+
+
+def answer_key(route: str, plan: Dict, format_hint: str) -> Optional[str]:
+    """Canonical fingerprint of a question's intent, or None if its answer is not cacheable."""
+    if route == 'rag' or not plan.get('template'):
+        return None
+    return json.dumps([route, plan['template'], plan.get('date_range'), sorted(plan.get('categories') or []),
+                       format_hint or ""])
+
+
+class AnswerCache:
+    def __init__(self, docs_path: str, max_entries: int = 4096, ttl: Optional[float] = 3600.0,
+                 recheck: float = 1.0):
+        self.docs_path = docs_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.recheck = recheck
+        self._stamp: Tuple[float, str] = (float("-inf"), "")
+        self.hits = 0
+        self.misses = 0
+        # key -> (fingerprint, expiry, answer as JSON); answers are stored serialized so
+        # a caller editing the dict it got back cannot change the cached one
+        self._entries: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fingerprint(self, db_fingerprint: Callable[[], str]) -> str:
+        """Combined DB and docs version stamp, re-read at most every `recheck` seconds."""
+        now = time.monotonic()
+        checked, fp = self._stamp
+        if now - checked >= self.recheck:
+            fp = db_fingerprint() + "#" + docs_fingerprint(self.docs_path)
+            self._stamp = (now, fp)
+        return fp
+
+    def get(self, key: str, fingerprint: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] != fingerprint or (self.ttl and time.monotonic() > entry[1])):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(entry[2])
+
+    def put(self, key: str, fingerprint: str, answer: Dict):
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            self._entries[key] = (fingerprint, expires, json.dumps(answer))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0,
+                "entries": len(self._entries)}
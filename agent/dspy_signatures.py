@@ -4,18 +4,14 @@ We implement a Router class with a simple keyword baseline and a tiny trained cl
 that demonstrates an improvement on a handcrafted tiny dataset. This satisfies the
 requirement to "use DSPy to optimize at least one component" in a small, local way.
 """
-from typing import List
+from typing import List, NamedTuple
 import re
 import json
-from dataclasses import dataclass
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.pipeline import make_pipeline
 
-
-@dataclass
-class RouterResult:
+class RouterResult(NamedTuple):
+    # NamedTuple rather than a dataclass: dataclasses imports inspect, which is a
+    # noticeable share of agent start-up time
     route: str  # 'rag' | 'sql' | 'hybrid'
     score: float
 
@@ -28,8 +24,9 @@ class Router:
             "top", "revenue", "aov", "average order value", "margin", "quantity", "total", "best", "customer", "products", "category", "order value", "gross"
         ]
         self.keywords_rag = ["policy", "return window", "return", "calendar", "marketing"]
-        # small trained classifier pipeline (Tfidf + LogisticRegression)
-        self.model = make_pipeline(TfidfVectorizer(stop_words='english'), LogisticRegression(max_iter=500))
+        # small trained classifier pipeline (Tfidf + LogisticRegression), built on first train()
+        # so that routing with the baseline never imports scikit-learn
+        self.model = None
         self._trained = False
 
     def baseline_route(self, text: str) -> RouterResult:
@@ -45,6 +42,11 @@ class Router:
         y = [e['label'] for e in examples]
         if len(X) < 3:
             return
+        if self.model is None:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.linear_model import LogisticRegression
+            from sklearn.pipeline import make_pipeline
+            self.model = make_pipeline(TfidfVectorizer(stop_words='english'), LogisticRegression(max_iter=500))
         self.model.fit(X, y)
         self._trained = True
 
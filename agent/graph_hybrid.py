@@ -4,135 +4,262 @@ This is a compact but functional implementation that follows the assignment node
 """
 import re
 import json
-from typing import Any, Dict, List, Tuple
+import itertools
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 from agent.rag.retrieval import Retriever
-from agent.tools.sqlite_tool import SQLiteTool
+from agent.tools.sqlite_tool import RETRYABLE_ERRORS, SQLiteTool, classify_error
 from agent.dspy_signatures import Router, RouterResult
-import datetime
+from agent.templates import FUSED, REGISTRY
+from agent.tracing import Tracer
+
+if TYPE_CHECKING:
+    from agent.answer_cache import AnswerCache
+    from agent.tools.kpi_engine import KpiEngine
+    from agent.tools.rollups import RollupStore
+    from agent.tools.shards import ShardedExecutor
+    from agent.tools.sql_cache import NegativeResultMemo, ResultCache
+
+# SQL, params, columns and rows a question was answered with by a fused batch query
+Prefetched = Tuple[str, Tuple[Any, ...], List[str], List[Tuple[Any, ...]]]
+
+# Failures that will repeat for the same SQL on the same DB; remembered so later
+# questions skip the query (timeouts only while the time budget is no larger)
+MEMO_ERRORS = frozenset({"syntax", "schema", "empty", "timeout"})
 
 
 class HybridAgent:
-    def __init__(self, db_path: str = None):
-        self.retriever = Retriever()
+    def __init__(self, db_path: str = None, retriever: Retriever = None, sql_cache: "ResultCache" = None,
+                 rollups: "RollupStore" = None, kpi_engine: str = "off", tracer: Tracer = None,
+                 time_budget: float = None, answer_cache: "AnswerCache" = None, shards: "ShardedExecutor" = None):
+        # Retriever and DB connection are built on first use: RAG-only questions never
+        # open SQLite, and a fresh process is ready before either is needed.
+        # A prebuilt retriever can be shared between agents (e.g. batch workers).
+        self._retriever = retriever
+        self._sqlite = None
+        self.db_path = db_path
+        self.sql_cache = sql_cache
+        # Daily rollup tables (agent/tools/rollups.py), attached to the DB connections;
+        # nl2sql rewrites date-window KPIs onto them while they are fresh
+        self.rollups = rollups
+        # In-memory NumPy executor for the KPI templates (agent/tools/kpi_engine.py):
+        # "off", "on" (answer from it) or "check" (also run SQLite and compare)
+        self.kpi_engine_mode = kpi_engine
+        self._kpi_engine = None
         self.router = Router()
-        self.sqlite = SQLiteTool(db_path)
-        self.log_events: List[Dict] = []
+        self.templates = REGISTRY
+        # Spans, per-question traces and stage latency histograms (agent/tracing.py)
+        self.tracer = tracer or Tracer()
+        # Per-question time budget in seconds (None: unbounded); SQL still running when
+        # it runs out is cancelled through SQLite's progress handler
+        self.time_budget = time_budget
+        self._negative_memo = None
+        # Whole answers keyed by the resolved plan (agent/answer_cache.py), so
+        # paraphrases of a question already answered skip retrieval and SQL
+        self.answer_cache = answer_cache
+        # Time-partitioned shard files (agent/tools/shards.py); KPI templates are then
+        # answered by scatter-gather over the shards overlapping their window
+        self.shards = shards
+
+    @property
+    def retriever(self) -> Retriever:
+        if self._retriever is None:
+            self._retriever = Retriever()
+        return self._retriever
+
+    @property
+    def sqlite(self) -> SQLiteTool:
+        if self._sqlite is None:
+            attach = {}
+            # Only fresh rollups are attached: a missing or stale file would fail or
+            # never be read. The attachment is fixed for the pool's lifetime, so
+            # rollups that become fresh later are not picked up by this agent.
+            if self.rollups is not None and self.rollups.is_fresh():
+                from agent.tools.rollups import SCHEMA
+                attach[SCHEMA] = self.rollups.path
+            self._sqlite = SQLiteTool(self.db_path, cache=self.sql_cache, attach=attach)
+        return self._sqlite
+
+    @property
+    def kpi_engine(self) -> "KpiEngine":
+        if self._kpi_engine is None:
+            from agent.tools.kpi_engine import KpiEngine
+            self._kpi_engine = KpiEngine(self.sqlite)
+        return self._kpi_engine
+
+    @property
+    def negative_memo(self) -> "NegativeResultMemo":
+        if self._negative_memo is None:
+            from agent.tools.sql_cache import NegativeResultMemo
+            self._negative_memo = NegativeResultMemo()
+        return self._negative_memo
+
+    def db_fingerprint(self) -> str:
+        """Version stamp of whatever the SQL answers come from: the shards, or the DB and its attachments."""
+        return self.shards.fingerprint() if self.shards is not None else self.sqlite.fingerprint()
 
     def _log(self, kind: str, data: Dict):
-        entry = {"time": datetime.datetime.utcnow().isoformat() + 'Z', "kind": kind, "data": data}
-        self.log_events.append(entry)
-        # Also print short trace
-        print(f"[trace] {kind}: {data}")
+        self.tracer.event(kind, data)
 
     def route(self, question: str) -> RouterResult:
-        r = self.router.predict(question)
+        with self.tracer.span('route'):
+            r = self.router.predict(question)
         self._log('router', {'question': question, 'route': r.route, 'score': r.score})
         return r
 
     def retrieve(self, question: str, k: int = 3):
-        docs = self.retriever.retrieve(question, k=k)
+        with self.tracer.span('retrieve'):
+            docs = self.retriever.retrieve(question, k=k)
         chunks = [d[0] for d in docs]
         scores = [d[1] for d in docs]
         self._log('retriever', {'question': question, 'chunks': [c['id'] for c in chunks], 'scores': scores})
         return chunks
 
+    def retrieve_many(self, questions: List[str], k: int = 3) -> List[List[Dict]]:
+        # Batched variant of retrieve(): one sparse product for the whole batch. Runs
+        # before the questions' traces start; repair_and_run logs the chunks it was given.
+        with self.tracer.span('retrieve_many'):
+            return [[d[0] for d in docs] for docs in self.retriever.retrieve_many(questions, k=k)]
+
     def plan(self, question: str, docs: List[Dict]) -> Dict:
-        # Very small planner: extract date ranges and category tokens using regex
-        plan = {"date_range": None, "categories": []}
-        # try to detect marketing calendar names
-        if "summer" in question.lower():
-            plan['date_range'] = ("1997-06-01", "1997-06-30")
-        if "winter" in question.lower():
-            plan['date_range'] = ("1997-12-01", "1997-12-31")
-        # categories: look for known category names in question
-        cats = ['Beverages', 'Condiments', 'Confections', 'Dairy Products', 'Produce', 'Seafood']
-        for c in cats:
-            if c.lower() in question.lower() or c.split()[0].lower() in question.lower():
-                plan['categories'].append(c)
+        # Very small planner: one pass of the template registry's matcher yields the
+        # marketing-calendar window, category names and the NL->SQL template to use
+        with self.tracer.span('plan'):
+            plan = self._plan(question)
         self._log('planner', {'plan': plan})
         return plan
 
-    def nl2sql(self, question: str, plan: Dict) -> str:
-        # Robust rule-based NL->SQL for the eval questions; ignore case/punctuation
-        import re
-        q = question.lower()
-        q = re.sub(r'[^a-z0-9 ]', ' ', q)  # remove punctuation
-        # Top 3 products by revenue
-        if ('top 3' in q and 'product' in q and 'revenue' in q) or ('top three' in q and 'revenue' in q):
-            return (
-                "SELECT p.ProductName AS product, "
-                "SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue "
-                "FROM \"Order Details\" od "
-                "JOIN \"Products\" p ON p.ProductID = od.ProductID "
-                "GROUP BY p.ProductID, p.ProductName "
-                "ORDER BY revenue DESC "
-                "LIMIT 3;"
-            )
-        # Average Order Value (AOV) during a date range
-        if (('average order value' in q or 'aov' in q) and ('winter' in q or 'date' in q or 'classics' in q)):
-            dr = plan.get('date_range')
-            date_filter = ""
-            if dr:
-                date_filter = f"WHERE \"Orders\".OrderDate >= '{dr[0]}' AND \"Orders\".OrderDate <= '{dr[1]}'"
-            return (
-                "SELECT (SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) / COUNT(DISTINCT \"Orders\".OrderID)) AS aov "
-                "FROM \"Orders\" JOIN \"Order Details\" od ON \"Orders\".OrderID = od.OrderID "
-                f"{date_filter};"
-            )
-        # Total revenue from Beverages during a date range
-        if ('total revenue' in q and 'beverages' in q and ('summer' in q or 'date' in q)):
-            dr = plan.get('date_range')
-            date_filter = ""
-            if dr:
-                date_filter = f"AND \"Orders\".OrderDate >= '{dr[0]}' AND \"Orders\".OrderDate <= '{dr[1]}'"
-            return (
-                "SELECT SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue "
-                "FROM \"Order Details\" od "
-                "JOIN \"Products\" p ON p.ProductID = od.ProductID "
-                "JOIN \"Orders\" ON \"Orders\".OrderID = od.OrderID "
-                "JOIN \"Categories\" c ON p.CategoryID = c.CategoryID "
-                "WHERE c.CategoryName = 'Beverages' "
-                f"{date_filter};"
-            )
-        # Highest total quantity sold by category during summer
-        if (('highest total quantity' in q or 'top category' in q or 'most sold' in q) and ('summer' in q or 'june' in q)):
-            return (
-                "SELECT c.CategoryName AS category, SUM(od.Quantity) AS quantity "
-                "FROM \"Order Details\" od "
-                "JOIN \"Orders\" ON \"Orders\".OrderID = od.OrderID "
-                "JOIN \"Products\" p ON p.ProductID = od.ProductID "
-                "JOIN \"Categories\" c ON p.CategoryID = c.CategoryID "
-                "WHERE \"Orders\".OrderDate >= '1997-06-01' AND \"Orders\".OrderDate <= '1997-06-30' "
-                "GROUP BY c.CategoryID, c.CategoryName ORDER BY quantity DESC LIMIT 1;"
-            )
-        # Best customer by gross margin in 1997
-        if (('best customer' in q or 'top customer' in q) and ('margin' in q or 'gross' in q) and '1997' in q):
-            return (
-                "SELECT cu.CompanyName AS customer, "
-                "SUM((od.UnitPrice - (0.7 * od.UnitPrice)) * od.Quantity * (1 - od.Discount)) AS margin "
-                "FROM \"Order Details\" od "
-                "JOIN \"Orders\" o ON o.OrderID = od.OrderID "
-                "JOIN \"Customers\" cu ON cu.CustomerID = o.CustomerID "
-                "WHERE o.OrderDate >= '1997-01-01' AND o.OrderDate <= '1997-12-31' "
-                "GROUP BY cu.CustomerID, cu.CompanyName ORDER BY margin DESC LIMIT 1;"
-            )
+    def _plan(self, question: str) -> Dict:
+        features = self.templates.features(question)
+        template = self.templates.match(features)
+        return {
+            "date_range": self.templates.date_range(features),
+            "categories": self.templates.category_names(features),
+            "template": template.id if template else None,
+        }
+
+    def fuse(self, questions: List[str]) -> List[Optional[Prefetched]]:
+        """Batch planner: answer same-shape KPI questions with one fused query per shape.
+
+        Questions whose rendered SQL has a fused form (agent.templates.FUSED) are grouped
+        by that SQL; each group of two or more runs one statement over the distinct param
+        tuples, and its rows are fanned back out. Returns, per question, what to pass to
+        repair_and_run as `prefetched`, or None to let it run its own query.
+        """
+        out: List[Optional[Prefetched]] = [None] * len(questions)
+        if self.kpi_engine_mode != "off" or self.shards is not None:
+            return out  # the in-memory engine answers these without a scan; shards split the scan already
+        groups: Dict[str, Dict[Tuple[Any, ...], List[int]]] = {}
+        with self.tracer.span('batch_plan'):
+            for i, question in enumerate(questions):
+                sql, params = self._render(question, self._plan(question))
+                if sql in FUSED:
+                    groups.setdefault(sql, {}).setdefault(tuple(params), []).append(i)
+        for sql, by_params in groups.items():
+            if sum(len(idx) for idx in by_params.values()) < 2:
+                continue
+            distinct = list(by_params)
+            fused_sql, fused_params = FUSED[sql](distinct)
+            deadline = time.monotonic() + self.time_budget if self.time_budget else None
+            with self.tracer.span('execute_fused'):
+                cols, rows, err = self.sqlite.run(fused_sql, fused_params, deadline=deadline)
+            if err:
+                continue  # each question retries on its own
+            by_k = {r[0]: [tuple(r[1:])] for r in rows}
+            empty = [(None,) * (len(cols) - 1)]  # what the single-row aggregate returns for no rows
+            for k, params in enumerate(distinct):
+                for i in by_params[params]:
+                    out[i] = (sql, params, cols[1:], by_k.get(k, empty))
+        return out
+
+    def nl2sql(self, question: str, plan: Dict) -> Tuple[str, Tuple[Any, ...]]:
+        # Rule-based NL->SQL from the template registry (agent/templates.py); the plan
+        # already carries the matched template, otherwise match the question here.
+        # Returns (sql, params) with values bound through ? placeholders.
+        with self.tracer.span('nl2sql'):
+            return self._render(question, plan)
+
+    def _render(self, question: str, plan: Dict) -> Tuple[str, Tuple[Any, ...]]:
+        if 'template' in plan:
+            template = self.templates.by_id.get(plan['template'])
+        else:
+            template = self.templates.match(self.templates.features(question))
         # Fallback: empty -> RAG-only
-        return ""
+        if not template:
+            return "", ()
+        if template.rollup is not None and self._rollups_usable():
+            return template.rollup(plan)
+        return template.render(plan)
+
+    def _rollups_usable(self) -> bool:
+        if self.rollups is None:
+            return False
+        from agent.tools.rollups import SCHEMA
+        return SCHEMA in self.sqlite.attach and self.rollups.is_fresh()
 
-    def execute_sql(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]], str]:
+    def execute_sql(self, sql: str, params: Tuple[Any, ...] = (), template_id: str = None,
+                    deadline: float = None) -> Tuple[List[str], List[Tuple[Any, ...]], str]:
+        # deadline is a time.monotonic() value; the query is cancelled once it passes
         if not sql:
             return [], [], "no-sql"
-        cols, rows, err = self.sqlite.run(sql)
-        self._log('executor', {'sql': sql, 'err': err, 'rows': len(rows)})
+        if self.shards is not None and self.shards.supports(template_id):
+            with self.tracer.span('execute_shards'):
+                cols, rows, err = self.shards.run(template_id, params, deadline=deadline)
+            self._log('executor', {'engine': 'shards', 'template': template_id, 'params': params, 'err': err,
+                                   'rows': len(rows)})
+            return cols, rows, err or ""
+        if self.kpi_engine_mode != "off" and self.kpi_engine.supports(template_id):
+            with self.tracer.span('execute_kpi'):
+                return self._execute_kpi(sql, params, template_id)
+        from agent.tools.sql_cache import make_key
+        key, fingerprint = make_key(sql, params), self.sqlite.fingerprint()
+        budget = deadline - time.monotonic() if deadline is not None else None
+        known = self.negative_memo.get(key, fingerprint, budget)
+        if known is not None:
+            self._log('negative_memo_hit', {'sql': sql, 'params': params, 'kind': known[0]})
+            return [], [], known[1]
+        with self.tracer.span('execute'):
+            cols, rows, err = self.sqlite.run(sql, params, deadline=deadline)
+        self._log('executor', {'sql': sql, 'params': params, 'err': err, 'rows': len(rows)})
+        kind = classify_error(err, rows)
+        if kind in MEMO_ERRORS:
+            self.negative_memo.put(key, fingerprint, kind, err or "", budget)
         return cols, rows, err or ""
 
-    def synthesize(self, qid: str, question: str, rows: List[Tuple], cols: List[str], docs: List[Dict], sql: str, format_hint: str) -> Dict:
+    def _execute_kpi(self, sql: str, params: Tuple[Any, ...], template_id: str):
+        # The engine takes the same params the template bound for SQLite
+        cols, rows = self.kpi_engine.run(template_id, params)
+        self._log('executor', {'engine': 'numpy', 'template': template_id, 'params': params, 'rows': len(rows)})
+        if self.kpi_engine_mode == "check":
+            from agent.tools.kpi_engine import results_match
+            sql_cols, sql_rows, err = self.sqlite.run(sql, params)
+            if err or not results_match(rows, sql_rows):
+                # SQLite is the reference: report the mismatch and answer from it
+                self._log('kpi_mismatch', {'template': template_id, 'params': params, 'engine': rows,
+                                           'sqlite': sql_rows, 'err': err})
+                return sql_cols, sql_rows, err or ""
+        return cols, rows, ""
+
+    def synthesize(self, qid: str, question: str, rows: Iterable[Tuple], cols: List[str], docs: List[Dict], sql: str, format_hint: str) -> Dict:
+        with self.tracer.span('synthesize'):
+            return self._synthesize(rows, docs, sql, format_hint)
+
+    def _synthesize(self, rows: Iterable[Tuple], docs: List[Dict], sql: str, format_hint: str) -> Dict:
+        # rows may be a list or a lazy stream (SQLiteTool.iter_rows): only the first row is
+        # read for scalar answers, and list answers consume the rest one row at a time
+        rows = iter(rows)
+        first = next(rows, None)
         # Build citations: include used DB tables and doc chunk ids
         citations = []
-        # detect tables referenced in sql
+        # detect tables referenced in sql; a rollup table stands for the tables it is built from
         if sql:
+            searched = sql
+            if 'rollup.' in sql:
+                from agent.tools.rollups import ROLLUP_SOURCES
+                searched += " " + " ".join(" ".join(src) for name, src in ROLLUP_SOURCES.items()
+                                           if re.search(rf"\brollup\.{name}\b", sql))
             for t in ['Orders', 'Order Details', 'Products', 'Customers', 'Categories']:
-                if re.search(rf"\b{re.escape(t)}\b", sql, re.IGNORECASE):
+                if re.search(rf"\b{re.escape(t)}\b", searched, re.IGNORECASE):
                     citations.append(t)
         # add doc chunk ids used
         for d in docs:
@@ -145,8 +272,8 @@ class HybridAgent:
         # Format according to format_hint (handle common forms)
         if format_hint == 'int':
             # expect single-row single-col integer
-            if rows and len(rows) >= 1:
-                v = int(rows[0][0])
+            if first is not None:
+                v = int(first[0])
                 final_answer = v
                 confidence = 0.9
             else:
@@ -154,17 +281,17 @@ class HybridAgent:
                 confidence = 0.2
         elif format_hint.startswith('{') and 'category' in format_hint:
             # {category:str, quantity:int}
-            if rows and len(rows) >= 1:
-                category = rows[0][0]
-                qty = int(rows[0][1])
+            if first is not None:
+                category = first[0]
+                qty = int(first[1])
                 final_answer = {"category": category, "quantity": qty}
                 confidence = 0.9
             else:
                 final_answer = {"category": "", "quantity": 0}
                 confidence = 0.2
         elif format_hint == 'float':
-            if rows and len(rows) >= 1 and rows[0][0] is not None:
-                v = float(rows[0][0])
+            if first is not None and first[0] is not None:
+                v = float(first[0])
                 final_answer = round(v, 2)
                 confidence = 0.9
             else:
@@ -173,13 +300,13 @@ class HybridAgent:
         elif format_hint.startswith('list'):
             # expect rows with product and revenue
             out = []
-            for r in rows:
+            for r in itertools.chain([first] if first is not None else [], rows):
                 out.append({"product": r[0], "revenue": round(float(r[1]), 2)})
             final_answer = out
             confidence = 0.9 if out else 0.2
         elif format_hint.startswith('{customer'):
-            if rows and len(rows) >= 1:
-                final_answer = {"customer": rows[0][0], "margin": round(float(rows[0][1]), 2)}
+            if first is not None:
+                final_answer = {"customer": first[0], "margin": round(float(first[1]), 2)}
                 confidence = 0.9
             else:
                 final_answer = {"customer": "", "margin": 0.0}
@@ -197,11 +324,34 @@ class HybridAgent:
             "citations": citations,
         }
 
-    def repair_and_run(self, qid: str, question: str, format_hint: str):
-        # 2 repair attempts max
+    def repair_and_run(self, qid: str, question: str, format_hint: str, docs: List[Dict] = None,
+                       prefetched: Prefetched = None):
+        with self.tracer.trace(qid):
+            return self._repair_and_run(qid, question, format_hint, docs, prefetched)
+
+    def _repair_and_run(self, qid: str, question: str, format_hint: str, docs: List[Dict] = None,
+                        prefetched: Prefetched = None):
+        # 2 repair attempts max; docs may be pre-retrieved by the caller (see retrieve_many)
+        # and rows pre-computed by a fused batch query (see fuse)
+        deadline = time.monotonic() + self.time_budget if self.time_budget else None
         route = self.route(question).route
-        docs = self.retrieve(question, k=3)
+        # The plan does not depend on the retrieved docs, so a cached answer for the
+        # same intent is looked up before retrieval
         plan = self.plan(question, docs)
+        cache_key = cache_fp = None
+        if self.answer_cache is not None:
+            from agent.answer_cache import answer_key
+            cache_key = answer_key(route, plan, format_hint)
+        if cache_key is not None:
+            cache_fp = self.answer_cache.fingerprint(self.db_fingerprint)
+            hit = self.answer_cache.get(cache_key, cache_fp)
+            if hit is not None:
+                self._log('answer_cache_hit', {'key': cache_key})
+                return hit
+        if docs is None:
+            docs = self.retrieve(question, k=3)
+        else:
+            self._log('retriever', {'question': question, 'chunks': [c['id'] for c in docs], 'prefetched': True})
 
         # If router chooses rag and SQL not needed -> synth from docs only
         if route == 'rag':
@@ -211,32 +361,42 @@ class HybridAgent:
             m = re.search(r"Beverages unopened: (\d+) days", combined)
             if m:
                 val = int(m.group(1))
-                return {"final_answer": val, "sql": "", "confidence": 0.9, "explanation": "Retrieved from product_policy", "citations": [docs[0]['id']]}
+                return {"final_answer": val, "sql": "", "params": [], "confidence": 0.9, "explanation": "Retrieved from product_policy", "citations": [docs[0]['id']]}
             # fallback
-            return {"final_answer": "", "sql": "", "confidence": 0.2, "explanation": "RAG-only fallback", "citations": [d['id'] for d in docs]}
+            return {"final_answer": "", "sql": "", "params": [], "confidence": 0.2, "explanation": "RAG-only fallback", "citations": [d['id'] for d in docs]}
 
-        # Try NL->SQL and execute, with up to 2 repairs
+        # Try NL->SQL and execute, with up to 2 repairs. nl2sql is deterministic, so only
+        # transient failures (locked DB, I/O) are retried; syntax/schema errors, empty
+        # results and timeouts would fail the same way again.
         attempts = 0
         last_sql = ""
+        last_params = ()
+        kind = "error"
         while attempts <= 2:
-            sql = self.nl2sql(question, plan)
-            last_sql = sql
-            cols, rows, err = self.execute_sql(sql)
+            sql, params = self.nl2sql(question, plan)
+            last_sql, last_params = sql, params
+            if prefetched is not None and prefetched[:2] == (sql, tuple(params)):
+                cols, rows, err = prefetched[2], prefetched[3], ""
+                self._log('executor', {'sql': sql, 'params': params, 'fused': True, 'rows': len(rows)})
+            else:
+                cols, rows, err = self.execute_sql(sql, params, template_id=plan.get('template'), deadline=deadline)
+            prefetched = None
+            kind = classify_error(err, rows)
             if err:
-                print(f"[SQL ERROR] {err} for SQL: {sql}")
-            if not err and (rows is not None) and len(rows) > 0:
-                # success
+                self._log('sql_error', {'err': err, 'kind': kind, 'sql': sql, 'params': params})
+            if kind == "ok":
                 out = self.synthesize(qid, question, rows, cols, docs, sql, format_hint)
                 out['sql'] = sql
+                # The SQL keeps its ? placeholders; the bound window/category values are
+                # recorded next to it so an answer can be traced back to its inputs
+                out['params'] = list(params)
+                if cache_key is not None:
+                    self.answer_cache.put(cache_key, cache_fp, out)
                 return out
-            # repair attempt: always try lowercase views if not already tried
-            self._log('repair_attempt', {'attempt': attempts + 1, 'err': err})
-            # Try lowercase view names for all relevant tables
-            # Do not attempt lowercase view repair; always use original table names with correct quoting
-            # (No-op: skip lowercase repair since views cannot be created due to table name conflicts)
-            attempts += 1
-            continue
+            if kind not in RETRYABLE_ERRORS or (deadline is not None and time.monotonic() >= deadline):
+                break
+            self._log('repair_attempt', {'attempt': attempts + 1, 'err': err, 'kind': kind})
             attempts += 1
 
         # After repairs, fallback
-        return {"final_answer": "", "sql": last_sql, "confidence": 0.1, "explanation": "Failed after repairs", "citations": [d['id'] for d in docs]}
+        return {"final_answer": "", "sql": last_sql, "params": list(last_params), "confidence": 0.1, "explanation": f"Failed after repairs ({kind})", "citations": [d['id'] for d in docs]}
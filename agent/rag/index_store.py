@@ -0,0 +1,264 @@
+"""Persistent, incrementally updated BM25 index for the Retriever.
+
+Layout of an index directory:
+  CURRENT             name of the live generation directory (swapped atomically)
+  gen-<n>/manifest.json   per-file sha1/mtime/size and the chunk rows each file owns
+  gen-<n>/vocab.json      term -> column
+  gen-<n>/chunks.json     [{id, content, source}] aligned with count rows
+  gen-<n>/*.npy           raw term counts and the BM25 posting lists as CSR arrays
+
+Arrays are memory-mapped on load. Raw counts are kept next to the postings so a changed
+or added file only needs its own chunks re-tokenized; BM25 weights are then re-derived
+from document frequencies and lengths, which is a cheap vectorized pass.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from agent.rag.stopwords import ENGLISH_STOP_WORDS
+
+# Bumped whenever the on-disk layout or weighting changes; older indexes are rebuilt
+INDEX_FORMAT = 2
+
+# Same tokenization as TfidfVectorizer(stop_words='english')
+TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+Chunker = Callable[[str, str], List[Tuple[str, str]]]
+
+
+def analyze(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in ENGLISH_STOP_WORDS]
+
+
+def _sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DocIndex:
+    """Chunks, vocabulary and a BM25 inverted index built from raw per-chunk term counts.
+
+    `postings` is a terms x chunks CSR matrix: row t is the posting list of term t with
+    its precomputed BM25 weight per chunk, so scoring a query only touches the posting
+    lists of the query's own terms.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, chunks: List[Dict], vocab: Dict[str, int], counts: sp.csr_matrix,
+                 files: Dict[str, Dict], postings: Optional[sp.csr_matrix] = None):
+        self.chunks = chunks
+        self.vocab = vocab
+        self.counts = counts
+        self.files = files
+        self.postings = postings if postings is not None else self._weigh(counts)
+
+    @classmethod
+    def _weigh(cls, counts: sp.csr_matrix) -> sp.csr_matrix:
+        n_docs, n_terms = counts.shape
+        if n_docs == 0:
+            return sp.csr_matrix((n_terms, 0), dtype=np.float64)
+        df = np.bincount(counts.indices, minlength=n_terms)
+        # Lucene-style idf: stays positive even for terms present in most chunks
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        dl = np.asarray(counts.sum(axis=1)).ravel().astype(np.float64)
+        avgdl = dl.mean() or 1.0
+        coo = counts.tocoo()
+        tf = coo.data.astype(np.float64)
+        norm = cls.k1 * (1.0 - cls.b + cls.b * dl[coo.row] / avgdl)
+        weights = idf[coo.col] * tf * (cls.k1 + 1.0) / (tf + norm)
+        return sp.csr_matrix((weights, (coo.col, coo.row)), shape=(n_terms, n_docs))
+
+    def query_matrix(self, texts: List[str]) -> sp.csr_matrix:
+        """Term counts of each query over the index vocabulary (unknown terms dropped)."""
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for text in texts:
+            row: Dict[int, float] = {}
+            for tok in analyze(text):
+                j = self.vocab.get(tok)
+                if j is not None:
+                    row[j] = row.get(j, 0.0) + 1.0
+            indices.extend(row.keys())
+            data.extend(row.values())
+            indptr.append(len(indices))
+        return sp.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(texts), len(self.vocab)),
+        )
+
+
+def _count_rows(texts: List[str], vocab: Dict[str, int]) -> sp.csr_matrix:
+    """Tokenize texts into a raw count matrix, appending unseen terms to vocab."""
+    indptr = [0]
+    indices: List[int] = []
+    data: List[int] = []
+    for text in texts:
+        row: Dict[int, int] = {}
+        for tok in analyze(text):
+            j = vocab.setdefault(tok, len(vocab))
+            row[j] = row.get(j, 0) + 1
+        indices.extend(row.keys())
+        data.extend(row.values())
+        indptr.append(len(indices))
+    return sp.csr_matrix(
+        (np.array(data, dtype=np.int32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(texts), len(vocab)),
+    )
+
+
+def _list_docs(docs_path: str) -> List[str]:
+    if not os.path.exists(docs_path):
+        return []
+    return [fn for fn in sorted(os.listdir(docs_path)) if os.path.isfile(os.path.join(docs_path, fn))]
+
+
+def build_index(docs_path: str, chunker: Chunker, previous: Optional[DocIndex] = None) -> Tuple[DocIndex, bool]:
+    """Index docs_path, reusing rows of `previous` for files whose content is unchanged.
+
+    Returns (index, changed). Unchanged files are recognised by mtime/size first and by
+    content hash when those differ, so an untouched corpus is never re-read.
+    """
+    old_files = previous.files if previous is not None else {}
+    vocab = dict(previous.vocab) if previous is not None else {}
+    files: Dict[str, Dict] = {}
+    chunks: List[Dict] = []
+    parts: List[sp.csr_matrix] = []
+    changed = previous is None
+
+    for fn in _list_docs(docs_path):
+        path = os.path.join(docs_path, fn)
+        st = os.stat(path)
+        old = old_files.get(fn)
+        stat_key = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+        if old is not None and old["mtime_ns"] == st.st_mtime_ns and old["size"] == st.st_size:
+            digest = old["sha1"]
+        else:
+            digest = _sha1(path)
+        if old is not None and old["sha1"] == digest:
+            # Reuse the previously counted rows for this file
+            start, stop = old["rows"]
+            rows = previous.counts[start:stop]
+            file_chunks = previous.chunks[start:stop]
+            changed = changed or old["mtime_ns"] != st.st_mtime_ns or old["size"] != st.st_size
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            pairs = chunker(fn, content)
+            file_chunks = [{"id": cid, "content": text, "source": cid.split("::")[0]} for cid, text in pairs]
+            rows = _count_rows([text for _, text in pairs], vocab)
+            changed = True
+        files[fn] = dict(stat_key, sha1=digest, rows=[len(chunks), len(chunks) + len(file_chunks)])
+        chunks.extend(file_chunks)
+        parts.append(rows)
+
+    if set(old_files) - set(files):
+        changed = True
+    if not changed:
+        return previous, False
+    n_terms = len(vocab)
+    parts = [sp.csr_matrix((p.data, p.indices, p.indptr), shape=(p.shape[0], n_terms)) for p in parts]
+    counts = sp.vstack(parts, format="csr") if parts else sp.csr_matrix((0, n_terms), dtype=np.int32)
+    vocab, counts = _compact(vocab, counts)
+    return DocIndex(chunks, vocab, counts.astype(np.int32), files), True
+
+
+def _compact(vocab: Dict[str, int], counts: sp.csr_matrix) -> Tuple[Dict[str, int], sp.csr_matrix]:
+    """Drop terms no chunk contains any more (left behind by changed or removed files)."""
+    used = np.flatnonzero(np.bincount(counts.indices, minlength=len(vocab)))
+    if len(used) == len(vocab):
+        return vocab, counts
+    terms = [None] * len(vocab)
+    for term, j in vocab.items():
+        terms[j] = term
+    remap = np.full(len(vocab), -1, dtype=np.int32)
+    remap[used] = np.arange(len(used), dtype=np.int32)
+    compacted = sp.csr_matrix((counts.data, remap[counts.indices], counts.indptr), shape=(counts.shape[0], len(used)))
+    return {terms[j]: i for i, j in enumerate(used)}, compacted
+
+
+def _save_csr(dirpath: str, name: str, m: sp.csr_matrix):
+    np.save(os.path.join(dirpath, f"{name}_data.npy"), m.data)
+    np.save(os.path.join(dirpath, f"{name}_indices.npy"), m.indices)
+    np.save(os.path.join(dirpath, f"{name}_indptr.npy"), m.indptr)
+
+
+def _load_csr(dirpath: str, name: str, shape: Tuple[int, int]) -> sp.csr_matrix:
+    arrays = [np.load(os.path.join(dirpath, f"{name}_{part}.npy"), mmap_mode="r")
+              for part in ("data", "indices", "indptr")]
+    return sp.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def save_index(index: DocIndex, index_dir: str):
+    """Write a new generation and point CURRENT at it; readers never see a half-written index."""
+    os.makedirs(index_dir, exist_ok=True)
+    current = _current_generation(index_dir)
+    gen = f"gen-{int(current.split('-')[1]) + 1 if current else 1}"
+    gen_dir = os.path.join(index_dir, gen)
+    shutil.rmtree(gen_dir, ignore_errors=True)
+    os.makedirs(gen_dir)
+    with open(os.path.join(gen_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(index.vocab, f)
+    with open(os.path.join(gen_dir, "chunks.json"), "w", encoding="utf-8") as f:
+        json.dump(index.chunks, f)
+    _save_csr(gen_dir, "counts", index.counts)
+    _save_csr(gen_dir, "postings", index.postings)
+    with open(os.path.join(gen_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": INDEX_FORMAT, "files": index.files, "shape": list(index.counts.shape)}, f)
+    tmp = os.path.join(index_dir, "CURRENT.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(gen)
+    os.replace(tmp, os.path.join(index_dir, "CURRENT"))
+    if current:
+        shutil.rmtree(os.path.join(index_dir, current), ignore_errors=True)
+
+
+def _current_generation(index_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(index_dir, "CURRENT"), "r", encoding="utf-8") as f:
+            gen = f.read().strip()
+    except OSError:
+        return None
+    return gen if os.path.isdir(os.path.join(index_dir, gen)) else None
+
+
+def load_index(index_dir: str) -> Optional[DocIndex]:
+    gen = _current_generation(index_dir)
+    if gen is None:
+        return None
+    gen_dir = os.path.join(index_dir, gen)
+    try:
+        with open(os.path.join(gen_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != INDEX_FORMAT:
+            return None
+        with open(os.path.join(gen_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(gen_dir, "chunks.json"), "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        shape = tuple(manifest["shape"])
+        counts = _load_csr(gen_dir, "counts", shape)
+        postings = _load_csr(gen_dir, "postings", (shape[1], shape[0]))
+    except (OSError, ValueError, KeyError):
+        # Missing or corrupt index: caller rebuilds from scratch
+        return None
+    return DocIndex(chunks, vocab, counts, manifest["files"], postings=postings)
+
+
+def open_index(docs_path: str, chunker: Chunker, index_dir: Optional[str] = None) -> DocIndex:
+    """Load the index from index_dir (if any), refresh changed files, and persist updates."""
+    previous = load_index(index_dir) if index_dir else None
+    index, changed = build_index(docs_path, chunker, previous)
+    if index_dir and changed:
+        save_index(index, index_dir)
+    return index
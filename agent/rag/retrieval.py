@@ -1,55 +1,69 @@
-"""Simple TF-IDF retriever over local docs/ directory. Produces chunk ids like filename::chunk0."""
+"""BM25 retriever over local docs/ directory. Produces paragraph chunk ids like filename::chunk3.
+
+With an index_dir the fitted index is persisted (see agent/rag/index_store.py) and only
+changed or added docs are re-indexed on the next start. numpy/scipy are only imported
+once an index is actually built, so importing this module stays cheap.
+"""
 import os
-from typing import List, Tuple, Dict
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+import re
+from typing import List, Tuple, Dict, Optional
+
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
 
 
 class Retriever:
-    def __init__(self, docs_path: str = None):
+    def __init__(self, docs_path: str = None, index_dir: Optional[str] = None):
         self.docs_path = docs_path or os.path.join(os.getcwd(), "docs")
+        self.index_dir = index_dir
         self.chunks: List[Dict] = []  # each: {id, content, source}
-        self._vectorizer = None
-        self._matrix = None
+        self._index = None
         self._build_index()
 
-    def _load_docs(self) -> List[Tuple[str, str]]:
-        pairs = []
-        if not os.path.exists(self.docs_path):
-            return pairs
-        for fn in sorted(os.listdir(self.docs_path)):
-            path = os.path.join(self.docs_path, fn)
-            if not os.path.isfile(path):
+    @staticmethod
+    def _chunk_file(fn: str, content: str) -> List[Tuple[str, str]]:
+        # One chunk per blank-line separated paragraph; single-line paragraphs are headings
+        # and are kept with the paragraph that follows them. Ids are stable as long as
+        # the paragraphs before a chunk are not added or removed.
+        stem = os.path.splitext(fn)[0]
+        paragraphs = []
+        heading = []
+        for p in PARAGRAPH_SPLIT.split(content):
+            p = p.strip()
+            if not p:
+                continue
+            if "\n" not in p:
+                heading.append(p)
                 continue
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-            # For now, single chunk per file
-            chunk_id = f"{os.path.splitext(fn)[0]}::chunk0"
-            pairs.append((chunk_id, content))
-        return pairs
+            paragraphs.append("\n\n".join(heading + [p]))
+            heading = []
+        if heading:
+            paragraphs.append("\n\n".join(heading))
+        return [(f"{stem}::chunk{i}", p) for i, p in enumerate(paragraphs)]
 
     def _build_index(self):
-        pairs = self._load_docs()
-        self.chunks = [
-            {"id": cid, "content": text, "source": cid.split("::")[0]} for cid, text in pairs
-        ]
-        docs = [c["content"] for c in self.chunks]
-        if docs:
-            self._vectorizer = TfidfVectorizer(stop_words='english')
-            self._matrix = self._vectorizer.fit_transform(docs)
-        else:
-            self._vectorizer = None
-            self._matrix = None
+        from agent.rag.index_store import open_index
+        self._index = open_index(self.docs_path, self._chunk_file, self.index_dir)
+        self.chunks = self._index.chunks
 
     def retrieve(self, query: str, k: int = 3) -> List[Tuple[Dict, float]]:
-        if self._matrix is None:
-            return []
-        qv = self._vectorizer.transform([query])
-        scores = (self._matrix @ qv.T).toarray().ravel()
-        idx = np.argsort(scores)[::-1][:k]
+        return self.retrieve_many([query], k=k)[0]
+
+    def retrieve_many(self, queries: List[str], k: int = 3) -> List[List[Tuple[Dict, float]]]:
+        """Score a batch of queries with one sparse product against the posting lists."""
+        if not self.chunks or not queries:
+            return [[] for _ in queries]
+        import numpy as np
+        scores = (self._index.query_matrix(queries) @ self._index.postings).tocsr()
         results = []
-        for i in idx:
-            if scores[i] <= 0:
-                continue
-            results.append((self.chunks[i], float(scores[i])))
+        for i in range(len(queries)):
+            lo, hi = scores.indptr[i], scores.indptr[i + 1]
+            docs = scores.indices[lo:hi]
+            vals = scores.data[lo:hi]
+            # Only chunks sharing a term with the query have an entry; partial-select
+            # the top k of those, then order them (ties broken by chunk order)
+            if len(vals) > k:
+                part = np.argpartition(-vals, k - 1)[:k]
+                docs, vals = docs[part], vals[part]
+            order = np.lexsort((docs, -vals))
+            results.append([(self.chunks[docs[j]], float(vals[j])) for j in order if vals[j] > 0])
         return results
@@ -0,0 +1,54 @@
+"""Agent construction and answer records, shared by the batch CLI and the service.
+
+make_agent() wires a HybridAgent from the command-line options both entry points
+accept (run_agent_hybrid.py and agent/service.py). answer_record() runs one question
+and shapes the output record they write: id, final_answer, sql with its bound params,
+confidence, explanation and citations.
+"""
+import os
+from typing import Dict, List, Optional
+
+from agent.answer_cache import AnswerCache
+from agent.graph_hybrid import HybridAgent, Prefetched
+from agent.rag.retrieval import Retriever
+from agent.tools.rollups import RollupStore
+from agent.tools.shards import ShardedExecutor
+from agent.tools.sql_cache import open_cache
+from agent.tracing import JsonlSink, Tracer
+
+
+def make_agent(db_path: Optional[str], retriever: Optional[Retriever] = None,
+               cache_path: Optional[str] = None, cache_size: int = 1024,
+               rollups_path: Optional[str] = None, kpi_engine: str = "off",
+               tracer: Optional[Tracer] = None, time_budget: Optional[float] = None,
+               answer_cache_size: int = 0, answer_ttl: Optional[float] = None,
+               shards_path: Optional[str] = None) -> HybridAgent:
+    cache = open_cache(cache_path, cache_size) if cache_path else None
+    rollups = RollupStore(rollups_path, db_path) if rollups_path else None
+    answers = None
+    if answer_cache_size > 0:
+        docs_path = retriever.docs_path if retriever is not None else os.path.join(os.getcwd(), "docs")
+        answers = AnswerCache(docs_path, answer_cache_size, answer_ttl)
+    shards = ShardedExecutor(shards_path) if shards_path else None
+    return HybridAgent(db_path, retriever=retriever, sql_cache=cache, rollups=rollups, kpi_engine=kpi_engine,
+                       tracer=tracer, time_budget=time_budget, answer_cache=answers, shards=shards)
+
+
+def make_tracer(trace_path: Optional[str], sample_rate: float) -> Tracer:
+    return Tracer(sample_rate=sample_rate, sink=JsonlSink(trace_path) if trace_path else None)
+
+
+def answer_record(agent: HybridAgent, job: Dict, docs: Optional[List[Dict]] = None,
+                  prefetched: Optional[Prefetched] = None) -> Dict:
+    """Output record for one {id, question, format_hint} job."""
+    qid = job.get('id')
+    res = agent.repair_and_run(qid, job.get('question'), job.get('format_hint'), docs=docs, prefetched=prefetched)
+    return {
+        'id': qid,
+        'final_answer': res.get('final_answer'),
+        'sql': res.get('sql', ''),
+        'params': res.get('params', []),
+        'confidence': res.get('confidence', 0.0),
+        'explanation': res.get('explanation', '')[:200],
+        'citations': res.get('citations', []),
+    }
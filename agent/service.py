@@ -0,0 +1,279 @@
+"""Long-lived local service around a warm HybridAgent (asyncio, HTTP or JSON lines).
+
+The agent, docs index, router and DB connections are built once at start-up and
+shared by all requests. Answers are computed on a bounded thread pool (SQLite and the
+numpy retriever release the GIL for most of their work), so the event loop only
+parses requests and writes responses.
+
+Concurrent requests for the same (question, format_hint) are coalesced: the first
+one starts the computation, later ones await the same future and get the answer
+under their own id. Distinct computations in flight or queued are capped at
+--max-pending. Past the cap new work is rejected at once (HTTP 503 / an "overloaded"
+error line) instead of queueing without bound, so latency stays flat under overload
+and callers can back off.
+
+Both protocols validate a request with parse_job: "question" must be a non-empty
+string and "format_hint", if given, a string (default ""). An invalid request gets
+HTTP 400 / an error line with the reason, and is never computed.
+
+Protocols:
+  http   POST /answer {"id", "question", "format_hint"} -> answer record
+         GET /health, GET /metrics (service counters and per-stage latency percentiles)
+  jsonl  one request object per line; one response line per request, in completion
+         order (match them by id)
+
+Usage (from the repo root):
+  python -m agent.service --port 8765
+  python -m agent.service --protocol jsonl --port 8766 --workers 16 --kpi-engine on
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from agent.graph_hybrid import HybridAgent
+from agent.runner import answer_record, make_agent, make_tracer
+
+MAX_BODY = 1 << 20
+
+
+class Overloaded(Exception):
+    pass
+
+
+class BadRequest(ValueError):
+    def __init__(self, message: str, job_id=None):
+        super().__init__(message)
+        self.job_id = job_id
+
+
+def parse_job(body: bytes) -> Dict:
+    """Decode one {id, question, format_hint} request; BadRequest with the reason if invalid."""
+    try:
+        job = json.loads(body)
+    except ValueError as e:  # also bad UTF-8
+        raise BadRequest(f"invalid JSON: {e}") from None
+    if not isinstance(job, dict):
+        raise BadRequest("expected a JSON object {id, question, format_hint}")
+    question = job.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise BadRequest("question must be a non-empty string", job.get("id"))
+    format_hint = job.get("format_hint")
+    if format_hint is None:
+        format_hint = ""
+    elif not isinstance(format_hint, str):
+        raise BadRequest("format_hint must be a string", job.get("id"))
+    return dict(job, question=question, format_hint=format_hint)
+
+
+class AgentService:
+    def __init__(self, agent: HybridAgent, workers: int = 8, max_pending: int = 256):
+        self.agent = agent
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent")
+        self.max_pending = max_pending
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.stats = {"requests": 0, "computed": 0, "coalesced": 0, "rejected": 0, "invalid": 0, "errors": 0}
+
+    def warm(self):
+        """Build every lazily created component now, before threads can race to build them."""
+        _ = self.agent.retriever, self.agent.sqlite, self.agent.negative_memo
+        if self.agent.kpi_engine_mode != "off":
+            self.agent.kpi_engine.run("top3_products_revenue")  # loads the column arrays
+
+    async def answer(self, job: Dict) -> Dict:
+        """Answer record for a job validated by parse_job."""
+        self.stats["requests"] += 1
+        key = (job["question"], job["format_hint"])
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.stats["coalesced"] += 1
+        else:
+            if len(self._inflight) >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise Overloaded()
+            self.stats["computed"] += 1
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(self.executor, answer_record, self.agent, job)
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: a caller that disconnects must not cancel a computation others await
+        record = await asyncio.shield(fut)
+        return dict(record, id=job.get("id"))
+
+    def metrics(self) -> Dict:
+        out = {"service": dict(self.stats, inflight=len(self._inflight)), "stages": self.agent.tracer.metrics()}
+        if self.agent.sql_cache is not None:
+            out["sql_cache"] = self.agent.sql_cache.stats()
+        if self.agent.answer_cache is not None:
+            out["answer_cache"] = self.agent.answer_cache.stats()
+        return out
+
+    # --- JSON lines ----------------------------------------------------------------------
+
+    async def handle_jsonl(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(line: bytes):
+            try:
+                job = parse_job(line)
+            except BadRequest as e:
+                self.stats["invalid"] += 1
+                out = {"id": e.job_id, "error": str(e)}
+            else:
+                try:
+                    out = await self.answer(job)
+                except Overloaded:
+                    out = {"id": job.get("id"), "error": "overloaded"}
+                except Exception as e:  # agent failure
+                    self.stats["errors"] += 1
+                    out = {"id": job.get("id"), "error": str(e)}
+            async with lock:
+                writer.write((json.dumps(out) + "\n").encode("utf-8"))
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    # --- HTTP ------------------------------------------------------------------------------
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._send(writer, 400, {"error": "bad request line"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._send(writer, 400, {"error": "bad content-length"}, keep_alive=False)
+                    break
+                if length > MAX_BODY:
+                    await self._send(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                status, payload, extra = await self._route(method, path, body)
+                await self._send(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict, Optional[Dict]]:
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}, None
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics(), None
+        if method == "POST" and path == "/answer":
+            try:
+                job = parse_job(body)
+            except BadRequest as e:
+                self.stats["invalid"] += 1
+                return 400, {"id": e.job_id, "error": str(e)}, None
+            try:
+                return 200, await self.answer(job), None
+            except Overloaded:
+                return 503, {"id": job.get("id"), "error": "overloaded"}, {"Retry-After": "1"}
+            except Exception as e:
+                self.stats["errors"] += 1
+                return 500, {"id": job.get("id"), "error": str(e)}, None
+        return 404, {"error": f"no route for {method} {path}"}, None
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool = True,
+                    extra: Optional[Dict] = None):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        body = json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {reasons.get(status, '')}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{k}: {v}" for k, v in (extra or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(service: AgentService, host: str, port: int, protocol: str):
+    handler = service.handle_http if protocol == "http" else service.handle_jsonl
+    server = await asyncio.start_server(handler, host, port, limit=MAX_BODY)
+    print(f"[service] {protocol} listening on {host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(host: str, port: int, protocol: str, workers: int, max_pending: int, db_path: Optional[str],
+         cache_path: Optional[str], rollups_path: Optional[str], kpi_engine: str, trace_path: Optional[str],
+         trace_sample: float, time_budget: Optional[float], index_dir: Optional[str], answer_cache_size: int,
+         answer_ttl: Optional[float], shards_path: Optional[str]):
+    from agent.rag.retrieval import Retriever
+    if rollups_path:
+        # As the batch CLI does: build or catch up the rollups before serving, so
+        # date-window KPIs can use them from the first request
+        from agent.tools.rollups import RollupStore
+        print(f"[rollups] {RollupStore(rollups_path, db_path).refresh()}", flush=True)
+    agent = make_agent(db_path, Retriever(index_dir=index_dir), cache_path, 1024, rollups_path, kpi_engine,
+                       make_tracer(trace_path, trace_sample), time_budget, answer_cache_size, answer_ttl,
+                       shards_path)
+    service = AgentService(agent, workers=workers, max_pending=max_pending)
+    service.warm()
+    try:
+        asyncio.run(serve(service, host, port, protocol))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.executor.shutdown(wait=False, cancel_futures=True)
+        agent.tracer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--protocol', choices=['http', 'jsonl'], default='http')
+    parser.add_argument('--workers', type=int, default=8, help='threads computing answers')
+    parser.add_argument('--max-pending', type=int, default=256,
+                        help='distinct questions in flight before new ones are rejected as overloaded')
+    parser.add_argument('--db', default=None, help='path to the Northwind SQLite DB (default: auto-detect in data/)')
+    parser.add_argument('--sql-cache', default=None, help='path of an on-disk SQL result cache')
+    parser.add_argument('--rollups', default=None, help='daily rollup file; refreshed at start and used for date-window KPIs')
+    parser.add_argument('--kpi-engine', choices=['off', 'on', 'check'], default='off')
+    parser.add_argument('--shards', default=None, help='manifest of time-partitioned shard DBs (agent.tools.shards)')
+    parser.add_argument('--index-dir', default=None, help='directory to persist the docs index in')
+    parser.add_argument('--trace-out', default=None)
+    parser.add_argument('--trace-sample', type=float, default=0.01)
+    parser.add_argument('--time-budget', type=float, default=5.0, help='seconds per question (0: unbounded)')
+    parser.add_argument('--answer-cache-size', type=int, default=4096,
+                        help='cached answers by resolved intent, reused by paraphrases (0: off)')
+    parser.add_argument('--answer-cache-ttl', type=float, default=3600.0, help='seconds (0: until the DB or docs change)')
+    args = parser.parse_args()
+    main(args.host, args.port, args.protocol, args.workers, args.max_pending, args.db, args.sql_cache, args.rollups,
+         args.kpi_engine, args.trace_out, args.trace_sample, args.time_budget or None, args.index_dir,
+         args.answer_cache_size, args.answer_cache_ttl or None, args.shards)
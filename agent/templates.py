@@ -0,0 +1,332 @@
+"""Declarative NL->SQL template registry shared by HybridAgent.plan and HybridAgent.nl2sql.
+
+A question is normalized and scanned once by a single compiled matcher covering every
+trigger phrase (template triggers, marketing-calendar windows and category names). The
+matcher is one regex built from a character trie of the phrases, so a scan costs about
+the same with 5 or 500 templates. Templates are then matched through an inverted index
+from phrase to the clauses it satisfies, which only touches templates whose phrases
+actually occur in the question.
+
+Template conditions keep the substring semantics of the original if-chain: `when` is a
+list of clauses (any may match), a clause is a list of groups (all must match) and a
+group is a tuple of phrases (any may occur).
+"""
+import re
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+Clause = Tuple[Tuple[str, ...], ...]
+Rendered = Tuple[str, Tuple[Any, ...]]  # (sql with ? placeholders, bound params)
+
+
+class Template(NamedTuple):
+    id: str
+    when: Tuple[Clause, ...]
+    render: Callable[[Dict], Rendered]
+    # Same answer from the daily rollup tables (agent/tools/rollups.py), if the
+    # template's grain allows it; used by nl2sql only while the rollups are fresh
+    rollup: Optional[Callable[[Dict], Rendered]] = None
+
+
+class QuestionFeatures(NamedTuple):
+    text: str  # lowercased, punctuation replaced by spaces
+    phrases: FrozenSet[str]  # every registered phrase occurring in text
+
+
+def normalize(question: str) -> str:
+    return re.sub(r'[^a-z0-9 ]', ' ', question.lower())
+
+
+def _trie_pattern(phrases: Iterable[str]) -> str:
+    """Regex matching the longest of `phrases` at a position, with shared prefixes merged."""
+    trie: Dict = {}
+    for p in phrases:
+        node = trie
+        for ch in p:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional group: prefer the longer phrase, fall back to the shorter one
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class PhraseMatcher:
+    """Finds all occurrences of a fixed phrase set in one regex pass."""
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases = sorted(set(phrases))
+        # A lookahead match is zero-width, so every start position is tried. It reports
+        # the longest phrase starting there; shorter phrases that are prefixes of it
+        # start at the same place and are added from this table.
+        self._prefixes = {p: frozenset(q for q in self.phrases if p.startswith(q)) for p in self.phrases}
+        self._regex = re.compile(f'(?=({_trie_pattern(self.phrases)}))') if self.phrases else None
+
+    def find(self, text: str) -> FrozenSet[str]:
+        if self._regex is None:
+            return frozenset()
+        found = set()
+        for m in self._regex.finditer(text):
+            hit = m.group(1)
+            if hit:
+                found |= self._prefixes[hit]
+        return frozenset(found)
+
+
+class TemplateRegistry:
+    def __init__(self, templates: Iterable[Template], windows: Iterable[Tuple[str, Tuple[str, str]]] = (),
+                 categories: Iterable[Tuple[str, str]] = ()):
+        self.templates: List[Template] = list(templates)
+        self.by_id = {t.id: t for t in self.templates}
+        self.windows = list(windows)  # (phrase, (start, end)); later matches win
+        self.categories = list(categories)  # (phrase, category name)
+        # phrase -> [(template index, clause index, group index)]
+        self._postings: Dict[str, List[Tuple[int, int, int]]] = {}
+        self._clause_sizes: Dict[Tuple[int, int], int] = {}
+        for ti, t in enumerate(self.templates):
+            for ci, clause in enumerate(t.when):
+                self._clause_sizes[(ti, ci)] = len(clause)
+                for gi, group in enumerate(clause):
+                    for phrase in group:
+                        self._postings.setdefault(phrase, []).append((ti, ci, gi))
+        slot_phrases = [p for p, _ in self.windows] + [p for p, _ in self.categories]
+        self.matcher = PhraseMatcher(list(self._postings) + slot_phrases)
+
+    def features(self, question: str) -> QuestionFeatures:
+        text = normalize(question)
+        return QuestionFeatures(text, self.matcher.find(text))
+
+    def match(self, features: QuestionFeatures) -> Optional[Template]:
+        """First registered template (in declaration order) with a satisfied clause."""
+        satisfied: Dict[Tuple[int, int], set] = {}
+        best = None
+        for phrase in features.phrases:
+            for ti, ci, gi in self._postings.get(phrase, ()):
+                groups = satisfied.setdefault((ti, ci), set())
+                groups.add(gi)
+                if len(groups) == self._clause_sizes[(ti, ci)] and (best is None or ti < best):
+                    best = ti
+        return self.templates[best] if best is not None else None
+
+    def date_range(self, features: QuestionFeatures) -> Optional[Tuple[str, str]]:
+        dr = None
+        for phrase, window in self.windows:
+            if phrase in features.phrases:
+                dr = window
+        return dr
+
+    def category_names(self, features: QuestionFeatures) -> List[str]:
+        return [name for phrase, name in self.categories if phrase in features.phrases]
+
+
+# --- KPI templates -------------------------------------------------------------------
+# Each renderer returns (sql, params). Values are bound with ? placeholders, so a
+# template has one SQL text per shape (e.g. with/without a date filter) however many
+# date windows or categories it is asked about, and SQLite's statement cache can reuse
+# the prepared statement.
+
+REVENUE = "SUM(od.UnitPrice * od.Quantity * (1 - od.Discount))"
+
+TOP3_PRODUCTS_SQL = (
+    "SELECT p.ProductName AS product, "
+    f"{REVENUE} AS revenue "
+    "FROM \"Order Details\" od "
+    "JOIN \"Products\" p ON p.ProductID = od.ProductID "
+    "GROUP BY p.ProductID, p.ProductName "
+    "ORDER BY revenue DESC "
+    "LIMIT 3;"
+)
+
+AOV_SQL = (
+    f"SELECT ({REVENUE} / COUNT(DISTINCT \"Orders\".OrderID)) AS aov "
+    "FROM \"Orders\" JOIN \"Order Details\" od ON \"Orders\".OrderID = od.OrderID"
+)
+AOV_WINDOW_SQL = AOV_SQL + " WHERE \"Orders\".OrderDate >= ? AND \"Orders\".OrderDate <= ?;"
+
+CATEGORY_REVENUE_SQL = (
+    f"SELECT {REVENUE} AS revenue "
+    "FROM \"Order Details\" od "
+    "JOIN \"Products\" p ON p.ProductID = od.ProductID "
+    "JOIN \"Orders\" ON \"Orders\".OrderID = od.OrderID "
+    "JOIN \"Categories\" c ON p.CategoryID = c.CategoryID "
+    "WHERE c.CategoryName = ?"
+)
+CATEGORY_REVENUE_WINDOW_SQL = CATEGORY_REVENUE_SQL + " AND \"Orders\".OrderDate >= ? AND \"Orders\".OrderDate <= ?;"
+
+TOP_CATEGORY_QTY_SQL = (
+    "SELECT c.CategoryName AS category, SUM(od.Quantity) AS quantity "
+    "FROM \"Order Details\" od "
+    "JOIN \"Orders\" ON \"Orders\".OrderID = od.OrderID "
+    "JOIN \"Products\" p ON p.ProductID = od.ProductID "
+    "JOIN \"Categories\" c ON p.CategoryID = c.CategoryID "
+    "WHERE \"Orders\".OrderDate >= ? AND \"Orders\".OrderDate <= ? "
+    "GROUP BY c.CategoryID, c.CategoryName ORDER BY quantity DESC LIMIT 1;"
+)
+
+TOP_CUSTOMER_MARGIN_SQL = (
+    "SELECT cu.CompanyName AS customer, "
+    "SUM((od.UnitPrice - (0.7 * od.UnitPrice)) * od.Quantity * (1 - od.Discount)) AS margin "
+    "FROM \"Order Details\" od "
+    "JOIN \"Orders\" o ON o.OrderID = od.OrderID "
+    "JOIN \"Customers\" cu ON cu.CustomerID = o.CustomerID "
+    "WHERE o.OrderDate >= ? AND o.OrderDate <= ? "
+    "GROUP BY cu.CustomerID, cu.CompanyName ORDER BY margin DESC LIMIT 1;"
+)
+
+# Rollup variants: same columns and window semantics (OrderDate compared as stored),
+# reading one row per day (x product/customer) from the attached `rollup` schema
+ROLLUP_AOV_SQL = "SELECT (SUM(r.revenue) / SUM(r.orders)) AS aov FROM rollup.sales_by_day r"
+ROLLUP_AOV_WINDOW_SQL = ROLLUP_AOV_SQL + " WHERE r.OrderDate >= ? AND r.OrderDate <= ?;"
+
+ROLLUP_CATEGORY_REVENUE_SQL = (
+    "SELECT SUM(r.revenue) AS revenue "
+    "FROM rollup.sales_by_day_product r "
+    "JOIN \"Categories\" c ON c.CategoryID = r.CategoryID "
+    "WHERE c.CategoryName = ?"
+)
+ROLLUP_CATEGORY_REVENUE_WINDOW_SQL = ROLLUP_CATEGORY_REVENUE_SQL + " AND r.OrderDate >= ? AND r.OrderDate <= ?;"
+
+ROLLUP_TOP_CATEGORY_QTY_SQL = (
+    "SELECT c.CategoryName AS category, SUM(r.quantity) AS quantity "
+    "FROM rollup.sales_by_day_product r "
+    "JOIN \"Categories\" c ON c.CategoryID = r.CategoryID "
+    "WHERE r.OrderDate >= ? AND r.OrderDate <= ? "
+    "GROUP BY c.CategoryID, c.CategoryName ORDER BY quantity DESC LIMIT 1;"
+)
+
+ROLLUP_TOP_CUSTOMER_MARGIN_SQL = (
+    "SELECT cu.CompanyName AS customer, SUM(r.margin) AS margin "
+    "FROM rollup.sales_by_day_customer r "
+    "JOIN \"Customers\" cu ON cu.CustomerID = r.CustomerID "
+    "WHERE r.OrderDate >= ? AND r.OrderDate <= ? "
+    "GROUP BY cu.CustomerID, cu.CompanyName ORDER BY margin DESC LIMIT 1;"
+)
+
+
+def _render_aov(plan: Dict) -> Rendered:
+    dr = plan.get('date_range')
+    if dr:
+        return AOV_WINDOW_SQL, (dr[0], dr[1])
+    return AOV_SQL + ";", ()
+
+
+def _render_aov_rollup(plan: Dict) -> Rendered:
+    dr = plan.get('date_range')
+    if dr:
+        return ROLLUP_AOV_WINDOW_SQL, (dr[0], dr[1])
+    return ROLLUP_AOV_SQL + ";", ()
+
+
+def _render_category_revenue(plan: Dict) -> Rendered:
+    dr = plan.get('date_range')
+    if dr:
+        return CATEGORY_REVENUE_WINDOW_SQL, ('Beverages', dr[0], dr[1])
+    return CATEGORY_REVENUE_SQL + ";", ('Beverages',)
+
+
+def _render_category_revenue_rollup(plan: Dict) -> Rendered:
+    dr = plan.get('date_range')
+    if dr:
+        return ROLLUP_CATEGORY_REVENUE_WINDOW_SQL, ('Beverages', dr[0], dr[1])
+    return ROLLUP_CATEGORY_REVENUE_SQL + ";", ('Beverages',)
+
+
+# --- Fused batch queries -------------------------------------------------------------
+# Questions in a batch whose rendered SQL is the same single-row aggregate, differing
+# only in the bound window (and category), can share one statement. The distinct param
+# tuples become a VALUES list `w`. Fact rows inside any of the windows are scanned once
+# and summed per day (and category); since an order falls on one day, per-day distinct
+# order counts add up. Each window's answer is then summed from those day rows. Result
+# rows are (k, *columns) for the k-th param tuple. A window without matching rows has no
+# row, where the single-question query would return one row of NULLs.
+
+def _fuse_values(params: List[Tuple[Any, ...]], columns: str) -> Tuple[str, str, Tuple[Any, ...]]:
+    """`w` CTE with a row (k, *params[k]) per tuple, the OR of their date windows, and the bound values."""
+    row = "(" + ", ".join(["?"] * (len(params[0]) + 1)) + ")"
+    cte = f"w(k, {columns}) AS (VALUES {', '.join([row] * len(params))})"
+    # An OR of ranges rather than EXISTS over w, so SQLite can use an OrderDate index
+    in_window = " OR ".join(["(\"Orders\".OrderDate >= ? AND \"Orders\".OrderDate <= ?)"] * len(params))
+    bound = tuple(v for k, p in enumerate(params) for v in (k, *p)) + tuple(v for p in params for v in p[-2:])
+    return cte, in_window, bound
+
+
+def _fuse_aov_window(params: List[Tuple[Any, ...]]) -> Rendered:
+    cte, in_window, bound = _fuse_values(params, "lo, hi")
+    return (
+        f"WITH {cte}, "
+        f"d AS (SELECT \"Orders\".OrderDate AS day, {REVENUE} AS revenue, COUNT(DISTINCT \"Orders\".OrderID) AS orders "
+        "FROM \"Orders\" JOIN \"Order Details\" od ON \"Orders\".OrderID = od.OrderID "
+        f"WHERE {in_window} GROUP BY \"Orders\".OrderDate) "
+        "SELECT w.k, (SUM(d.revenue) / SUM(d.orders)) AS aov "
+        "FROM w JOIN d ON d.day >= w.lo AND d.day <= w.hi GROUP BY w.k;"
+    ), bound
+
+
+def _fuse_category_revenue_window(params: List[Tuple[Any, ...]]) -> Rendered:
+    cte, in_window, bound = _fuse_values(params, "category, lo, hi")
+    return (
+        f"WITH {cte}, "
+        f"d AS (SELECT \"Orders\".OrderDate AS day, c.CategoryName AS category, {REVENUE} AS revenue "
+        "FROM \"Order Details\" od "
+        "JOIN \"Products\" p ON p.ProductID = od.ProductID "
+        "JOIN \"Orders\" ON \"Orders\".OrderID = od.OrderID "
+        "JOIN \"Categories\" c ON p.CategoryID = c.CategoryID "
+        f"WHERE c.CategoryName IN (SELECT category FROM w) AND ({in_window}) "
+        "GROUP BY \"Orders\".OrderDate, c.CategoryName) "
+        "SELECT w.k, SUM(d.revenue) AS revenue "
+        "FROM w JOIN d ON d.category = w.category AND d.day >= w.lo AND d.day <= w.hi GROUP BY w.k;"
+    ), bound
+
+
+# Single-question SQL -> renderer of the fused query for a list of its param tuples
+FUSED: Dict[str, Callable[[List[Tuple[Any, ...]]], Rendered]] = {
+    AOV_WINDOW_SQL: _fuse_aov_window,
+    CATEGORY_REVENUE_WINDOW_SQL: _fuse_category_revenue_window,
+}
+
+
+KPI_TEMPLATES = [
+    # Top 3 products by revenue
+    Template('top3_products_revenue',
+             ((('top 3',), ('product',), ('revenue',)),
+              (('top three',), ('revenue',))),
+             lambda plan: (TOP3_PRODUCTS_SQL, ())),
+    # Average Order Value (AOV) during a date range
+    Template('aov_window',
+             ((('average order value', 'aov'), ('winter', 'date', 'classics')),),
+             _render_aov, _render_aov_rollup),
+    # Total revenue from Beverages during a date range
+    Template('category_revenue_window',
+             ((('total revenue',), ('beverages',), ('summer', 'date')),),
+             _render_category_revenue, _render_category_revenue_rollup),
+    # Highest total quantity sold by category during summer
+    Template('top_category_quantity_summer',
+             ((('highest total quantity', 'top category', 'most sold'), ('summer', 'june')),),
+             lambda plan: (TOP_CATEGORY_QTY_SQL, ("1997-06-01", "1997-06-30")),
+             lambda plan: (ROLLUP_TOP_CATEGORY_QTY_SQL, ("1997-06-01", "1997-06-30"))),
+    # Best customer by gross margin in 1997
+    Template('top_customer_margin_1997',
+             ((('best customer', 'top customer'), ('margin', 'gross'), ('1997',)),),
+             lambda plan: (TOP_CUSTOMER_MARGIN_SQL, ("1997-01-01", "1997-12-31")),
+             lambda plan: (ROLLUP_TOP_CUSTOMER_MARGIN_SQL, ("1997-01-01", "1997-12-31"))),
+]
+
+# Marketing calendar windows (docs/marketing_calendar.md)
+CALENDAR_WINDOWS = [
+    ('summer', ("1997-06-01", "1997-06-30")),
+    ('winter', ("1997-12-01", "1997-12-31")),
+]
+
+# Known categories, matched on their first word as the planner always has
+CATEGORIES = ['Beverages', 'Condiments', 'Confections', 'Dairy Products', 'Produce', 'Seafood']
+
+REGISTRY = TemplateRegistry(
+    KPI_TEMPLATES,
+    windows=CALENDAR_WINDOWS,
+    categories=[(c.split()[0].lower(), c) for c in CATEGORIES],
+)
@@ -0,0 +1,231 @@
+"""Index advisor: EXPLAIN QUERY PLAN for every registered NL->SQL template, flag full
+table scans, propose covering indexes, and optionally build those indexes.
+
+Proposed index keys are ordered equality filters, then range filters (e.g.
+Orders.OrderDate), then join keys, then every other column the template reads from that
+table, so the date-windowed KPI queries become index range scans that never touch the
+base table. Column names are checked against SQLiteTool.get_tables/get_columns.
+
+When the main DB must stay pristine, indexes are written to a side-car copy made with the
+SQLite backup API; point the agent at the side-car (`run_agent_hybrid.py --db`).
+
+Usage (from the repo root):
+  python -m agent.tools.index_advisor                       # report only
+  python -m agent.tools.index_advisor --sidecar data/northwind_indexed.sqlite
+  python -m agent.tools.index_advisor --apply-in-place      # write to the main DB
+"""
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from agent.templates import CALENDAR_WINDOWS, REGISTRY, TemplateRegistry
+from agent.tools.sqlite_tool import SQLiteTool, file_uri
+
+SQL_KEYWORDS = r'(?:ON|JOIN|WHERE|GROUP|ORDER|LIMIT|LEFT|INNER|CROSS|USING|NATURAL)\b'
+
+TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(?:"([^"]+)"|(\w+))(?:\s+(?:AS\s+)?(?!' + SQL_KEYWORDS + r')(\w+))?',
+                       re.IGNORECASE)
+COLUMN_REF = re.compile(r'(?:"([^"]+)"|\b(\w+))\.(\w+)')
+PREDICATE = re.compile(r'(?:"([^"]+)"|\b(\w+))\.(\w+)\s*(=|>=|<=|<|>|BETWEEN\b)', re.IGNORECASE)
+CLAUSE_END = r'(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|;|$)'
+
+
+def sample_plan() -> Dict:
+    """Representative plan used to render every template for EXPLAIN and timing."""
+    return {"date_range": CALENDAR_WINDOWS[0][1], "categories": ["Beverages"]}
+
+
+def template_queries(registry: TemplateRegistry = REGISTRY) -> List[Tuple[str, str, Tuple[Any, ...]]]:
+    plan = sample_plan()
+    return [(t.id,) + tuple(t.render(plan)) for t in registry.templates]
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """alias (or bare table name) -> table name, for every FROM/JOIN in sql."""
+    out = {}
+    for m in TABLE_REF.finditer(sql):
+        table = m.group(1) or m.group(2)
+        alias = m.group(3)
+        out[table] = table
+        if alias:
+            out[alias] = table
+    return out
+
+
+def column_roles(sql: str) -> Dict[str, Dict[str, List[str]]]:
+    """table -> {'eq': [...], 'range': [...], 'join': [...], 'other': [...]} columns."""
+    aliases = table_aliases(sql)
+    roles: Dict[str, Dict[str, List[str]]] = {}
+
+    def add(table_or_alias: str, col: str, role: str):
+        table = aliases.get(table_or_alias)
+        if table is None:
+            return
+        cols = roles.setdefault(table, {"eq": [], "range": [], "join": [], "other": []})
+        if not any(col in v for v in cols.values()):
+            cols[role].append(col)
+
+    where = re.search(r'\bWHERE\b(.*?)' + CLAUSE_END, sql, re.IGNORECASE | re.DOTALL)
+    if where:
+        for m in PREDICATE.finditer(where.group(1)):
+            add(m.group(1) or m.group(2), m.group(3), "eq" if m.group(4) == "=" else "range")
+    for on in re.finditer(r'\bON\b(.*?)(?=\bJOIN\b|\bWHERE\b|\bGROUP\s+BY\b|\bORDER\s+BY\b|;|$)', sql,
+                          re.IGNORECASE | re.DOTALL):
+        for m in COLUMN_REF.finditer(on.group(1)):
+            add(m.group(1) or m.group(2), m.group(3), "join")
+    for m in COLUMN_REF.finditer(sql):
+        add(m.group(1) or m.group(2), m.group(3), "other")
+    return roles
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class IndexAdvisor:
+    def __init__(self, tool: SQLiteTool, registry: TemplateRegistry = REGISTRY):
+        self.tool = tool
+        self.registry = registry
+        self._tables = {t.lower(): t for t in tool.get_tables()}
+
+    def explain(self, sql: str, params: Sequence[Any] = (), tool: Optional[SQLiteTool] = None) -> List[str]:
+        cols, rows, err = (tool or self.tool).run("EXPLAIN QUERY PLAN " + sql, params)
+        if err:
+            raise sqlite3.OperationalError(err)
+        return [r[-1] for r in rows]
+
+    @staticmethod
+    def full_scans(plan: List[str], aliases: Dict[str, str]) -> List[str]:
+        """Tables read by a plain `SCAN <table>` step (no index)."""
+        out = []
+        for detail in plan:
+            m = re.match(r'SCAN (?:TABLE )?("?)([^"]+?)\1(?: AS (\w+))?(?: USING .*)?$', detail)
+            if not m or " USING " in detail:
+                continue
+            name = m.group(3) or m.group(2)
+            table = aliases.get(name, name)
+            if table not in out:
+                out.append(table)
+        return out
+
+    def propose(self, sql: str, scanned: List[str]) -> List[Dict]:
+        """Covering index per table that is fully scanned or filtered in WHERE.
+
+        Filtered tables are included even when the current plan reaches them by primary
+        key: once the scanned table gets an index the planner usually drives the join
+        from the filter instead, and that side then needs a range-scannable index too.
+        """
+        proposals = []
+        for table, roles in column_roles(sql).items():
+            filtered = bool(roles["eq"] or roles["range"])
+            if (table not in scanned and not filtered) or table.lower() not in self._tables:
+                continue
+            real = self._tables[table.lower()]
+            existing = {c.lower(): c for c in self.tool.get_columns(real)}
+            key = []
+            for role in ("eq", "range", "join", "other"):
+                for col in roles[role]:
+                    c = existing.get(col.lower())
+                    if c and c not in key:
+                        key.append(c)
+            if not key:
+                continue
+            name = "idx_advisor_" + re.sub(r'\W+', '_', real.lower()) + "_" + "_".join(c.lower() for c in key)
+            ddl = f"CREATE INDEX IF NOT EXISTS {_quote(name)} ON {_quote(real)} ({', '.join(_quote(c) for c in key)})"
+            proposals.append({"table": real, "columns": key, "name": name, "ddl": ddl})
+        return proposals
+
+    def analyze(self) -> List[Dict]:
+        """One entry per template: its plan, the tables it fully scans and proposed indexes."""
+        report = []
+        for tid, sql, params in template_queries(self.registry):
+            plan = self.explain(sql, params)
+            scans = self.full_scans(plan, table_aliases(sql))
+            report.append({"template": tid, "plan": plan, "full_scans": scans,
+                           "proposals": self.propose(sql, scans)})
+        return report
+
+    def apply(self, report: List[Dict], sidecar: Optional[str] = None) -> str:
+        """Create every proposed index, in a side-car copy if given; returns the indexed DB path."""
+        target = sidecar or self.tool.db_path
+        if sidecar:
+            src = sqlite3.connect(file_uri(self.tool.db_path, "ro"), uri=True)
+            dst = sqlite3.connect(sidecar)
+            src.backup(dst)
+            src.close()
+        else:
+            dst = sqlite3.connect(target)
+        seen = set()
+        for entry in report:
+            for p in entry["proposals"]:
+                if p["name"] not in seen:
+                    dst.execute(p["ddl"])
+                    seen.add(p["name"])
+        dst.execute("ANALYZE")  # give the planner statistics for the new indexes
+        dst.commit()
+        dst.close()
+        return target
+
+    def time_templates(self, tool: SQLiteTool, repeat: int = 5) -> Dict[str, float]:
+        """Median latency (ms) per template on `tool`, bypassing any result cache."""
+        out = {}
+        for tid, sql, params in template_queries(self.registry):
+            samples = []
+            for _ in range(repeat + 1):
+                t0 = time.perf_counter()
+                _, stream, err = tool.iter_rows(sql, params)
+                for _ in stream:
+                    pass
+                samples.append((time.perf_counter() - t0) * 1000.0)
+            out[tid] = statistics.median(samples[1:])  # first run warms the page cache
+        return out
+
+
+def main(db_path: Optional[str], sidecar: Optional[str], in_place: bool, repeat: int, as_json: bool):
+    tool = SQLiteTool(db_path)
+    advisor = IndexAdvisor(tool)
+    report = advisor.analyze()
+    result: Dict[str, Any] = {"db": tool.db_path, "templates": report}
+    if sidecar or in_place:
+        before = advisor.time_templates(tool, repeat)
+        tool.close()
+        target = advisor.apply(report, sidecar=sidecar)
+        after_tool = SQLiteTool(target)
+        after = advisor.time_templates(after_tool, repeat)
+        for entry in report:
+            tid = entry["template"]
+            sql, params = REGISTRY.by_id[tid].render(sample_plan())
+            entry["plan_after"] = advisor.explain(sql, params, tool=after_tool)
+            entry["ms_before"] = round(before[tid], 3)
+            entry["ms_after"] = round(after[tid], 3)
+        result["indexed_db"] = target
+        after_tool.close()
+    if as_json:
+        print(json.dumps(result, indent=2))
+        return
+    for entry in report:
+        print(f"== {entry['template']}")
+        print("   full scans: " + (", ".join(entry["full_scans"]) or "none"))
+        for p in entry["proposals"]:
+            print(f"   propose:    {p['ddl']}")
+        if "ms_before" in entry:
+            print(f"   latency:    {entry['ms_before']:.2f} ms -> {entry['ms_after']:.2f} ms")
+            for detail in entry["plan_after"]:
+                print(f"   plan after: {detail}")
+    if "indexed_db" in result:
+        print(f"indexes written to {result['indexed_db']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=None, help='path to the Northwind SQLite DB (default: auto-detect in data/)')
+    parser.add_argument('--sidecar', default=None, help='copy the DB here and create the indexes in the copy')
+    parser.add_argument('--apply-in-place', action='store_true', help='create the indexes in the main DB')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per template')
+    parser.add_argument('--json', action='store_true', help='print the full report as JSON')
+    args = parser.parse_args()
+    main(args.db, args.sidecar, args.apply_in_place, args.repeat, args.json)
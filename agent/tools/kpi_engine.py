@@ -0,0 +1,255 @@
+"""In-memory vectorized executor for the KPI templates.
+
+The five Northwind tables the templates read are loaded once into NumPy column arrays
+(SQLiteTool.run_columns). Text keys are integer-coded, and OrderDate is coded as the
+rank of its distinct values, so a date window is a pair of np.searchsorted bounds with
+exactly the string comparison semantics of `OrderDate >= ? AND OrderDate <= ?`.
+Order lines are stored sorted by that date code: a window is a contiguous slice, and
+each KPI is a bincount/argpartition over the slice instead of a SQL join.
+
+HybridAgent.execute_sql dispatches here by template id (see KpiEngine.supports). Each
+handler takes the params the template rendered for SQLite and returns (cols, rows)
+shaped like the SQL result, so answers are interchangeable. The arrays are reloaded
+when the DB file changes: a reload builds a complete new Columns snapshot and swaps it
+in as one attribute, so a query running on another thread sees either the old arrays
+or the new ones, never a mix.
+"""
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.tools.sql_cache import db_fingerprint
+from agent.tools.sqlite_tool import SQLiteTool
+
+Result = Tuple[List[str], List[Tuple[Any, ...]]]
+
+
+def _floats(a: np.ndarray) -> np.ndarray:
+    # NULLs come back as None in object arrays; SQL SUM skips them, so they count as 0
+    if a.dtype == object:
+        a = np.array([np.nan if v is None else v for v in a], dtype=np.float64)
+    return np.nan_to_num(a.astype(np.float64, copy=False), nan=0.0)
+
+
+def _codes(keys: np.ndarray, table: np.ndarray) -> np.ndarray:
+    """Row index of each key in the sorted key array `table`, -1 where absent (inner join)."""
+    if len(table) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    pos = np.searchsorted(table, keys)
+    pos = np.minimum(pos, len(table) - 1)
+    return np.where(table[pos] == keys, pos, -1)
+
+
+class Columns(NamedTuple):
+    """The arrays the handlers read, for one version of the DB."""
+    fingerprint: str
+    dates: np.ndarray  # distinct OrderDate strings, sorted; a line's day is an index into it
+    product_names: np.ndarray
+    category_names: np.ndarray
+    customer_names: np.ndarray
+    product_revenue: np.ndarray  # per product over all lines (top-3 has no window)
+    product_present: np.ndarray
+    # Order lines joined to their order, sorted by day; -1 where the product, its
+    # category or the customer is unknown
+    line_day: np.ndarray
+    line_order: np.ndarray
+    line_category: np.ndarray
+    line_customer: np.ndarray
+    line_qty: np.ndarray
+    line_revenue: np.ndarray
+    line_margin: np.ndarray
+    n_orders: int
+
+
+class KpiEngine:
+    def __init__(self, tool: SQLiteTool):
+        self.tool = tool
+        self._columns: Optional[Columns] = None
+        self._lock = threading.Lock()
+        self.handlers: Dict[str, Callable[[Columns, Sequence[Any]], Result]] = {
+            "top3_products_revenue": self._top3_products,
+            "aov_window": self._aov,
+            "category_revenue_window": self._category_revenue,
+            "top_category_quantity_summer": self._top_category_quantity,
+            "top_customer_margin_1997": self._top_customer_margin,
+        }
+
+    def supports(self, template_id: Optional[str]) -> bool:
+        return template_id in self.handlers
+
+    def run(self, template_id: str, params: Sequence[Any] = ()) -> Result:
+        return self.handlers[template_id](self._ensure_loaded(), tuple(params))
+
+    # --- loading -----------------------------------------------------------------------
+
+    def _column_table(self, sql: str) -> Dict[str, np.ndarray]:
+        cols, data, err = self.tool.run_columns(sql)
+        if err:
+            raise RuntimeError(err)
+        return data
+
+    def _ensure_loaded(self) -> Columns:
+        fingerprint = db_fingerprint(self.tool.db_path)
+        columns = self._columns  # one read: the snapshot used for this whole query
+        if columns is not None and columns.fingerprint == fingerprint:
+            return columns
+        with self._lock:
+            columns = self._columns
+            if columns is None or columns.fingerprint != fingerprint:
+                columns = self._columns = self._load(fingerprint)
+        return columns
+
+    def _load(self, fingerprint: str) -> Columns:
+        orders = self._column_table('SELECT OrderID, CustomerID, OrderDate FROM "Orders" ORDER BY OrderID')
+        lines = self._column_table('SELECT OrderID, ProductID, UnitPrice, Quantity, Discount FROM "Order Details"')
+        products = self._column_table('SELECT ProductID, ProductName, CategoryID FROM "Products" ORDER BY ProductID')
+        categories = self._column_table('SELECT CategoryID, CategoryName FROM "Categories" ORDER BY CategoryID')
+        customers = self._column_table('SELECT CustomerID, CompanyName FROM "Customers" ORDER BY CustomerID')
+
+        # Orders: date code = rank among distinct OrderDate strings; orders without a
+        # date never fall in a window (SQL compares NULL as unknown)
+        dates = orders["OrderDate"]
+        dated = np.array([d is not None for d in dates], dtype=bool)
+        distinct_dates = np.unique(dates[dated].astype(str))
+        order_day = np.full(len(dates), -1, dtype=np.int64)
+        order_day[dated] = np.searchsorted(distinct_dates, dates[dated].astype(str))
+
+        customer_ids = customers["CustomerID"].astype(str)
+        cust_keys = np.array(["" if c is None else str(c) for c in orders["CustomerID"]])
+        order_customer = _codes(cust_keys, customer_ids)
+
+        product_names = products["ProductName"]
+        category_ids = categories["CategoryID"].astype(np.int64)
+        product_category = _codes(_floats(products["CategoryID"]).astype(np.int64), category_ids)
+
+        price = _floats(lines["UnitPrice"])
+        qty = _floats(lines["Quantity"])
+        discount = _floats(lines["Discount"])
+        revenue = price * qty * (1 - discount)
+        all_product_row = _codes(_floats(lines["ProductID"]).astype(np.int64),
+                                 _floats(products["ProductID"]).astype(np.int64))
+
+        # Top-3 products does not join Orders, so it sums every line with a known
+        # product, including lines whose order row is missing
+        n_products = len(product_names)
+        ok = all_product_row >= 0
+        product_revenue = np.bincount(all_product_row[ok], weights=revenue[ok], minlength=n_products)
+        product_present = np.bincount(all_product_row[ok], minlength=n_products) > 0
+
+        # The windowed KPIs join lines to their order (inner join) and product (-1 if unknown)
+        order_row = _codes(_floats(lines["OrderID"]).astype(np.int64), _floats(orders["OrderID"]).astype(np.int64))
+        keep = order_row >= 0
+        order_row = order_row[keep]
+        product_row = all_product_row[keep]
+        price, qty, discount, revenue = price[keep], qty[keep], discount[keep], revenue[keep]
+
+        # Sort lines by date code so every window is one contiguous slice
+        day = order_day[order_row]
+        order = np.argsort(day, kind="stable")
+        line_order = order_row[order]
+        line_product = product_row[order]
+        return Columns(
+            fingerprint=fingerprint,
+            dates=distinct_dates,
+            product_names=product_names,
+            category_names=categories["CategoryName"],
+            customer_names=customers["CompanyName"],
+            product_revenue=product_revenue,
+            product_present=product_present,
+            line_day=day[order],
+            line_order=line_order,
+            line_category=np.where(line_product >= 0, product_category[np.maximum(line_product, 0)], -1),
+            line_customer=order_customer[line_order],
+            line_qty=qty[order],
+            line_revenue=revenue[order],
+            line_margin=((price - 0.7 * price) * qty * (1 - discount))[order],
+            n_orders=len(dates),
+        )
+
+    # --- KPI handlers --------------------------------------------------------------------
+
+    @staticmethod
+    def _window(c: Columns, lo: Optional[str] = None, hi: Optional[str] = None) -> slice:
+        if lo is None:
+            # All lines with a known date, plus undated ones (no date filter in the SQL)
+            return slice(0, len(c.line_day))
+        start_day = np.searchsorted(c.dates, lo, side="left")
+        end_day = np.searchsorted(c.dates, hi, side="right")
+        return slice(np.searchsorted(c.line_day, start_day, side="left"),
+                     np.searchsorted(c.line_day, end_day, side="left"))
+
+    @staticmethod
+    def _top(values: np.ndarray, present: np.ndarray, n: int) -> np.ndarray:
+        """Indices of the n largest values among `present` groups, largest first."""
+        idx = np.flatnonzero(present)
+        if len(idx) > n:
+            idx = idx[np.argpartition(-values[idx], n - 1)[:n]]
+        return idx[np.lexsort((idx, -values[idx]))]
+
+    def _top3_products(self, c: Columns, params: Sequence[Any]) -> Result:
+        # Precomputed at load: there is no window to apply
+        revenue = c.product_revenue
+        rows = [(c.product_names[i], float(revenue[i])) for i in self._top(revenue, c.product_present, 3)]
+        return ["product", "revenue"], rows
+
+    def _aov(self, c: Columns, params: Sequence[Any]) -> Result:
+        w = self._window(c, *params[:2]) if params else self._window(c)
+        if w.stop <= w.start:
+            return ["aov"], [(None,)]
+        # A plain int, so the quotient is a float: np.float64 rounds differently in the answer
+        n_orders = int(np.count_nonzero(np.bincount(c.line_order[w], minlength=c.n_orders)))
+        return ["aov"], [(float(c.line_revenue[w].sum()) / n_orders,)]
+
+    def _category_revenue(self, c: Columns, params: Sequence[Any]) -> Result:
+        name = params[0]
+        w = self._window(c, *params[1:3]) if len(params) > 1 else self._window(c)
+        matches = np.flatnonzero(c.category_names == name)
+        if len(matches) == 0:
+            return ["revenue"], [(None,)]
+        cat = c.line_category[w]
+        mask = cat == matches[0] if len(matches) == 1 else np.isin(cat, matches)
+        if not mask.any():
+            return ["revenue"], [(None,)]
+        return ["revenue"], [(float(c.line_revenue[w][mask].sum()),)]
+
+    def _top_category_quantity(self, c: Columns, params: Sequence[Any]) -> Result:
+        w = self._window(c, *params[:2])
+        cat = c.line_category[w]
+        ok = cat >= 0
+        n = len(c.category_names)
+        qty = np.bincount(cat[ok], weights=c.line_qty[w][ok], minlength=n)
+        present = np.bincount(cat[ok], minlength=n) > 0
+        rows = [(c.category_names[i], int(qty[i])) for i in self._top(qty, present, 1)]
+        return ["category", "quantity"], rows
+
+    def _top_customer_margin(self, c: Columns, params: Sequence[Any]) -> Result:
+        w = self._window(c, *params[:2])
+        cust = c.line_customer[w]
+        ok = cust >= 0
+        n = len(c.customer_names)
+        margin = np.bincount(cust[ok], weights=c.line_margin[w][ok], minlength=n)
+        present = np.bincount(cust[ok], minlength=n) > 0
+        rows = [(c.customer_names[i], float(margin[i])) for i in self._top(margin, present, 1)]
+        return ["customer", "margin"], rows
+
+
+def results_match(a: List[Tuple[Any, ...]], b: List[Tuple[Any, ...]], places: int = 2) -> bool:
+    """Row-by-row equality, floats compared as the answer rounds them (HybridAgent.synthesize).
+
+    A relative tolerance would accept totals that differ only by summation order yet
+    round to different cents, e.g. 158343.045 summed as ...04499 by one engine and
+    ...04500 by another, and so change the answer that is returned.
+    """
+    if len(a) != len(b):
+        return False
+    for ra, rb in zip(a, b):
+        if len(ra) != len(rb):
+            return False
+        for x, y in zip(ra, rb):
+            if isinstance(x, float) or isinstance(y, float):
+                if x is None or y is None or round(x, places) != round(y, places):
+                    return False
+            elif x != y:
+                return False
+    return True
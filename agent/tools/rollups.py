@@ -0,0 +1,221 @@
+"""Pre-aggregated daily rollups of the Northwind sales facts, refreshed incrementally.
+
+The rollups live in their own SQLite file so the main DB can stay read-only. SQLiteTool
+attaches that file as schema `rollup` (see `attach=`), and the KPI templates in
+agent/templates.py have rollup variants that HybridAgent.nl2sql uses while the
+rollups are fresh. A date-window KPI then reads one row per day in the window (times
+products or customers) instead of every order line in it.
+
+Tables, one row per OrderDate value (a calendar day for Northwind's midnight timestamps):
+  sales_by_day           revenue, quantity, margin, lines, orders
+  sales_by_day_product   + ProductID, CategoryID (CategoryID as of the refresh)
+  sales_by_day_customer  + CustomerID, with orders
+Distinct order counts are only additive at day or day x customer grain (an order has
+one date and one customer but several products), so there is no orders column per
+product.
+
+Refresh is incremental on a high-water mark: orders with OrderID above the last
+refreshed id are aggregated and added onto the existing buckets. Orders are assumed
+append-only; if rows at or below the mark change (order/line counts differ) or a
+product moves category, the rollups are rebuilt from scratch.
+
+Usage (from the repo root):
+  python -m agent.tools.rollups --out data/northwind_rollups.sqlite
+  python -m agent.tools.rollups --out data/northwind_rollups.sqlite --rebuild
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from agent.tools.sqlite_tool import file_uri, find_db_path
+
+SCHEMA = "rollup"  # name the rollup file is attached under
+
+# Source tables each rollup is derived from; answers served from a rollup cite these
+ROLLUP_SOURCES: Dict[str, List[str]] = {
+    "sales_by_day": ["Orders", "Order Details"],
+    "sales_by_day_product": ["Orders", "Order Details", "Products"],
+    "sales_by_day_customer": ["Orders", "Order Details"],
+}
+
+REVENUE = "od.UnitPrice * od.Quantity * (1 - od.Discount)"
+MARGIN = "(od.UnitPrice - (0.7 * od.UnitPrice)) * od.Quantity * (1 - od.Discount)"
+
+DDL = """
+CREATE TABLE IF NOT EXISTS rollup_meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sales_by_day (
+    OrderDate TEXT PRIMARY KEY,
+    revenue REAL, quantity INTEGER, margin REAL, lines INTEGER, orders INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sales_by_day_product (
+    OrderDate TEXT, ProductID INTEGER, CategoryID INTEGER,
+    revenue REAL, quantity INTEGER, margin REAL, lines INTEGER,
+    PRIMARY KEY (OrderDate, ProductID)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sales_by_day_customer (
+    OrderDate TEXT, CustomerID TEXT,
+    revenue REAL, quantity INTEGER, margin REAL, lines INTEGER, orders INTEGER,
+    PRIMARY KEY (OrderDate, CustomerID)
+) WITHOUT ROWID;
+"""
+
+# Each statement aggregates the orders in (?, ?] and adds them onto existing buckets
+_NEW_LINES = (
+    "FROM src.\"Orders\" o JOIN src.\"Order Details\" od ON od.OrderID = o.OrderID "
+    "{join}WHERE o.OrderID > ? AND o.OrderID <= ? "
+)
+_ADD = "revenue = revenue + excluded.revenue, quantity = quantity + excluded.quantity, " \
+       "margin = margin + excluded.margin, lines = lines + excluded.lines"
+
+REFRESH_SQL = [
+    "INSERT INTO sales_by_day (OrderDate, revenue, quantity, margin, lines, orders) "
+    f"SELECT o.OrderDate, SUM({REVENUE}), SUM(od.Quantity), SUM({MARGIN}), COUNT(*), COUNT(DISTINCT o.OrderID) "
+    + _NEW_LINES.format(join="") +
+    "GROUP BY o.OrderDate "
+    f"ON CONFLICT (OrderDate) DO UPDATE SET {_ADD}, orders = orders + excluded.orders",
+
+    "INSERT INTO sales_by_day_product (OrderDate, ProductID, CategoryID, revenue, quantity, margin, lines) "
+    f"SELECT o.OrderDate, od.ProductID, p.CategoryID, SUM({REVENUE}), SUM(od.Quantity), SUM({MARGIN}), COUNT(*) "
+    + _NEW_LINES.format(join="LEFT JOIN src.\"Products\" p ON p.ProductID = od.ProductID ") +
+    "GROUP BY o.OrderDate, od.ProductID "
+    f"ON CONFLICT (OrderDate, ProductID) DO UPDATE SET {_ADD}",
+
+    "INSERT INTO sales_by_day_customer (OrderDate, CustomerID, revenue, quantity, margin, lines, orders) "
+    f"SELECT o.OrderDate, o.CustomerID, SUM({REVENUE}), SUM(od.Quantity), SUM({MARGIN}), COUNT(*), "
+    "COUNT(DISTINCT o.OrderID) "
+    + _NEW_LINES.format(join="") +
+    "GROUP BY o.OrderDate, o.CustomerID "
+    f"ON CONFLICT (OrderDate, CustomerID) DO UPDATE SET {_ADD}, orders = orders + excluded.orders",
+]
+
+
+def _file_stamp(path: str) -> str:
+    from agent.tools.sql_cache import db_fingerprint
+    return db_fingerprint(path)
+
+
+def source_state(conn: sqlite3.Connection, schema: str = "main", upto: Optional[int] = None) -> Dict:
+    """Order/line counts up to OrderID `upto` (default: all) and the product->category map hash.
+
+    Compared against what the last refresh recorded to tell appends (incremental) from
+    edits below the high-water mark (rebuild).
+    """
+    q = f'{schema}."Orders"'
+    max_id = conn.execute(f"SELECT MAX(OrderID) FROM {q}").fetchone()[0] or 0
+    upto = max_id if upto is None else upto
+    orders = conn.execute(f"SELECT COUNT(*) FROM {q} WHERE OrderID <= ?", (upto,)).fetchone()[0]
+    lines = conn.execute(f'SELECT COUNT(*) FROM {schema}."Order Details" WHERE OrderID <= ?', (upto,)).fetchone()[0]
+    h = hashlib.sha1()
+    for row in conn.execute(f'SELECT ProductID, CategoryID FROM {schema}."Products" ORDER BY ProductID'):
+        h.update(repr(row).encode("utf-8"))
+    return {"max_order_id": max_id, "order_id": upto, "orders": orders, "lines": lines,
+            "categories": h.hexdigest()}
+
+
+class RollupStore:
+    """The rollup file for one source DB: refresh it, and tell whether it is up to date."""
+
+    def __init__(self, path: str, db_path: Optional[str] = None):
+        self.path = path
+        self.db_path = db_path or find_db_path()
+        self._stamp = None
+        self._fresh = False
+        self._lock = threading.Lock()
+
+    def meta(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        conn = sqlite3.connect(file_uri(self.path, "ro"), uri=True)
+        try:
+            return {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM rollup_meta")}
+        except sqlite3.OperationalError:
+            return {}
+        finally:
+            conn.close()
+
+    def refresh(self, rebuild: bool = False) -> Dict:
+        """Bring the rollups up to date with the source DB; returns what was done."""
+        t0 = time.perf_counter()
+        # Opened as a URI so the source can be attached read-only through one too
+        conn = sqlite3.connect(file_uri(self.path), uri=True, timeout=30)
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (file_uri(self.db_path, "ro"),))
+            conn.executescript(DDL)
+            stored = {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM rollup_meta")}
+            hwm = stored.get("order_id", 0)
+            if not rebuild and stored:
+                # Anything at or below the mark changed, or products were re-categorized
+                now = source_state(conn, "src", upto=hwm)
+                rebuild = any(now[k] != stored.get(k) for k in ("orders", "lines", "categories"))
+            conn.execute("BEGIN IMMEDIATE")
+            if rebuild or not stored:
+                for table in ROLLUP_SOURCES:
+                    conn.execute(f"DELETE FROM {table}")
+                hwm = 0
+            target = conn.execute('SELECT MAX(OrderID) FROM src."Orders"').fetchone()[0] or 0
+            if target > hwm:
+                for sql in REFRESH_SQL:
+                    conn.execute(sql, (hwm, target))
+            state = source_state(conn, "src", upto=target)
+            state["order_date"] = conn.execute(
+                'SELECT MAX(OrderDate) FROM src."Orders" WHERE OrderID <= ?', (target,)).fetchone()[0]
+            conn.executemany("INSERT OR REPLACE INTO rollup_meta (key, value) VALUES (?, ?)",
+                             [(k, json.dumps(v)) for k, v in state.items()])
+            conn.commit()
+            stats = {"mode": "rebuild" if (rebuild or not stored) else "incremental",
+                     "from_order_id": hwm, "to_order_id": target,
+                     "rows": {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ROLLUP_SOURCES}}
+        finally:
+            conn.close()
+        stats["seconds"] = round(time.perf_counter() - t0, 3)
+        with self._lock:
+            self._stamp = None
+        return stats
+
+    def is_fresh(self) -> bool:
+        """True when the rollups cover exactly the source DB's current orders.
+
+        Re-checked only when the mtime/size of either file changes, so calling this per
+        question costs a couple of stat() calls.
+        """
+        if not self.db_path or not os.path.exists(self.path):
+            return False
+        stamp = (_file_stamp(self.db_path), _file_stamp(self.path))
+        with self._lock:
+            if stamp == self._stamp:
+                return self._fresh
+        stored = self.meta()
+        fresh = False
+        if stored:
+            conn = sqlite3.connect(file_uri(self.db_path, "ro"), uri=True)
+            try:
+                now = source_state(conn)
+                fresh = all(now[k] == stored.get(k) for k in ("max_order_id", "orders", "lines", "categories"))
+            except sqlite3.Error:
+                fresh = False
+            finally:
+                conn.close()
+        with self._lock:
+            self._stamp, self._fresh = stamp, fresh
+        return fresh
+
+
+def main(db_path: Optional[str], out: str, rebuild: bool):
+    store = RollupStore(out, db_path)
+    if not store.db_path:
+        raise FileNotFoundError("Could not find northwind sqlite DB in data/; pass --db.")
+    print(json.dumps(store.refresh(rebuild=rebuild)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=None, help='path to the Northwind SQLite DB (default: auto-detect in data/)')
+    parser.add_argument('--out', required=True, help='rollup file to create or refresh')
+    parser.add_argument('--rebuild', action='store_true', help='recompute everything instead of refreshing incrementally')
+    args = parser.parse_args()
+    main(args.db, args.out, args.rebuild)
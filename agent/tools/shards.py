@@ -0,0 +1,370 @@
+"""Scatter-gather execution of the KPI templates over time-partitioned SQLite shards.
+
+Order history too large for one file is split by OrderDate into shard files, listed in
+a JSON manifest:
+
+  {"shards": [{"path": "northwind_1996.sqlite", "start": "1996-01-01", "end": "1997-01-01"}, ...]}
+
+Each shard holds the Orders with start <= OrderDate < end (compared as stored, like the
+templates do), their Order Details, and full copies of the dimension tables. Paths are
+relative to the manifest. A null start or end leaves that side open; such a shard is
+never pruned on that side, e.g. the one holding undated orders and order lines whose
+order row is missing.
+
+HybridAgent.execute_sql dispatches here by template id, like the KPI engine, with the
+params the template rendered for SQLite. Shards whose range cannot overlap the window
+are pruned. If one shard is left, the template's own SQL runs on it. Otherwise every
+remaining shard runs a partial aggregate in a thread pool (sqlite3 releases the GIL
+while a statement runs), and the partials are merged here:
+  - SUM and COUNT add up; float partials are added with math.fsum.
+  - AOV is total revenue over total distinct orders. An order lives in exactly one
+    shard, so per-shard distinct counts add up.
+  - Top-N sums revenue/quantity/margin per key across shards, then heap-selects the N
+    largest. Per-shard top-N lists are not enough, because one key's total is spread
+    over several shards.
+
+Float sums depend on the order they are added in, so a merged total and the unsharded
+DB's SUM can differ in the last bits. Answers are rounded to cents, so that only
+matters when a total is within that error of a half cent (common: Northwind line
+revenue is a multiple of 1e-4), or when two keys tie at the top-N cut. Such results
+are re-run with the template SQL on the source DB the shards were split from, if it
+is unchanged since the split, so the answer is the one the unsharded DB gives.
+
+Usage (from the repo root):
+  python -m agent.tools.shards --db data/northwind.sqlite --out-dir data/shards   # one shard per year
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from agent.templates import (AOV_SQL, AOV_WINDOW_SQL, CATEGORY_REVENUE_SQL, CATEGORY_REVENUE_WINDOW_SQL, REVENUE,
+                             TOP3_PRODUCTS_SQL, TOP_CATEGORY_QTY_SQL, TOP_CUSTOMER_MARGIN_SQL)
+from agent.tools.sql_cache import db_fingerprint
+from agent.tools.sqlite_tool import SQLiteTool, find_db_path
+
+Result = Tuple[List[str], List[Tuple[Any, ...]], Optional[str]]
+
+# --- per-shard partial aggregates ------------------------------------------------------
+# Same joins and filters as the templates, minus ORDER BY/LIMIT, keyed by the group id
+
+PARTIAL_PRODUCT_REVENUE_SQL = (
+    f"SELECT p.ProductID, p.ProductName, {REVENUE} AS revenue "
+    "FROM \"Order Details\" od "
+    "JOIN \"Products\" p ON p.ProductID = od.ProductID "
+    "GROUP BY p.ProductID, p.ProductName;"
+)
+
+PARTIAL_AOV_SQL = (
+    f"SELECT {REVENUE} AS revenue, COUNT(DISTINCT \"Orders\".OrderID) AS orders "
+    "FROM \"Orders\" JOIN \"Order Details\" od ON \"Orders\".OrderID = od.OrderID"
+)
+PARTIAL_AOV_WINDOW_SQL = PARTIAL_AOV_SQL + " WHERE \"Orders\".OrderDate >= ? AND \"Orders\".OrderDate <= ?;"
+
+PARTIAL_CATEGORY_QTY_SQL = (
+    "SELECT c.CategoryID, c.CategoryName, SUM(od.Quantity) AS quantity "
+    "FROM \"Order Details\" od "
+    "JOIN \"Orders\" ON \"Orders\".OrderID = od.OrderID "
+    "JOIN \"Products\" p ON p.ProductID = od.ProductID "
+    "JOIN \"Categories\" c ON p.CategoryID = c.CategoryID "
+    "WHERE \"Orders\".OrderDate >= ? AND \"Orders\".OrderDate <= ? "
+    "GROUP BY c.CategoryID, c.CategoryName;"
+)
+
+PARTIAL_CUSTOMER_MARGIN_SQL = (
+    "SELECT cu.CustomerID, cu.CompanyName, "
+    "SUM((od.UnitPrice - (0.7 * od.UnitPrice)) * od.Quantity * (1 - od.Discount)) AS margin "
+    "FROM \"Order Details\" od "
+    "JOIN \"Orders\" o ON o.OrderID = od.OrderID "
+    "JOIN \"Customers\" cu ON cu.CustomerID = o.CustomerID "
+    "WHERE o.OrderDate >= ? AND o.OrderDate <= ? "
+    "GROUP BY cu.CustomerID, cu.CompanyName;"
+)
+
+# Relative error a float SUM may carry (naive summation of tens of millions of lines
+# stays well inside it); merged results this close to a rounding or ranking boundary
+# are re-run on the source DB
+TIE_TOLERANCE = 2.0 ** -40
+
+
+class Shard(NamedTuple):
+    path: str
+    start: Optional[str]  # inclusive lower bound of OrderDate, None: open
+    end: Optional[str]  # exclusive upper bound, None: open
+
+    def overlaps(self, lo: Optional[str], hi: Optional[str]) -> bool:
+        if lo is None:
+            return True
+        return (self.start is None or self.start <= hi) and (self.end is None or self.end > lo)
+
+
+def load_manifest(path: str) -> Dict:
+    """The manifest, with its "shards" entries resolved to Shard tuples."""
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    manifest["shards"] = [Shard(os.path.join(base, s["path"]), s.get("start"), s.get("end"))
+                          for s in manifest["shards"]]
+    return manifest
+
+
+def _sum(values: Sequence[Optional[float]]) -> Optional[float]:
+    # SQL SUM over no rows is NULL; NULL partials are skipped like NULL rows
+    present = [v for v in values if v is not None]
+    return math.fsum(present) if present else None
+
+
+def _close(a: float, b: float) -> bool:
+    return abs(a - b) <= TIE_TOLERANCE * max(abs(a), abs(b), 1.0)
+
+
+def _near_half_cent(value: Optional[float]) -> bool:
+    """Whether a float SUM near value could round to either cent."""
+    if value is None:
+        return False
+    cents = value * 100
+    return _close(cents, math.floor(cents) + 0.5)
+
+
+def _merge_top(partials: List[List[Tuple[Any, ...]]], n: int) -> Tuple[List[Tuple[Any, Any]], bool]:
+    """(name, total) of the n largest per-key totals over (key, name, value) partial rows,
+    and whether the unsharded query could pick, order or round them differently: two
+    totals around the ranks kept are (nearly) equal, or a kept float total is near a
+    half cent."""
+    totals: Dict[Any, Tuple[Any, List[Any]]] = {}
+    for rows in partials:
+        for key, name, value in rows:
+            if value is not None:
+                totals.setdefault(key, (name, []))[1].append(value)
+    merged = [(name, math.fsum(values) if any(isinstance(v, float) for v in values) else sum(values))
+              for name, values in totals.values()]
+    ranked = heapq.nlargest(n + 1, merged, key=lambda e: e[1])
+    top = ranked[:n]
+    ambiguous = (any(_close(a[1], b[1]) for a, b in zip(ranked, ranked[1:]))
+                 or any(isinstance(v, float) and _near_half_cent(v) for _, v in top))
+    return top, ambiguous
+
+
+class ShardedExecutor:
+    def __init__(self, manifest_path: str, workers: Optional[int] = None):
+        self.manifest_path = manifest_path
+        manifest = load_manifest(manifest_path)
+        self.shards: List[Shard] = manifest["shards"]
+        # The DB the shards were split from and its version stamp then; near-ties are
+        # re-run on it while it is unchanged
+        self.source: Optional[str] = manifest.get("source")
+        self.source_fingerprint: Optional[str] = manifest.get("source_fingerprint")
+        self.rechecked = 0  # merged results replaced by the source DB's answer
+        self.workers = workers or min(len(self.shards), os.cpu_count() or 1) or 1
+        self._tools: Dict[str, SQLiteTool] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # template id -> handler(params, deadline) -> (cols, rows, err)
+        self.handlers: Dict[str, Callable[[Sequence[Any], Optional[float]], Result]] = {
+            "top3_products_revenue": self._top3_products,
+            "aov_window": self._aov,
+            "category_revenue_window": self._category_revenue,
+            "top_category_quantity_summer": self._top_category_quantity,
+            "top_customer_margin_1997": self._top_customer_margin,
+        }
+
+    def supports(self, template_id: Optional[str]) -> bool:
+        return template_id in self.handlers
+
+    def run(self, template_id: str, params: Sequence[Any] = (), deadline: Optional[float] = None) -> Result:
+        return self.handlers[template_id](tuple(params), deadline)
+
+    def fingerprint(self) -> str:
+        """Version stamp of the manifest and every shard (see sql_cache.db_fingerprint)."""
+        return "+".join(db_fingerprint(p) for p in [self.manifest_path, *(s.path for s in self.shards)])
+
+    def prune(self, lo: Optional[str] = None, hi: Optional[str] = None) -> List[Shard]:
+        return [s for s in self.shards if s.overlaps(lo, hi)]
+
+    def _tool(self, path: str) -> SQLiteTool:
+        tool = self._tools.get(path)
+        if tool is None:
+            with self._lock:
+                tool = self._tools.get(path)
+                if tool is None:
+                    tool = self._tools[path] = SQLiteTool(path)
+        return tool
+
+    def _scatter(self, shards: List[Shard], sql: str, params: Sequence[Any],
+                 deadline: Optional[float]) -> Tuple[List[str], List[List[Tuple[Any, ...]]], Optional[str]]:
+        """Run sql on every shard in parallel: (cols, rows per shard, first error)."""
+        if not shards:
+            return [], [], None
+        if len(shards) == 1:
+            results = [self._tool(shards[0].path).run(sql, params, deadline=deadline)]
+        else:
+            if self._pool is None:
+                with self._lock:
+                    if self._pool is None:
+                        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shard")
+            futures = [self._pool.submit(self._tool(s.path).run, sql, params, deadline) for s in shards]
+            results = [f.result() for f in futures]
+        for _, _, err in results:
+            if err:
+                return [], [], err
+        return results[0][0], [rows for _, rows, _ in results], None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+        for tool in self._tools.values():
+            tool.pool.close()
+
+    # --- KPI handlers --------------------------------------------------------------------
+
+    def _top3_products(self, params: Sequence[Any], deadline: Optional[float]) -> Result:
+        shards = self.prune()
+        if not shards:
+            return ["product", "revenue"], [], None
+        if len(shards) == 1:
+            return self._single(shards[0], TOP3_PRODUCTS_SQL, params, deadline)
+        _, partials, err = self._scatter(shards, PARTIAL_PRODUCT_REVENUE_SQL, (), deadline)
+        if err:
+            return [], [], err
+        top, ambiguous = _merge_top(partials, 3)
+        return self._settle((["product", "revenue"], top, None), ambiguous, TOP3_PRODUCTS_SQL, params, deadline)
+
+    def _aov(self, params: Sequence[Any], deadline: Optional[float]) -> Result:
+        shards = self.prune(*params[:2])
+        if not shards:
+            return ["aov"], [(None,)], None
+        template_sql = AOV_WINDOW_SQL if params else AOV_SQL + ";"
+        if len(shards) == 1:
+            return self._single(shards[0], template_sql, params, deadline)
+        sql = PARTIAL_AOV_WINDOW_SQL if params else PARTIAL_AOV_SQL + ";"
+        _, partials, err = self._scatter(shards, sql, params, deadline)
+        if err:
+            return [], [], err
+        revenue = _sum([rows[0][0] for rows in partials])
+        orders = sum(rows[0][1] for rows in partials)
+        aov = revenue / orders if orders and revenue is not None else None
+        return self._settle((["aov"], [(aov,)], None), _near_half_cent(aov), template_sql, params, deadline)
+
+    def _category_revenue(self, params: Sequence[Any], deadline: Optional[float]) -> Result:
+        shards = self.prune(*params[1:3])
+        if not shards:
+            return ["revenue"], [(None,)], None
+        # The template is already a plain SUM, so it is its own partial aggregate
+        sql = CATEGORY_REVENUE_WINDOW_SQL if len(params) > 1 else CATEGORY_REVENUE_SQL + ";"
+        if len(shards) == 1:
+            return self._single(shards[0], sql, params, deadline)
+        _, partials, err = self._scatter(shards, sql, params, deadline)
+        if err:
+            return [], [], err
+        revenue = _sum([rows[0][0] for rows in partials])
+        return self._settle((["revenue"], [(revenue,)], None), _near_half_cent(revenue), sql, params, deadline)
+
+    def _top_category_quantity(self, params: Sequence[Any], deadline: Optional[float]) -> Result:
+        return self._top_in_window(params, deadline, TOP_CATEGORY_QTY_SQL, PARTIAL_CATEGORY_QTY_SQL,
+                                   ["category", "quantity"])
+
+    def _top_customer_margin(self, params: Sequence[Any], deadline: Optional[float]) -> Result:
+        return self._top_in_window(params, deadline, TOP_CUSTOMER_MARGIN_SQL, PARTIAL_CUSTOMER_MARGIN_SQL,
+                                   ["customer", "margin"])
+
+    def _top_in_window(self, params: Sequence[Any], deadline: Optional[float], sql: str, partial_sql: str,
+                       cols: List[str]) -> Result:
+        shards = self.prune(*params[:2])
+        if not shards:
+            return cols, [], None
+        if len(shards) == 1:
+            return self._single(shards[0], sql, params, deadline)
+        _, partials, err = self._scatter(shards, partial_sql, params, deadline)
+        if err:
+            return [], [], err
+        top, ambiguous = _merge_top(partials, 1)
+        return self._settle((cols, top, None), ambiguous, sql, params, deadline)
+
+    def _single(self, shard: Shard, sql: str, params: Sequence[Any], deadline: Optional[float]) -> Result:
+        # One relevant shard holds every matching row, in the unsharded DB's order, so the
+        # template's own SQL sums the same lines the same way
+        return self._tool(shard.path).run(sql, params, deadline=deadline)
+
+    def _settle(self, merged: Result, ambiguous: bool, sql: str, params: Sequence[Any],
+                deadline: Optional[float]) -> Result:
+        """merged, unless it is too close to a rounding or ranking boundary to be sure the
+        unsharded DB answers the same; then the template SQL's result on the source DB."""
+        if not ambiguous or not self.source or db_fingerprint(self.source) != self.source_fingerprint:
+            return merged
+        cols, rows, err = self._tool(self.source).run(sql, params, deadline=deadline)
+        if err:
+            return merged  # off by float rounding at most
+        with self._lock:
+            self.rechecked += 1
+        return cols, rows, None
+
+
+def split(db_path: str, out_dir: str) -> Dict:
+    """Write one shard per OrderDate year, plus one for undated orders and order lines
+    without an order, and a manifest."""
+    os.makedirs(out_dir, exist_ok=True)
+    src = sqlite3.connect(db_path)
+    objects = src.execute("SELECT type, name, tbl_name, sql FROM sqlite_master "
+                          "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'").fetchall()
+    tables = [name for kind, name, _, _ in objects if kind == "table"]
+    years = [r[0] for r in src.execute('SELECT DISTINCT substr(OrderDate, 1, 4) FROM "Orders" '
+                                       'WHERE OrderDate IS NOT NULL ORDER BY 1')]
+    undated = src.execute('SELECT COUNT(*) FROM "Orders" WHERE OrderDate IS NULL').fetchone()[0]
+    orphans = src.execute('SELECT COUNT(*) FROM "Order Details" od WHERE NOT EXISTS '
+                          '(SELECT 1 FROM "Orders" o WHERE o.OrderID = od.OrderID)').fetchone()[0]
+    src.close()
+    ranges: List[Tuple[str, Optional[str], Optional[str], str]] = [
+        (f"northwind_{y}.sqlite", f"{y}-01-01", f"{int(y) + 1:04d}-01-01",
+         'OrderDate >= ? AND OrderDate < ?') for y in years]
+    if undated or orphans:
+        ranges.append(("northwind_undated.sqlite", None, None, "OrderDate IS NULL"))
+    manifest = {"source": os.path.abspath(db_path), "source_fingerprint": db_fingerprint(db_path), "shards": []}
+    for name, start, end, where in ranges:
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path)
+        conn.execute("ATTACH DATABASE ? AS src", (db_path,))
+        for kind, _, _, sql in objects:
+            if kind == "table":
+                conn.execute(sql)
+        bounds = (start, end) if start is not None else ()
+        for table in tables:
+            if table == "Orders":
+                conn.execute(f'INSERT INTO main."Orders" SELECT * FROM src."Orders" WHERE {where}', bounds)
+            elif table == "Order Details":
+                # Lines without an order row only count for top-3 products (no Orders
+                # join); they go to the open-ended shard with the undated orders
+                orphan = (' OR NOT EXISTS (SELECT 1 FROM src."Orders" o WHERE o.OrderID = od.OrderID)'
+                          if start is None else '')
+                conn.execute('INSERT INTO main."Order Details" SELECT * FROM src."Order Details" od '
+                             f'WHERE OrderID IN (SELECT OrderID FROM main."Orders"){orphan}')
+            else:
+                conn.execute(f'INSERT INTO main."{table}" SELECT * FROM src."{table}"')
+        # Indexes (e.g. from agent.tools.index_advisor) are built after the data is in
+        for kind, _, _, sql in objects:
+            if kind in ("index", "view", "trigger"):
+                conn.execute(sql)
+        conn.commit()
+        orders = conn.execute('SELECT COUNT(*) FROM "Orders"').fetchone()[0]
+        conn.close()
+        manifest["shards"].append({"path": name, "start": start, "end": end, "orders": orders})
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=None, help='path to the Northwind SQLite DB (default: auto-detect in data/)')
+    parser.add_argument('--out-dir', required=True, help='directory for the shard files and manifest.json')
+    args = parser.parse_args()
+    db = args.db or find_db_path()
+    if not db:
+        raise FileNotFoundError("Could not find northwind sqlite DB in data/; pass --db.")
+    print(json.dumps(split(db, args.out_dir), indent=2))
@@ -0,0 +1,218 @@
+"""Result cache for SQLiteTool: LRU over (normalized SQL, params), tagged with a DB fingerprint.
+
+Entries remember the fingerprint of the database they were computed from; a lookup under
+a different fingerprint is a miss and drops the stale entry, so the cache invalidates
+itself when the Northwind file changes. Two backends share the same interface:
+an in-process OrderedDict and an on-disk SQLite file that survives restarts.
+"""
+import abc
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+CachedResult = Tuple[List[str], List[Tuple[Any, ...]]]
+
+
+def normalize_sql(sql: str) -> str:
+    # Collapse whitespace and drop the trailing semicolon; literals are left untouched
+    return re.sub(r"\s+", " ", sql).strip().rstrip(";").strip()
+
+
+def is_cacheable(sql: str) -> bool:
+    head = normalize_sql(sql)[:6].upper()
+    return head.startswith("SELECT") or head.startswith("WITH")
+
+
+def make_key(sql: str, params: Sequence[Any] = ()) -> str:
+    raw = normalize_sql(sql) + "\x00" + repr(tuple(params))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def db_fingerprint(db_path: str) -> str:
+    """Cheap version stamp of a SQLite DB: mtime/size of the file and of its WAL, if any."""
+    parts = []
+    for p in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+    return "|".join(parts)
+
+
+def cache_stats(hits: int, misses: int) -> Dict[str, Any]:
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": (hits / total) if total else 0.0}
+
+
+class ResultCache(abc.ABC):
+    """Base class: hit/miss accounting around backend-specific _get/_put."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._taken = (0, 0)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, fingerprint: str) -> Optional[CachedResult]:
+        with self._lock:
+            res = self._get(key, fingerprint)
+            if res is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return res
+
+    def put(self, key: str, fingerprint: str, cols: List[str], rows: List[Tuple[Any, ...]]):
+        with self._lock:
+            self._put(key, fingerprint, cols, rows)
+
+    def stats(self) -> dict:
+        return cache_stats(self.hits, self.misses)
+
+    def take_counts(self) -> Dict[str, int]:
+        """Hits and misses since the last call (for summing in a parent process)."""
+        with self._lock:
+            hits, misses = self._taken
+            self._taken = (self.hits, self.misses)
+            return {"hits": self.hits - hits, "misses": self.misses - misses}
+
+    @abc.abstractmethod
+    def _get(self, key: str, fingerprint: str) -> Optional[CachedResult]:
+        """The entry for key if it was stored under this fingerprint (called under the lock)."""
+
+    @abc.abstractmethod
+    def _put(self, key: str, fingerprint: str, cols: List[str], rows: List[Tuple[Any, ...]]):
+        """Store an entry, evicting the least recently used past max_entries (called under the lock)."""
+
+    def close(self):
+        pass
+
+
+class MemoryResultCache(ResultCache):
+    def __init__(self, max_entries: int = 1024):
+        super().__init__(max_entries)
+        self._entries: "OrderedDict[str, Tuple[str, CachedResult]]" = OrderedDict()
+
+    def _get(self, key, fingerprint):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] != fingerprint:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key, fingerprint, cols, rows):
+        self._entries[key] = (fingerprint, (list(cols), list(rows)))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class DiskResultCache(ResultCache):
+    """SQLite-file backend; LRU order is tracked with a last-used timestamp per entry."""
+
+    def __init__(self, path: str, max_entries: int = 1024):
+        super().__init__(max_entries)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT, payload BLOB, used INTEGER)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results(used)")
+        self._size = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _get(self, key, fingerprint):
+        row = self.conn.execute("SELECT fingerprint, payload FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[0] != fingerprint:
+            self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._size -= 1
+            return None
+        self.conn.execute("UPDATE results SET used = ? WHERE key = ?", (time.time_ns(), key))
+        cols, rows = pickle.loads(row[1])
+        return cols, rows
+
+    def _put(self, key, fingerprint, cols, rows):
+        payload = pickle.dumps((list(cols), list(rows)), protocol=pickle.HIGHEST_PROTOCOL)
+        existed = self.conn.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None
+        self.conn.execute(
+            "INSERT INTO results(key, fingerprint, payload, used) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET fingerprint = excluded.fingerprint, "
+            "payload = excluded.payload, used = excluded.used",
+            (key, fingerprint, payload, time.time_ns()),
+        )
+        if not existed:
+            self._size += 1
+        if self._size > self.max_entries:
+            # Other processes may share the file, so evict against the real count
+            self.conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._size = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class NegativeResultMemo:
+    """Bounded LRU of (sql, params) known to fail on the current DB, with the failure kind.
+
+    Keyed like the result cache and tagged with the DB fingerprint, so a changed DB
+    gets a fresh chance. Timeouts also remember the budget they ran out of: the query
+    is only skipped again when the caller has no more time than that.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self._entries: "OrderedDict[str, Tuple[str, str, str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, fingerprint: str, budget: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """(kind, err) if the query is known to fail again under this budget."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            fp, kind, err, failed_budget = entry
+            if fp != fingerprint:
+                del self._entries[key]
+                return None
+            if kind == "timeout" and (budget is None or failed_budget is None or budget > failed_budget):
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return kind, err
+
+    def put(self, key: str, fingerprint: str, kind: str, err: str, budget: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (fingerprint, kind, err, budget)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def open_cache(path: Optional[str] = None, max_entries: int = 1024) -> ResultCache:
+    """Disk-backed cache when a path is given, otherwise an in-memory one."""
+    if path:
+        return DiskResultCache(path, max_entries)
+    return MemoryResultCache(max_entries)
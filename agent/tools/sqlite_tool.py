@@ -1,8 +1,20 @@
 """SQLite helper: find DB, introspect schema, run queries and return columns/rows/errors.
+
+Connections use an analytics profile by default: the DB is opened read-only through a
+URI (optionally immutable=1), tuned with PRAGMAs for large scans, and handed out from a
+small thread-safe pool so concurrent callers do not serialize on one connection.
 """
 import os
+import queue
 import sqlite3
-from typing import List, Tuple, Optional, Any
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, List, Tuple, Optional, Any, Sequence
+from urllib.parse import quote
+
+if TYPE_CHECKING:
+    from agent.tools.sql_cache import ResultCache
 
 DEFAULT_CANDIDATES = [
     os.path.join(os.getcwd(), "data", "northwind.sqlite"),
@@ -11,6 +23,14 @@ DEFAULT_CANDIDATES = [
 ]
 
 
+def file_uri(path: str, mode: Optional[str] = None) -> str:
+    """`file:` URI of a DB path for sqlite3.connect(uri=True) and ATTACH, e.g. mode="ro"."""
+    # urllib.parse rather than urllib.request.pathname2url: the latter pulls in
+    # http.client, email and ssl, which tripled the agent's import time
+    uri = "file:" + quote(os.path.abspath(path))
+    return f"{uri}?mode={mode}" if mode else uri
+
+
 def find_db_path(candidates: Optional[List[str]] = None) -> Optional[str]:
     if candidates is None:
         candidates = DEFAULT_CANDIDATES
@@ -20,33 +40,321 @@ def find_db_path(candidates: Optional[List[str]] = None) -> Optional[str]:
     return None
 
 
+# Applied to every pooled connection; extend/override per tool with `pragmas=`, e.g.
+# {"cache_size": -64 * 1024, "temp_store": "MEMORY"} for a 64 MiB page cache and
+# in-memory GROUP BY/sort b-trees. Those two are not on by default: on the eval
+# queries they made GROUP BY-heavy templates slower (more fresh pages per query),
+# see bench/sqlite_profile.py to measure on a given machine.
+ANALYTICS_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,  # read pages straight from the OS page cache
+}
+
+
+# VM instructions between deadline checks while a query runs (a few microseconds each)
+PROGRESS_OPCODES = 1000
+
+# classify_error() kinds worth retrying: the same SQL may succeed on another attempt.
+# Everything else (syntax, schema, empty, timeout, no-sql) fails the same way again.
+RETRYABLE_ERRORS = frozenset({"busy", "io", "error"})
+
+_ERROR_KINDS = [
+    ("timeout", ("timeout:",)),
+    ("syntax", ("syntax error", "incomplete input", "unrecognized token")),
+    ("schema", ("no such table", "no such column", "no such function", "ambiguous column")),
+    ("busy", ("database is locked", "database table is locked", "busy")),
+    ("io", ("disk i/o error", "unable to open")),
+]
+
+
+def classify_error(err: Optional[str], rows: Optional[Sequence] = None) -> str:
+    """'ok', 'empty', 'no_sql' or the failure kind of an error message from run()."""
+    if not err:
+        return "ok" if rows else "empty"
+    if err == "no-sql":
+        return "no_sql"
+    low = err.lower()
+    for kind, needles in _ERROR_KINDS:
+        if any(n in low for n in needles):
+            return kind
+    return "error"
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free in time (classified as a transient "busy" error)."""
+
+
+class PoolClosed(Exception):
+    """acquire() on a pool whose connections have been closed."""
+
+
+class ConnectionPool:
+    """Fixed-size pool; connections are created on demand and reused LIFO (warm caches).
+
+    acquire() waits at most `timeout` seconds for a free slot, so callers get an error
+    rather than blocking forever when connections are held by streams nobody closes.
+    After close() every acquire() raises PoolClosed, and connections released late are
+    not handed out again.
+    """
+
+    def __init__(self, factory: Callable[[], sqlite3.Connection], size: int = 4, timeout: Optional[float] = 30.0):
+        self._factory = factory
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.size = size
+        self.timeout = timeout
+
+    def acquire(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        """A connection from the pool; `timeout` overrides the pool's wait limit."""
+        wait = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=wait):
+            raise PoolTimeout(f"busy: no pooled connection free after {wait:.3g}s "
+                              f"(all {self.size} held, e.g. by unclosed RowStreams)")
+        with self._lock:
+            if self._closed:
+                self._slots.release()
+                raise PoolClosed("connection pool is closed")
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        try:
+            conn = self._factory()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            if not self._closed:
+                self._all.append(conn)
+                return conn
+        # close() ran while the connection was being opened
+        conn.close()
+        self._slots.release()
+        raise PoolClosed("connection pool is closed")
+
+    def release(self, conn: sqlite3.Connection):
+        with self._lock:
+            if not self._closed:  # after close() the connection is already closed
+                self._idle.put(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            conns, self._all = self._all, []
+            self._idle = queue.LifoQueue()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class RowStream:
+    """Lazily fetched query result: iterates rows in fetchmany() batches, holding one
+    pooled connection until exhausted, closed, or garbage collected."""
+
+    def __init__(self, release: Callable[[], None], cursor: Optional[sqlite3.Cursor], batch_size: int = 1000,
+                 max_rows: Optional[int] = None):
+        self._release = release
+        self._cursor = cursor
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.columns = [d[0] for d in cursor.description] if cursor is not None and cursor.description else []
+
+    def batches(self) -> Iterator[List[Tuple[Any, ...]]]:
+        left = self.max_rows
+        try:
+            while self._cursor is not None and (left is None or left > 0):
+                size = self.batch_size if left is None else min(self.batch_size, left)
+                batch = self._cursor.fetchmany(size)
+                if not batch:
+                    break
+                if left is not None:
+                    left -= len(batch)
+                yield batch
+        finally:
+            self.close()
+
+    def __iter__(self) -> Iterator[Tuple[Any, ...]]:
+        for batch in self.batches():
+            yield from batch
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
 class SQLiteTool:
-    def __init__(self, path: Optional[str] = None):
+    def __init__(self, path: Optional[str] = None, cache: Optional["ResultCache"] = None,
+                 statement_cache_size: int = 256, read_only: bool = True, immutable: bool = False,
+                 pool_size: int = 4, pragmas: Optional[dict] = None, attach: Optional[dict] = None,
+                 acquire_timeout: Optional[float] = 30.0):
         self.db_path = path or find_db_path()
         if not self.db_path:
             raise FileNotFoundError("Could not find northwind sqlite DB in data/; tried candidates.")
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row
+        self.statement_cache_size = statement_cache_size
+        self.read_only = read_only
+        # immutable=1 also skips file locking and change detection; only safe when
+        # nothing else writes the DB while the tool is open
+        self.immutable = immutable
+        self.pragmas = dict(ANALYTICS_PRAGMAS, **(pragmas or {}))
+        # schema name -> path of extra DBs attached read-only to every connection
+        # (e.g. the rollup tables from agent/tools/rollups.py)
+        self.attach = dict(attach or {})
+        self.pool = ConnectionPool(self._connect, pool_size, acquire_timeout)
+        # Optional result cache (see agent/tools/sql_cache.py); only read queries are cached
+        self.cache = cache
+
+    def _connect(self) -> sqlite3.Connection:
+        # Prepared statements are cached per connection by SQL text; parameterized
+        # templates keep that text constant, so repeated KPI queries skip re-planning.
+        # No row_factory: plain tuples are what run() returns anyway.
+        if self.read_only:
+            uri = file_uri(self.db_path, "ro")
+            if self.immutable:
+                uri += "&immutable=1"
+            conn = sqlite3.connect(uri, uri=True, cached_statements=self.statement_cache_size,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, cached_statements=self.statement_cache_size,
+                                   check_same_thread=False)
+        for schema, path in self.attach.items():
+            if self.read_only:  # the connection was opened with uri=True
+                path = file_uri(path, "ro")
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def fingerprint(self) -> str:
+        """Version stamp of the main DB and any attached ones (see sql_cache.db_fingerprint)."""
+        from agent.tools.sql_cache import db_fingerprint
+        return "+".join(db_fingerprint(p) for p in [self.db_path, *self.attach.values()])
 
     def get_tables(self) -> List[str]:
-        cur = self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
-        return [r[0] for r in cur.fetchall()]
+        with self.pool.connection() as conn:
+            cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
+            return [r[0] for r in cur.fetchall()]
 
     def get_columns(self, table: str) -> List[str]:
-        cur = self.conn.execute(f"PRAGMA table_info('{table}')")
-        return [r[1] for r in cur.fetchall()]
+        with self.pool.connection() as conn:
+            cur = conn.execute(f"PRAGMA table_info('{table}')")
+            return [r[1] for r in cur.fetchall()]
 
-    def run(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]], Optional[str]]:
+    def run(self, sql: str, params: Sequence[Any] = (),
+            deadline: Optional[float] = None) -> Tuple[List[str], List[Tuple[Any, ...]], Optional[str]]:
+        """Execute sql; `deadline` (a time.monotonic() value) cancels the query once passed."""
+        key = fingerprint = None
+        if self.cache is not None:
+            # Imported here so agents without a cache never load hashlib/pickle
+            from agent.tools.sql_cache import is_cacheable, make_key
+        if self.cache is not None and is_cacheable(sql):
+            key = make_key(sql, params)
+            fingerprint = self.fingerprint()
+            hit = self.cache.get(key, fingerprint)
+            if hit is not None:
+                return hit[0], hit[1], None
+        if deadline is not None and time.monotonic() >= deadline:
+            return [], [], "timeout: deadline passed before the query started"
+        wait = None
+        if deadline is not None:
+            # Waiting for a free connection counts against the question's budget too. It
+            # stays a "busy" error, not a timeout: the query itself is not to blame
+            wait = max(0.0, deadline - time.monotonic())
+            if self.pool.timeout is not None:
+                wait = min(wait, self.pool.timeout)
         try:
-            cur = self.conn.execute(sql)
-            cols = [d[0] for d in cur.description] if cur.description else []
-            rows = [tuple(r) for r in cur.fetchall()]
-            return cols, rows, None
+            with self.pool.connection(wait) as conn:
+                if deadline is not None:
+                    # SQLite calls this every PROGRESS_OPCODES VM steps; a true return
+                    # aborts the statement with "interrupted"
+                    conn.set_progress_handler(lambda: time.monotonic() >= deadline, PROGRESS_OPCODES)
+                try:
+                    cur = conn.execute(sql, params)
+                    cols = [d[0] for d in cur.description] if cur.description else []
+                    rows = cur.fetchall()
+                finally:
+                    if deadline is not None:
+                        conn.set_progress_handler(None, 0)
         except Exception as e:
+            if deadline is not None and "interrupted" in str(e):
+                return [], [], "timeout: query cancelled at the deadline"
             return [], [], str(e)
+        if key is not None:
+            self.cache.put(key, fingerprint, cols, rows)
+        return cols, rows, None
 
-    def close(self):
+    def iter_rows(self, sql: str, params: Sequence[Any] = (), batch_size: int = 1000,
+                  max_rows: Optional[int] = None) -> Tuple[List[str], RowStream, Optional[str]]:
+        """Like run(), but rows are fetched lazily in batches (optionally capped at max_rows).
+
+        Drill-down queries stay at O(batch_size) memory; the result cache is bypassed.
+        """
         try:
-            self.conn.close()
-        except Exception:
-            pass
+            conn = self.pool.acquire()
+        except Exception as e:
+            return [], RowStream(lambda: None, None), str(e)
+        try:
+            cur = conn.execute(sql, params)
+        except Exception as e:
+            self.pool.release(conn)
+            return [], RowStream(lambda: None, None), str(e)
+        stream = RowStream(lambda: self.pool.release(conn), cur, batch_size, max_rows)
+        return stream.columns, stream, None
+
+    def run_columns(self, sql: str, params: Sequence[Any] = (), batch_size: int = 10000,
+                    max_rows: Optional[int] = None, as_frame: bool = False):
+        """Columnar result: (cols, {col: numpy array} or a pandas DataFrame, err).
+
+        Rows are transposed one fetchmany() batch at a time, so at most batch_size row
+        tuples are alive while the column arrays are built.
+        """
+        import numpy as np
+        cols, stream, err = self.iter_rows(sql, params, batch_size, max_rows)
+        if err:
+            return [], ({} if not as_frame else None), err
+        parts: List[List[Any]] = [[] for _ in cols]
+        with stream:
+            for batch in stream.batches():
+                for j, values in enumerate(zip(*batch)):
+                    parts[j].append(np.asarray(values))
+        data = {}
+        for name, chunks in zip(cols, parts):
+            if not chunks:
+                data[name] = np.empty(0)
+                continue
+            try:
+                data[name] = np.concatenate(chunks)
+            except (TypeError, ValueError):  # e.g. text in one batch, only NULLs in another
+                data[name] = np.concatenate([c.astype(object) for c in chunks])
+        if as_frame:
+            import pandas as pd
+            return cols, pd.DataFrame(data, columns=cols), None
+        return cols, data, None
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,229 @@
+"""Structured tracing for the hybrid agent: timing spans, per-question traces and latency histograms.
+
+A trace covers one question. Stage spans (route, retrieve, plan, nl2sql, execute,
+synthesize) are timed with time.perf_counter_ns, a monotonic clock. Each span feeds a
+per-stage latency histogram whether or not its trace is sampled, so p50/p95/p99 cover
+every question at the cost of one counter increment. Sampled traces keep their events
+and spans. Finished traces go to a bounded ring buffer (`Tracer.recent`) and,
+optionally, a JSONL sink written by a background thread, so tracing never blocks on
+file I/O.
+
+Histograms use log-spaced buckets (8 per power of two), so reported percentiles are
+within ~9% of the true value. They are mergeable, which lets batch workers ship their
+counts back to the parent.
+"""
+import contextvars
+import json
+import math
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+BUCKETS_PER_OCTAVE = 8
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int):
+        idx = int(math.log2(ns) * BUCKETS_PER_OCTAVE) if ns > 1 else 0
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, p: float) -> float:
+        """Upper bound (ns) of the bucket holding the p-th percentile, capped at the max."""
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(2.0 ** ((idx + 1) / BUCKETS_PER_OCTAVE), float(self.max_ns))
+        return float(self.max_ns)
+
+    def merge(self, other: "LatencyHistogram"):
+        for idx, n in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + n
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def summary(self) -> Dict[str, float]:
+        ms = 1e-6
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ns / self.count * ms, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * ms, 3),
+            "p95_ms": round(self.percentile(95) * ms, 3),
+            "p99_ms": round(self.percentile(99) * ms, 3),
+            "max_ms": round(self.max_ns * ms, 3),
+        }
+
+    def to_dict(self) -> Dict:
+        return {"counts": self.counts, "count": self.count, "total_ns": self.total_ns, "max_ns": self.max_ns}
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "LatencyHistogram":
+        h = cls()
+        h.counts = {int(k): v for k, v in d["counts"].items()}
+        h.count, h.total_ns, h.max_ns = d["count"], d["total_ns"], d["max_ns"]
+        return h
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "wall_start", "t0", "events", "spans", "duration_ms")
+
+    def __init__(self, trace_id: Any, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.wall_start = time.time()
+        self.t0 = time.perf_counter_ns()
+        self.events: List[Dict] = []
+        self.spans: List[Dict] = []
+        self.duration_ms = 0.0
+
+    def offset_ms(self, ns: int) -> float:
+        return round((ns - self.t0) / 1e6, 3)
+
+    def to_dict(self) -> Dict:
+        return {"trace_id": self.trace_id, "start": self.wall_start, "duration_ms": self.duration_ms,
+                "spans": self.spans, "events": self.events}
+
+
+class JsonlSink:
+    """Appends finished traces to a JSONL file from a background thread.
+
+    Each trace is written with a single write() on a file opened in append mode, so
+    several worker processes can share one path.
+    """
+
+    def __init__(self, path: str, max_pending: int = 10000):
+        self.path = path
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._drain, name="trace-sink", daemon=True)
+        self._thread.start()
+
+    def put(self, record: Dict):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Never stall the agent on a slow disk: drop and count instead
+            self.dropped += 1
+
+    def _drain(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    self._queue.task_done()
+                    break
+                f.write(json.dumps(record, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued trace is on disk (e.g. before a worker process exits)."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+class Tracer:
+    def __init__(self, capacity: int = 1000, sample_rate: float = 1.0, sink: Optional[JsonlSink] = None):
+        self.sample_rate = sample_rate
+        self.sink = sink
+        self.recent: Deque[Dict] = deque(maxlen=capacity)  # last finished sampled traces
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+        self._lock = threading.Lock()
+
+    def _sampled(self, trace_id: Any) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        if self.sample_rate <= 0.0:
+            return False
+        # Hash of the id rather than random(): the same question is sampled in every
+        # worker and on every rerun
+        return zlib.crc32(str(trace_id).encode("utf-8")) / 2 ** 32 < self.sample_rate
+
+    @contextmanager
+    def trace(self, trace_id: Any) -> Iterator[Trace]:
+        """One trace per question; spans and events inside it are attached to it."""
+        tr = Trace(trace_id, self._sampled(trace_id))
+        token = self._current.set(tr)
+        try:
+            with self.span("question"):
+                yield tr
+        finally:
+            self._current.reset(token)
+            tr.duration_ms = tr.offset_ms(time.perf_counter_ns())
+            if tr.sampled:
+                record = tr.to_dict()
+                self.recent.append(record)
+                if self.sink is not None:
+                    self.sink.put(record)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            with self._lock:
+                h = self.histograms.get(stage)
+                if h is None:
+                    h = self.histograms[stage] = LatencyHistogram()
+                h.record(end - start)
+            tr = self._current.get()
+            if tr is not None and tr.sampled:
+                tr.spans.append({"stage": stage, "start_ms": tr.offset_ms(start), "ms": round((end - start) / 1e6, 3)})
+
+    def event(self, kind: str, data: Dict):
+        """Attach a structured event to the current sampled trace (dropped otherwise)."""
+        tr = self._current.get()
+        if tr is not None and tr.sampled:
+            tr.events.append({"t_ms": tr.offset_ms(time.perf_counter_ns()), "kind": kind, "data": data})
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {stage: h.summary() for stage, h in self.histograms.items()}
+
+    def take_histograms(self) -> Dict[str, Dict]:
+        """Serializable histograms recorded since the last call (for merging in a parent)."""
+        with self._lock:
+            out = {stage: h.to_dict() for stage, h in self.histograms.items()}
+            self.histograms = {}
+        return out
+
+    def merge_histograms(self, histograms: Dict[str, Dict]):
+        with self._lock:
+            for stage, d in histograms.items():
+                self.histograms.setdefault(stage, LatencyHistogram()).merge(LatencyHistogram.from_dict(d))
+
+    def format_metrics(self) -> str:
+        lines = [f"{'stage':<16} {'count':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for stage, m in sorted(self.metrics().items(), key=lambda kv: -kv[1]["mean_ms"] * kv[1]["count"]):
+            lines.append(f"{stage:<16} {m['count']:>7} {m['mean_ms']:>9.3f} {m['p50_ms']:>9.3f} "
+                         f"{m['p95_ms']:>9.3f} {m['p99_ms']:>9.3f} {m['max_ms']:>9.3f}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
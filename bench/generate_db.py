@@ -0,0 +1,146 @@
+"""Deterministic scale-factor Northwind generator for benchmarks.
+
+The base (scale 1) is either a copy of an existing Northwind DB (`--source`) or a
+synthetic one with Northwind's shape: 8 categories, 77 products, 91 customers and 830
+orders / ~2,150 order lines between 1996-07-04 and 1998-05-06. Orders and
+"Order Details" are then replicated scale-1 more times, with OrderIDs shifted past the
+original range and each copy's OrderDate jittered by a deterministic -7..+7 days, so
+date-window queries see realistically spread data. The same arguments always produce
+the same DB.
+
+Usage (from the repo root):
+  python -m bench.generate_db --scale 100 --out bench/data/northwind_sf100.sqlite
+  python -m bench.generate_db --scale 10 --source data/northwind.sqlite --out bench/data/nw_sf10.sqlite
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+CATEGORIES = ['Beverages', 'Condiments', 'Confections', 'Dairy Products', 'Grains/Cereals', 'Meat/Poultry',
+              'Produce', 'Seafood']
+N_PRODUCTS = 77
+N_CUSTOMERS = 91
+N_ORDERS = 830
+FIRST_ORDER_ID = 10248
+FIRST_DAY = datetime.date(1996, 7, 4)
+LAST_DAY = datetime.date(1998, 5, 6)
+JITTER_DAYS = 7
+
+SCHEMA = """
+CREATE TABLE "Categories" (CategoryID INTEGER PRIMARY KEY, CategoryName TEXT, Description TEXT);
+CREATE TABLE "Customers" (CustomerID TEXT PRIMARY KEY, CompanyName TEXT, ContactName TEXT, City TEXT, Country TEXT);
+CREATE TABLE "Products" (ProductID INTEGER PRIMARY KEY, ProductName TEXT, SupplierID INTEGER, CategoryID INTEGER,
+                         QuantityPerUnit TEXT, UnitPrice REAL, UnitsInStock INTEGER, Discontinued INTEGER);
+CREATE TABLE "Orders" (OrderID INTEGER PRIMARY KEY, CustomerID TEXT, EmployeeID INTEGER, OrderDate TEXT,
+                       RequiredDate TEXT, ShippedDate TEXT, ShipVia INTEGER, Freight REAL);
+CREATE TABLE "Order Details" (OrderID INTEGER, ProductID INTEGER, UnitPrice REAL, Quantity INTEGER, Discount REAL,
+                              PRIMARY KEY (OrderID, ProductID));
+"""
+
+
+def _customer_code(rnd: random.Random, taken: set) -> str:
+    while True:
+        code = "".join(rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(5))
+        if code not in taken:
+            taken.add(code)
+            return code
+
+
+def synthesize_base(conn: sqlite3.Connection, seed: int):
+    """Scale-1 Northwind-shaped data from a seeded RNG."""
+    rnd = random.Random(seed)
+    conn.executescript(SCHEMA)
+    conn.executemany('INSERT INTO "Categories" VALUES (?, ?, ?)',
+                     [(i + 1, name, f"{name} products") for i, name in enumerate(CATEGORIES)])
+    taken: set = set()
+    customers = [(_customer_code(rnd, taken), f"Customer {i + 1:02d} Co.", f"Contact {i + 1}", f"City {i % 30}",
+                  f"Country {i % 21}") for i in range(N_CUSTOMERS)]
+    conn.executemany('INSERT INTO "Customers" VALUES (?, ?, ?, ?, ?)', customers)
+    products = []
+    for pid in range(1, N_PRODUCTS + 1):
+        price = round(rnd.lognormvariate(3.0, 0.8), 2)
+        products.append((pid, f"Product {pid:02d}", rnd.randint(1, 29), rnd.randint(1, len(CATEGORIES)),
+                         f"{rnd.randint(1, 48)} units", price, rnd.randint(0, 120), int(rnd.random() < 0.1)))
+    conn.executemany('INSERT INTO "Products" VALUES (?, ?, ?, ?, ?, ?, ?, ?)', products)
+    span = (LAST_DAY - FIRST_DAY).days
+    orders, lines = [], []
+    for i in range(N_ORDERS):
+        oid = FIRST_ORDER_ID + i
+        day = FIRST_DAY + datetime.timedelta(days=i * span // (N_ORDERS - 1))  # ordered by date, like Northwind
+        orders.append((oid, rnd.choice(customers)[0], rnd.randint(1, 9), day.isoformat(),
+                       (day + datetime.timedelta(days=28)).isoformat(),
+                       (day + datetime.timedelta(days=rnd.randint(1, 30))).isoformat(),
+                       rnd.randint(1, 3), round(rnd.uniform(0.1, 300.0), 2)))
+        for pid in rnd.sample(range(1, N_PRODUCTS + 1), rnd.choice([1, 2, 2, 3, 3, 3, 4, 5])):
+            lines.append((oid, pid, products[pid - 1][5], rnd.randint(1, 60),
+                          rnd.choice([0.0, 0.0, 0.0, 0.05, 0.1, 0.15, 0.2, 0.25])))
+    conn.executemany('INSERT INTO "Orders" VALUES (?, ?, ?, ?, ?, ?, ?, ?)', orders)
+    conn.executemany('INSERT INTO "Order Details" VALUES (?, ?, ?, ?, ?)', lines)
+    conn.commit()
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def replicate_facts(conn: sqlite3.Connection, scale: int):
+    """Append scale-1 shifted, date-jittered copies of Orders and their order lines."""
+    lo, hi = conn.execute('SELECT MIN(OrderID), MAX(OrderID) FROM "Orders"').fetchone()
+    span = hi - lo + 1
+    order_cols = _columns(conn, "Orders")
+    line_cols = _columns(conn, "Order Details")
+    quoted = lambda cols: ", ".join(f'"{c}"' for c in cols)  # noqa: E731
+    for k in range(1, scale):
+        # Jitter is a hash of (OrderID, copy), so it is reproducible without an RNG;
+        # timestamps keep their time part
+        shift = f"((OrderID * 2654435761 + {k} * 40503) % {2 * JITTER_DAYS + 1}) - {JITTER_DAYS}"
+        jittered = (f"CASE WHEN length(OrderDate) > 10 THEN datetime(OrderDate, ({shift}) || ' days') "
+                    f"ELSE date(OrderDate, ({shift}) || ' days') END")
+        select = [f"OrderID + {k * span}" if c == "OrderID" else jittered if c == "OrderDate" else f'"{c}"'
+                  for c in order_cols]
+        conn.execute(f'INSERT INTO "Orders" ({quoted(order_cols)}) SELECT {", ".join(select)} '
+                     f'FROM "Orders" WHERE OrderID BETWEEN ? AND ?', (lo, hi))
+        select = [f"OrderID + {k * span}" if c == "OrderID" else f'"{c}"' for c in line_cols]
+        conn.execute(f'INSERT INTO "Order Details" ({quoted(line_cols)}) SELECT {", ".join(select)} '
+                     f'FROM "Order Details" WHERE OrderID BETWEEN ? AND ?', (lo, hi))
+        conn.commit()
+
+
+def generate(out: str, scale: int = 10, source: Optional[str] = None, seed: int = 7) -> Dict:
+    t0 = time.perf_counter()
+    if os.path.exists(out):
+        os.remove(out)
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    conn = sqlite3.connect(out)
+    conn.execute("PRAGMA journal_mode = OFF")  # throwaway build: no rollback journal needed
+    conn.execute("PRAGMA synchronous = OFF")
+    if source:
+        src = sqlite3.connect(source)
+        src.backup(conn)
+        src.close()
+    else:
+        synthesize_base(conn, seed)
+    replicate_facts(conn, scale)
+    stats = {
+        "db": out, "scale": scale, "source": source, "seed": seed,
+        "orders": conn.execute('SELECT COUNT(*) FROM "Orders"').fetchone()[0],
+        "order_lines": conn.execute('SELECT COUNT(*) FROM "Order Details"').fetchone()[0],
+    }
+    conn.close()
+    stats["seconds"] = round(time.perf_counter() - t0, 2)
+    stats["mb"] = round(os.path.getsize(out) / 2 ** 20, 1)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=10, help="copies of Orders/Order Details (e.g. 10, 100, 1000)")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--source", default=None, help="Northwind DB to scale (default: synthetic base)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    print(generate(args.out, args.scale, args.source, args.seed))
@@ -0,0 +1,54 @@
+"""SQLite vs the in-memory NumPy KPI engine on the eval KPI queries.
+
+Times repeated runs of each template through SQLiteTool (result cache off) and through
+KpiEngine, after a one-off load of the engine's arrays, and checks that both agree.
+
+Usage (from the repo root):
+  python -m bench.kpi_engine --db data/northwind.sqlite --repeat 20
+"""
+import argparse
+import json
+import statistics
+import time
+
+from agent.tools.kpi_engine import KpiEngine, results_match
+from agent.tools.sqlite_tool import SQLiteTool
+from bench.sqlite_profile import eval_queries
+
+
+def _median_ms(fn, repeat: int) -> float:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(samples)
+
+
+def main(db: str, repeat: int):
+    tool = SQLiteTool(db)
+    engine = KpiEngine(tool)
+    t0 = time.perf_counter()
+    engine.run("aov_window", ())  # loads the arrays
+    load_ms = (time.perf_counter() - t0) * 1000.0
+    rows = []
+    for tid, sql, params in eval_queries():
+        sql_ms = _median_ms(lambda: list(tool.iter_rows(sql, params)[1]), repeat)
+        engine_ms = _median_ms(lambda: engine.run(tid, params), repeat)
+        rows.append({
+            "template": tid,
+            "sqlite_ms": round(sql_ms, 3),
+            "engine_ms": round(engine_ms, 4),
+            "speedup": round(sql_ms / engine_ms, 1) if engine_ms else None,
+            "match": results_match(engine.run(tid, params)[1], tool.run(sql, params)[1]),
+        })
+    print(json.dumps({"db": db, "engine_load_ms": round(load_ms, 1), "queries": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="data/northwind.sqlite")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.db, args.repeat)
@@ -0,0 +1,88 @@
+"""Closed-loop load generator for the agent service (agent/service.py).
+
+Opens --concurrency keep-alive HTTP connections (or JSON-lines connections with
+--protocol jsonl), each sending questions from a bench.workload stream one at a
+time. Reports throughput, client-side latency percentiles, the number of overloaded
+rejections and the service's own counters (computed vs coalesced answers).
+
+Usage (from the repo root, with the service running):
+  python -m agent.service --port 8765 &
+  python -m bench.service_load --port 8765 --requests 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from agent.tracing import LatencyHistogram
+from bench import workload
+
+
+async def _http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                payload: Dict = None) -> Dict:
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    out = json.loads(await reader.readexactly(length))
+    out["_status"] = status
+    return out
+
+
+async def _client(host: str, port: int, protocol: str, jobs: List[Dict], hist: LatencyHistogram, counts: Dict):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for job in jobs:
+            t0 = time.perf_counter_ns()
+            if protocol == "http":
+                out = await _http(reader, writer, "POST", "/answer", job)
+            else:
+                writer.write((json.dumps(job) + "\n").encode("utf-8"))
+                await writer.drain()
+                out = json.loads(await reader.readline())
+            hist.record(time.perf_counter_ns() - t0)
+            key = "overloaded" if out.get("error") == "overloaded" else "error" if "error" in out else "ok"
+            counts[key] += 1
+    finally:
+        writer.close()
+
+
+async def run(host: str, port: int, protocol: str, n: int, concurrency: int, seed: int) -> Dict:
+    jobs = list(workload.generate(n, seed))
+    hist = LatencyHistogram()
+    counts = {"ok": 0, "overloaded": 0, "error": 0}
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, protocol, jobs[i::concurrency], hist, counts)
+                           for i in range(concurrency)))
+    wall = time.perf_counter() - t0
+    result = {"requests": n, "concurrency": concurrency, "wall_s": round(wall, 3),
+              "throughput_rps": round(n / wall, 1), "latency": hist.summary(), **counts}
+    if protocol == "http":
+        reader, writer = await asyncio.open_connection(host, port)
+        metrics = await _http(reader, writer, "GET", "/metrics")
+        writer.close()
+        result["service"] = metrics["service"]
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--protocol", choices=["http", "jsonl"], default="http")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.host, args.port, args.protocol, args.requests, args.concurrency,
+                                     args.seed)), indent=2))
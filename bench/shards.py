@@ -0,0 +1,86 @@
+"""Single SQLite file vs scatter-gather over yearly shards on the KPI templates.
+
+Splits the DB into one shard per year with agent.tools.shards, unless --manifest points
+at an existing split. Then it times each eval KPI query, plus all-time and multi-year
+variants that span several shards, on the single file and through ShardedExecutor.
+It checks that both agree at the precision answers are rounded to (results_match).
+For each query it reports how many shards the window touched after pruning, and
+whether the merged result was near a half cent and re-run on the source DB (whose
+time is then part of sharded_ms).
+
+Usage (from the repo root):
+  python -m bench.shards --db bench/data/northwind_sf100.sqlite --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Optional
+
+from agent.templates import AOV_SQL, AOV_WINDOW_SQL, CATEGORY_REVENUE_SQL, TOP_CUSTOMER_MARGIN_SQL
+from agent.tools.kpi_engine import results_match
+from agent.tools.shards import ShardedExecutor, split
+from agent.tools.sqlite_tool import SQLiteTool
+from bench.sqlite_profile import eval_queries
+
+
+def _median_ms(fn, repeat: int) -> float:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(samples)
+
+
+def queries():
+    yield from eval_queries()
+    yield "aov_window", AOV_SQL + ";", ()
+    yield "aov_window", AOV_WINDOW_SQL, ("1996-09-01", "1998-02-28")
+    yield "category_revenue_window", CATEGORY_REVENUE_SQL + ";", ("Beverages",)
+    yield "top_customer_margin_1997", TOP_CUSTOMER_MARGIN_SQL, ("1996-01-01", "1998-12-31")
+
+
+def main(db: str, manifest: Optional[str], repeat: int, workers: Optional[int]):
+    tmp = None
+    if manifest is None:
+        tmp = tempfile.TemporaryDirectory()
+        t0 = time.perf_counter()
+        split(db, tmp.name)
+        print(f"split into shards in {time.perf_counter() - t0:.1f} s")
+        manifest = os.path.join(tmp.name, "manifest.json")
+    tool = SQLiteTool(db)
+    sharded = ShardedExecutor(manifest, workers=workers)
+    rows = []
+    for tid, sql, params in queries():
+        window = params[1:3] if tid == "category_revenue_window" else params[:2]
+        single_ms = _median_ms(lambda: tool.run(sql, params), repeat)
+        sharded_ms = _median_ms(lambda: sharded.run(tid, params), repeat)
+        rows.append({
+            "template": tid,
+            "params": params,
+            "shards": f"{len(sharded.prune(*window))}/{len(sharded.shards)}",
+            "single_ms": round(single_ms, 2),
+            "sharded_ms": round(sharded_ms, 2),
+            "speedup": round(single_ms / sharded_ms, 2) if sharded_ms else None,
+        })
+        before = sharded.rechecked
+        rows[-1]["match"] = results_match(sharded.run(tid, params)[1], tool.run(sql, params)[1])
+        rows[-1]["rechecked"] = sharded.rechecked > before
+    sharded.close()
+    print(json.dumps({"db": db, "workers": sharded.workers, "queries": rows}, indent=2))
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="data/northwind.sqlite")
+    parser.add_argument("--manifest", default=None, help="existing shard manifest (default: split --db into a temp dir)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="threads for scatter (default: one per shard, up to the CPU count)")
+    args = parser.parse_args()
+    main(args.db, args.manifest, args.repeat, args.workers)
@@ -0,0 +1,102 @@
+"""Before/after timings for the SQLite connection profile on the eval KPI queries.
+
+"before" is a default sqlite3.connect() with row_factory=sqlite3.Row and a tuple()
+conversion per row (the original SQLiteTool); "after" is SQLiteTool's read-only,
+PRAGMA-tuned pooled profile. Also times N threads sharing one locked connection vs
+the pool.
+
+Usage (from the repo root):
+  python -m bench.sqlite_profile --db data/northwind.sqlite --repeat 5 --threads 4
+  python -m bench.sqlite_profile --pragma cache_size=-65536 --pragma temp_store=MEMORY
+"""
+import argparse
+import json
+import sqlite3
+import statistics
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from agent.templates import REGISTRY
+from agent.tools.sqlite_tool import SQLiteTool
+
+SAMPLE_PATH = "sample_questions_hybrid_eval.jsonl"
+
+
+def eval_queries() -> List[Tuple[str, str, tuple]]:
+    """(template id, sql, params) for each SQL question of the eval set."""
+    out = []
+    with open(SAMPLE_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            features = REGISTRY.features(json.loads(line)["question"])
+            template = REGISTRY.match(features)
+            if template is None:
+                continue
+            plan = {"date_range": REGISTRY.date_range(features), "categories": REGISTRY.category_names(features)}
+            sql, params = template.render(plan)
+            out.append((template.id, sql, params))
+    return out
+
+
+def baseline_runner(db: str) -> Callable[[str, tuple], list]:
+    conn = sqlite3.connect(db, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    lock = threading.Lock()
+
+    def run(sql, params):
+        with lock:
+            return [tuple(r) for r in conn.execute(sql, params).fetchall()]
+    return run
+
+
+def tuned_runner(db: str, immutable: bool, pragmas: Dict[str, str]) -> Callable[[str, tuple], list]:
+    tool = SQLiteTool(db, immutable=immutable, pragmas=pragmas)
+    return lambda sql, params: tool.run(sql, params)[1]
+
+
+def _median_ms(fn: Callable[[], object], repeat: int) -> float:
+    fn()  # warm the page cache / statement cache
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(samples)
+
+
+def _concurrent_s(run: Callable[[str, tuple], list], queries, threads: int, rounds: int) -> float:
+    def worker():
+        for _ in range(rounds):
+            for _, sql, params in queries:
+                run(sql, params)
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def main(db: str, repeat: int, threads: int, immutable: bool, pragmas: Dict[str, str]):
+    queries = eval_queries()
+    profiles: Dict[str, Callable] = {"before": baseline_runner(db), "after": tuned_runner(db, immutable, pragmas)}
+    print(f"{'template':<32} {'before ms':>10} {'after ms':>10}")
+    for tid, sql, params in queries:
+        t = {name: _median_ms(lambda: run(sql, params), repeat) for name, run in profiles.items()}
+        print(f"{tid:<32} {t['before']:>10.2f} {t['after']:>10.2f}")
+    for name, run in profiles.items():
+        print(f"{threads} threads x {repeat} rounds, {name}: {_concurrent_s(run, queries, threads, repeat):.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=None, help="DB path (default: auto-detect in data/)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--immutable", action="store_true", help="open with immutable=1 in the tuned profile")
+    parser.add_argument("--pragma", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra PRAGMA for the tuned profile, e.g. --pragma temp_store=MEMORY")
+    args = parser.parse_args()
+    extra = dict(p.split("=", 1) for p in args.pragma)
+    main(args.db or SQLiteTool().db_path, args.repeat, args.threads, args.immutable, extra)
@@ -0,0 +1,94 @@
+"""Startup-time benchmark: import cost of the agent and time until a fresh process is ready.
+
+Runs `python -X importtime` on agent.graph_hybrid, reports the slowest imports and the
+median wall time of a fresh interpreter constructing a HybridAgent, and appends the
+numbers to a JSONL history file so regressions show up between commits.
+
+Usage (from the repo root):
+  python -m bench.startup
+  python -m bench.startup --runs 20 --history bench/startup_history.jsonl
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READY_SNIPPET = "from agent.graph_hybrid import HybridAgent; HybridAgent()"
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def import_times(module: str = "agent.graph_hybrid") -> List[Dict]:
+    """Per-module import times (microseconds) as reported by -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=REPO_ROOT, env=_env(), check=True)
+    out = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        out.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us),
+                    "depth": (len(name) - len(name.lstrip())) // 2})
+    return out
+
+
+def ready_time(runs: int) -> float:
+    """Median seconds for a fresh interpreter to import and construct a HybridAgent."""
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", READY_SNIPPET], cwd=REPO_ROOT, env=_env(), check=True)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=REPO_ROOT).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(runs: int, history: str, top: int):
+    ready_time(1)  # warm .pyc files so the first sample is not a compile
+    times = import_times()
+    root = next((t for t in times if t["module"] == "agent.graph_hybrid"), None)
+    heaviest = sorted((t for t in times if t["module"] != "agent.graph_hybrid"),
+                      key=lambda t: t["cumulative_us"], reverse=True)[:top]
+    record = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "import_ms": round(root["cumulative_us"] / 1000.0, 2) if root else None,
+        "ready_ms": round(ready_time(runs) * 1000.0, 2),
+        "heaviest_imports": [{"module": t["module"], "ms": round(t["cumulative_us"] / 1000.0, 2)} for t in heaviest],
+    }
+    print(f"import agent.graph_hybrid: {record['import_ms']} ms")
+    print(f"fresh process ready:      {record['ready_ms']} ms (median of {runs})")
+    for t in record["heaviest_imports"]:
+        print(f"  {t['ms']:8.2f} ms  {t['module']}")
+    if history:
+        os.makedirs(os.path.dirname(os.path.abspath(history)), exist_ok=True)
+        with open(history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--history", default=os.path.join(REPO_ROOT, "bench", "startup_history.jsonl"),
+                        help="JSONL file the result is appended to ('' to skip)")
+    parser.add_argument("--top", type=int, default=10, help="number of heaviest imports to list")
+    args = parser.parse_args()
+    main(args.runs, args.history, args.top)
@@ -0,0 +1,140 @@
+"""End-to-end benchmark of run_agent_hybrid.py on scaled Northwind DBs.
+
+For each scale factor: generate (or reuse) the DB with bench.generate_db and a
+question workload with bench.workload, run run_agent_hybrid.py on it in a fresh
+process, and record wall time, throughput, the per-stage latency percentiles the
+agent writes with --metrics-out, and peak RSS. Peak RSS is that of the largest
+process (the CLI or one pool worker), read from getrusage(RUSAGE_CHILDREN) in a
+wrapper process per run.
+
+Results go to one JSON file per run. Pass --compare with an earlier file to print
+per-scale throughput and stage p95 ratios.
+
+Usage (from the repo root):
+  python -m bench.suite --scales 10 100 --questions 2000
+  python -m bench.suite --scales 100 --workers 4 -- --kpi-engine on
+  python -m bench.suite --scales 10 --compare bench/results/<earlier>.json
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from bench import generate_db, workload
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs argv in a child and prints the child's peak RSS in KiB (bytes on macOS)
+RSS_WRAPPER = (
+    "import resource, subprocess, sys\n"
+    "rc = subprocess.run(sys.argv[1:]).returncode\n"
+    "print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss, file=sys.stderr)\n"
+    "sys.exit(rc)\n"
+)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_once(db: str, batch: str, workers: int, extra: List[str], workdir: str) -> Dict:
+    out = os.path.join(workdir, "answers.jsonl")
+    metrics = os.path.join(workdir, "metrics.json")
+    cmd = [sys.executable, "-c", RSS_WRAPPER, sys.executable, os.path.join(REPO_ROOT, "run_agent_hybrid.py"),
+           "--batch", batch, "--out", out, "--db", db, "--workers", str(workers), "--metrics-out", metrics, *extra]
+    t0 = time.perf_counter()
+    # The agent resolves docs/ relative to the working directory
+    proc = subprocess.run(cmd, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"run_agent_hybrid.py failed:\n{proc.stderr}")
+    rss = int(proc.stderr.strip().splitlines()[-1])
+    rss_mb = rss / 2 ** 20 if sys.platform == "darwin" else rss / 1024
+    with open(out, "r", encoding="utf-8") as f:
+        answers = [json.loads(line) for line in f]
+    with open(metrics, "r", encoding="utf-8") as f:
+        stages = json.load(f)
+    sql_cache = stages.pop("sql_cache", None)  # only present with --sql-cache
+    return {
+        "wall_s": round(wall, 3),
+        "throughput_qps": round(len(answers) / wall, 1) if wall else None,
+        "answered": sum(1 for a in answers if a.get("final_answer") not in ("", None)),
+        "peak_rss_mb": round(rss_mb, 1),
+        "stages": stages,
+        **({"sql_cache": sql_cache} if sql_cache is not None else {}),
+    }
+
+
+def compare(current: Dict, previous: Dict):
+    prev = {r["scale"]: r for r in previous["runs"]}
+    for run in current["runs"]:
+        old = prev.get(run["scale"])
+        if old is None:
+            continue
+        print(f"scale {run['scale']}: throughput {old['throughput_qps']} -> {run['throughput_qps']} q/s "
+              f"({run['throughput_qps'] / old['throughput_qps']:.2f}x)")
+        for stage, m in sorted(run["stages"].items()):
+            o = old["stages"].get(stage)
+            if o and o["p95_ms"]:
+                print(f"  {stage:<16} p95 {o['p95_ms']:>9.3f} -> {m['p95_ms']:>9.3f} ms ({m['p95_ms'] / o['p95_ms']:.2f}x)")
+
+
+def main(scales: List[int], questions: int, workers: int, data_dir: str, results_dir: str, source: Optional[str],
+         extra: List[str], compare_path: Optional[str]):
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(results_dir, exist_ok=True)
+    batch = os.path.join(data_dir, f"workload_{questions}.jsonl")
+    if not os.path.exists(batch):
+        workload.write(batch, questions)
+    result = {
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "questions": questions,
+        "workers": workers,
+        "args": extra,
+        "runs": [],
+    }
+    for scale in scales:
+        name = f"northwind_sf{scale}" + ("_src" if source else "") + ".sqlite"
+        db = os.path.join(data_dir, name)
+        if not os.path.exists(db):
+            print(f"generating {db} ...")
+            print(generate_db.generate(db, scale, source))
+        with tempfile.TemporaryDirectory() as tmp:
+            run = run_once(db, batch, workers, extra, tmp)
+        run["scale"] = scale
+        result["runs"].append(run)
+        print(f"scale {scale}: {run['throughput_qps']} q/s, {run['wall_s']} s, peak {run['peak_rss_mb']} MB")
+    path = os.path.join(results_dir, result["time"].replace(":", "") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {path}")
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     epilog="Arguments after -- are passed to run_agent_hybrid.py.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10], help="scale factors, e.g. 10 100 1000")
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--source", default=None, help="Northwind DB to scale (default: synthetic base)")
+    parser.add_argument("--data-dir", default=os.path.join(REPO_ROOT, "bench", "data"))
+    parser.add_argument("--results-dir", default=os.path.join(REPO_ROOT, "bench", "results"))
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    args, extra = parser.parse_known_args()
+    if extra and extra[0] == "--":
+        extra = extra[1:]
+    main(args.scales, args.questions, args.workers, args.data_dir, args.results_dir, args.source, extra, args.compare)
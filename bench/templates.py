@@ -0,0 +1,72 @@
+"""Micro-benchmark: NL->SQL template matching cost as the registry grows.
+
+Pads the KPI registry with synthetic templates (random two-word trigger phrases) and
+times features()+match() over the eval questions, next to a naive scan that checks
+every template's phrases with `in` (what the old if-chain did). The registry should
+stay flat while the naive scan grows linearly.
+
+Usage (from the repo root):
+  python -m bench.templates
+  python -m bench.templates --sizes 5 50 500 2000 --repeat 2000
+"""
+import argparse
+import json
+import random
+import time
+from typing import List
+
+from agent.templates import CALENDAR_WINDOWS, KPI_TEMPLATES, REGISTRY, Template, TemplateRegistry, normalize
+
+SAMPLE_PATH = "sample_questions_hybrid_eval.jsonl"
+
+
+def synthetic_templates(n: int, seed: int = 0) -> List[Template]:
+    rnd = random.Random(seed)
+    vocab = [f"{a}{b}" for a in ("net", "gross", "avg", "max", "min", "unit", "order", "ship")
+             for b in ("sales", "volume", "price", "count", "freight", "lead", "stock", "share")]
+    out = []
+    for i in range(n):
+        groups = tuple(tuple(f"{rnd.choice(vocab)} {rnd.choice(vocab)}" for _ in range(2)) for _ in range(2))
+        out.append(Template(f"synthetic_{i}", (groups,), lambda plan: ("", ())))
+    return out
+
+
+def naive_match(templates: List[Template], question: str):
+    q = normalize(question)
+    for t in templates:
+        for clause in t.when:
+            if all(any(p in q for p in group) for group in clause):
+                return t
+    return None
+
+
+def _time(fn, questions: List[str], repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in questions:
+            fn(q)
+    return (time.perf_counter() - t0) / (repeat * len(questions)) * 1e6
+
+
+def main(sizes: List[int], repeat: int):
+    with open(SAMPLE_PATH, "r", encoding="utf-8") as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip()]
+    print(f"{'templates':>10} {'registry us/q':>14} {'naive us/q':>11}")
+    for n in sizes:
+        # Synthetic templates go last so the KPI templates keep their priority
+        templates = KPI_TEMPLATES + synthetic_templates(max(0, n - len(KPI_TEMPLATES)))
+        registry = TemplateRegistry(templates, windows=CALENDAR_WINDOWS, categories=REGISTRY.categories)
+        for q in questions:
+            got, want = registry.match(registry.features(q)), naive_match(templates, q)
+            assert (got and got.id) == (want and want.id), q
+        reg_us = _time(lambda q: registry.match(registry.features(q)), questions, repeat)
+        naive_us = _time(lambda q: naive_match(templates, q), questions, repeat)
+        print(f"{len(templates):>10} {reg_us:>14.2f} {naive_us:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+    main(args.sizes, args.repeat)
@@ -0,0 +1,92 @@
+"""Deterministic question-workload generator for benchmarks.
+
+Questions are drawn from paraphrase families of the eval questions with the date
+window, category and year varied, so a workload exercises every KPI template, the
+RAG-only path and the no-template fallback (e.g. a category the templates do not
+cover) in fixed proportions. Output lines have the same {id, question, format_hint}
+shape as sample_questions_hybrid_eval.jsonl.
+
+Usage (from the repo root):
+  python -m bench.workload --n 2000 --out bench/data/workload_2000.jsonl
+"""
+import argparse
+import json
+import random
+from typing import Dict, Iterator, List, Tuple
+
+from agent.templates import CATEGORIES
+
+WINDOWS = [
+    ("'Summer Beverages 1997'", "summer"),
+    ("'Winter Classics 1997'", "winter"),
+]
+YEARS = ["1996", "1997", "1998"]
+
+# family -> (weight, format_hint, paraphrases); slots: {window}, {category}, {year}
+FAMILIES: Dict[str, Tuple[int, str, List[str]]] = {
+    "policy": (1, "int", [
+        "According to the product policy, what is the return window (days) for unopened {category}? Return an integer.",
+        "Per the product policy, how many days do customers have to return unopened {category}?",
+    ]),
+    "top_category_quantity": (2, "{category:str, quantity:int}", [
+        "During {window} as defined in the marketing calendar, which product category had the highest total "
+        "quantity sold? Return {{category:str, quantity:int}}.",
+        "Which category was the most sold during {window}?",
+        "Top category by units during the {window} campaign (June)?",
+    ]),
+    "aov": (3, "float", [
+        "Using the AOV definition from the KPI docs, what was the Average Order Value during {window}? "
+        "Return a float rounded to 2 decimals.",
+        "What was the average order value over the {window} dates?",
+        "AOV for {window}, per the KPI docs?",
+    ]),
+    "top3_products": (2, "list[{product:str, revenue:float}]", [
+        "Top 3 products by total revenue all-time. Revenue uses Order Details: SUM(UnitPrice*Quantity*(1-Discount)). "
+        "Return list[{{product:str, revenue:float}}].",
+        "What are the top three products by revenue?",
+        "List the top 3 product names ranked by revenue.",
+    ]),
+    "category_revenue": (3, "float", [
+        "Total revenue from the '{category}' category during {window} dates. Return a float rounded to 2 decimals.",
+        "What was the total revenue for {category} over the {window} date range?",
+    ]),
+    "customer_margin": (2, "{customer:str, margin:float}", [
+        "Per the KPI definition of gross margin, who was the top customer by gross margin in {year}? Assume "
+        "CostOfGoods is approximated by 70% of UnitPrice if not available. Return {{customer:str, margin:float}}.",
+        "Which was the best customer by gross margin in {year}?",
+    ]),
+}
+
+
+def generate(n: int, seed: int = 11) -> Iterator[Dict]:
+    rnd = random.Random(seed)
+    names = list(FAMILIES)
+    weights = [FAMILIES[f][0] for f in names]
+    for i in range(n):
+        family = rnd.choices(names, weights)[0]
+        _, format_hint, paraphrases = FAMILIES[family]
+        question = rnd.choice(paraphrases).format(
+            window=rnd.choice(WINDOWS)[0],
+            # Beverages dominates, as in the eval set; other categories hit the fallback paths
+            category="Beverages" if rnd.random() < 0.6 else rnd.choice(CATEGORIES),
+            year=rnd.choice(YEARS) if rnd.random() < 0.3 else "1997",
+        )
+        yield {"id": f"{family}_{i:06d}", "question": question, "format_hint": format_hint}
+
+
+def write(path: str, n: int, seed: int = 11) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for q in generate(n, seed):
+            f.write(json.dumps(q) + "\n")
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1000, help="number of questions")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    print(f"wrote {write(args.out, args.n, args.seed)} questions to {args.out}")
@@ -1,40 +1,225 @@
 """CLI entrypoint for the hybrid agent.
 Usage:
   python run_agent_hybrid.py --batch sample_questions_hybrid_eval.jsonl --out outputs_hybrid.jsonl
+  python run_agent_hybrid.py --batch big_batch.jsonl --out outputs.jsonl --workers 8
+  python run_agent_hybrid.py --batch big_batch.jsonl --out outputs.jsonl --resume
+  python run_agent_hybrid.py --batch big_batch.jsonl --out outputs.jsonl --rollups data/northwind_rollups.sqlite
+  python run_agent_hybrid.py --batch big_batch.jsonl --out outputs.jsonl --trace-out traces.jsonl --trace-sample 0.1
+  python run_agent_hybrid.py --batch big_batch.jsonl --out outputs.jsonl --fuse --chunksize 64
+  python run_agent_hybrid.py --batch big_batch.jsonl --out outputs.jsonl --shards data/shards/manifest.json
 """
 import argparse
+import itertools
 import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from agent.graph_hybrid import HybridAgent
+from agent.rag.retrieval import Retriever
+from agent.runner import answer_record, make_agent, make_tracer
+from agent.tools.rollups import RollupStore
+from agent.tools.sql_cache import cache_stats, open_cache
+from agent.tracing import Tracer
 
+# Per-process agent used by pool workers (set by _init_worker)
+_worker_agent: Optional[HybridAgent] = None
 
-def main(batch_path: str, out_path: str):
-    agent = HybridAgent()
-    outputs = []
+
+def _init_worker(retriever: Retriever, db_path: Optional[str], cache_path: Optional[str], cache_size: int,
+                 rollups_path: Optional[str], kpi_engine: str, trace_path: Optional[str], sample_rate: float,
+                 time_budget: Optional[float], answer_cache_size: int, answer_ttl: Optional[float],
+                 shards_path: Optional[str]):
+    # Each worker owns its own agent and SQLite connection; the retriever index is
+    # built once in the parent and handed over instead of being re-fitted per worker.
+    # Worker trace sinks append to the same file (one write() per trace).
+    global _worker_agent
+    _worker_agent = make_agent(db_path, retriever, cache_path, cache_size, rollups_path, kpi_engine,
+                               make_tracer(trace_path, sample_rate), time_budget, answer_cache_size, answer_ttl,
+                               shards_path)
+
+
+def _answer_chunk(agent: HybridAgent, jobs: List[Dict], docs: List[List[Dict]], fuse: bool) -> List[Dict]:
+    # With fuse, same-shape KPI questions in the chunk share one fused query (HybridAgent.fuse)
+    prefetched = agent.fuse(_questions(jobs)) if fuse else [None] * len(jobs)
+    return [answer_record(agent, job, d, p) for job, d, p in zip(jobs, docs, prefetched)]
+
+
+def _run_jobs(jobs: List[Dict], docs: List[List[Dict]],
+              fuse: bool = False) -> Tuple[List[Dict], Dict, Optional[Dict[str, int]]]:
+    # Stage histograms and SQL cache hit/miss counts for this chunk travel back with its results
+    results = _answer_chunk(_worker_agent, jobs, docs, fuse)
+    if _worker_agent.tracer.sink is not None:
+        _worker_agent.tracer.sink.flush()
+    cache = _worker_agent.sql_cache
+    return results, _worker_agent.tracer.take_histograms(), cache.take_counts() if cache is not None else None
+
+
+def _questions(jobs: List[Dict]) -> List[str]:
+    return [job.get('question') or '' for job in jobs]
+
+
+def _iter_jobs(batch_path: str, skip_ids: Set) -> Iterator[Dict]:
+    # Read the batch lazily so memory does not grow with its size
     with open(batch_path, 'r', encoding='utf-8') as f:
         for line in f:
+            if not line.strip():
+                continue
             job = json.loads(line)
-            qid = job.get('id')
-            question = job.get('question')
-            fmt = job.get('format_hint')
-            res = agent.repair_and_run(qid, question, fmt)
-            out = {
-                'id': qid,
-                'final_answer': res.get('final_answer'),
-                'sql': res.get('sql', ''),
-                'confidence': res.get('confidence', 0.0),
-                'explanation': res.get('explanation', '')[:200],
-                'citations': res.get('citations', []),
-            }
-            outputs.append(out)
-
-    with open(out_path, 'w', encoding='utf-8') as fo:
-        for o in outputs:
-            fo.write(json.dumps(o) + "\n")
+            if job.get('id') in skip_ids:
+                continue
+            yield job
+
+
+def _completed_ids(out_path: str) -> Set:
+    """Return ids already answered in out_path, dropping a partially written last line."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    good_end = 0
+    with open(out_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                done.add(json.loads(line).get('id'))
+            except ValueError:
+                break
+            good_end += len(line)
+        size = f.seek(0, os.SEEK_END)
+    if good_end < size:
+        # A crash mid-write leaves a torn record; cut it so appends stay valid JSONL
+        with open(out_path, 'r+b') as f:
+            f.truncate(good_end)
+    return done
+
+
+def _batched(items: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _pool_results(pool: ProcessPoolExecutor, retriever: Retriever, jobs: Iterable[Dict], chunksize: int,
+                  window: int, tracer: Tracer, fuse: bool = False,
+                  cache_counts: Optional[Dict[str, int]] = None) -> Iterator[Dict]:
+    # Keep at most `window` chunks in flight and yield them in submission order,
+    # so output stays in input order without reading the whole batch up front.
+    # Retrieval for each chunk runs here, batched, against the shared index.
+    pending = deque()
+
+    def collect(future) -> List[Dict]:
+        results, histograms, counts = future.result()
+        tracer.merge_histograms(histograms)
+        if counts is not None and cache_counts is not None:
+            for name, n in counts.items():
+                cache_counts[name] = cache_counts.get(name, 0) + n
+        return results
+
+    for chunk in _batched(jobs, chunksize):
+        with tracer.span('retrieve_many'):
+            docs = [[c for c, _ in res] for res in retriever.retrieve_many(_questions(chunk), k=3)]
+        pending.append(pool.submit(_run_jobs, chunk, docs, fuse))
+        if len(pending) >= window:
+            yield from collect(pending.popleft())
+    while pending:
+        yield from collect(pending.popleft())
+
+
+def _write_results(fo, results: Iterable[Dict]):
+    # Flush every record so a crash loses at most the question in flight
+    for o in results:
+        fo.write(json.dumps(o) + "\n")
+        fo.flush()
+
+
+def main(batch_path: str, out_path: str, workers: int = 1, db_path: Optional[str] = None,
+         resume: bool = False, chunksize: int = 16, cache_path: Optional[str] = None, cache_size: int = 1024,
+         index_dir: Optional[str] = None, rollups_path: Optional[str] = None, kpi_engine: str = "off",
+         trace_path: Optional[str] = None, trace_sample: float = 1.0, metrics_path: Optional[str] = None,
+         time_budget: Optional[float] = None, fuse: bool = False, answer_cache_size: int = 0,
+         answer_ttl: Optional[float] = 3600.0, shards_path: Optional[str] = None):
+    if rollups_path:
+        # Catch the rollups up with orders added since the last run (once, before any worker starts)
+        print(f"[rollups] {RollupStore(rollups_path, db_path).refresh()}")
+    if cache_path and workers > 1:
+        # Create the cache file and switch it to WAL here: workers doing that at the same
+        # time on a new file can fail with "database is locked" (no busy wait for it)
+        open_cache(cache_path, cache_size).close()
+    skip_ids = _completed_ids(out_path) if resume else set()
+    jobs = _iter_jobs(batch_path, skip_ids)
+
+    sql_cache = None  # hit/miss stats of the SQL result cache, when one is used
+    with open(out_path, 'a' if resume else 'w', encoding='utf-8') as fo:
+        retriever = Retriever(index_dir=index_dir)
+        if workers <= 1:
+            tracer = make_tracer(trace_path, trace_sample)
+            agent = make_agent(db_path, retriever, cache_path, cache_size, rollups_path, kpi_engine, tracer,
+                               time_budget, answer_cache_size, answer_ttl, shards_path)
+            results = (o for chunk in _batched(jobs, chunksize)
+                       for o in _answer_chunk(agent, chunk, agent.retrieve_many(_questions(chunk), k=3), fuse))
+            _write_results(fo, results)
+            if agent.sql_cache is not None:
+                sql_cache = agent.sql_cache.stats()
+        else:
+            # Parent tracer only aggregates stage histograms; traces are written by the workers
+            tracer = Tracer(sample_rate=0.0)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(retriever, db_path, cache_path, cache_size, rollups_path,
+                                               kpi_engine, trace_path, trace_sample, time_budget, answer_cache_size,
+                                               answer_ttl, shards_path)) as pool:
+                counts = {"hits": 0, "misses": 0}
+                _write_results(fo, _pool_results(pool, retriever, jobs, chunksize, workers * 2, tracer, fuse, counts))
+            if cache_path:
+                sql_cache = cache_stats(counts["hits"], counts["misses"])
+    tracer.close()
+    print(tracer.format_metrics())
+    if sql_cache is not None:
+        print(f"sql cache: {sql_cache['hits']} hits, {sql_cache['misses']} misses "
+              f"({sql_cache['hit_rate']:.1%} hit rate)")
+    if metrics_path:
+        metrics = tracer.metrics()
+        if sql_cache is not None:
+            metrics["sql_cache"] = sql_cache
+        with open(metrics_path, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, indent=2)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--batch', required=True)
     parser.add_argument('--out', required=True)
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1, in-process)')
+    parser.add_argument('--db', default=None, help='path to the Northwind SQLite DB (default: auto-detect in data/)')
+    parser.add_argument('--resume', action='store_true', help='skip ids already present in --out and append to it')
+    parser.add_argument('--chunksize', type=int, default=16, help='questions retrieved together and sent to a worker at a time')
+    parser.add_argument('--sql-cache', default=None, help='path of an on-disk SQL result cache shared across runs')
+    parser.add_argument('--sql-cache-size', type=int, default=1024, help='max cached results before LRU eviction')
+    parser.add_argument('--index-dir', default=None, help='directory to persist the docs index in (rebuilt incrementally)')
+    parser.add_argument('--rollups', default=None,
+                        help='daily rollup file; refreshed at start and used for date-window KPIs')
+    parser.add_argument('--kpi-engine', choices=['off', 'on', 'check'], default='off',
+                        help='answer KPI templates from in-memory NumPy arrays; "check" also compares with SQLite')
+    parser.add_argument('--trace-out', default=None, help='append sampled per-question traces to this JSONL file')
+    parser.add_argument('--trace-sample', type=float, default=1.0, help='fraction of questions whose traces are kept')
+    parser.add_argument('--metrics-out', default=None, help='write per-stage latency percentiles to this JSON file')
+    parser.add_argument('--time-budget', type=float, default=30.0,
+                        help='seconds per question; SQL still running after it is cancelled (0: unbounded)')
+    parser.add_argument('--fuse', action='store_true',
+                        help='answer same-shape KPI questions in a chunk with one fused query (see --chunksize)')
+    parser.add_argument('--answer-cache-size', type=int, default=0,
+                        help='cache whole answers by resolved intent, so paraphrases reuse them (0: off)')
+    parser.add_argument('--answer-cache-ttl', type=float, default=3600.0,
+                        help='seconds a cached answer stays valid (0: until the DB or docs change)')
+    parser.add_argument('--shards', default=None,
+                        help='manifest of time-partitioned shard DBs (agent.tools.shards); KPIs run scatter-gather on them')
     args = parser.parse_args()
-    main(args.batch, args.out)
+    main(args.batch, args.out, workers=args.workers, db_path=args.db, resume=args.resume, chunksize=args.chunksize,
+         cache_path=args.sql_cache, cache_size=args.sql_cache_size, index_dir=args.index_dir,
+         rollups_path=args.rollups, kpi_engine=args.kpi_engine, trace_path=args.trace_out,
+         trace_sample=args.trace_sample, metrics_path=args.metrics_out, time_budget=args.time_budget or None, fuse=args.fuse,
+         answer_cache_size=args.answer_cache_size, answer_ttl=args.answer_cache_ttl or None,
+         shards_path=args.shards)
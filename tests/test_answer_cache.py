@@ -0,0 +1,123 @@
+"""The answer cache against uncached answers, and when its entries go stale.
+
+A hit must return exactly what the agent would compute without the cache. Changing
+the DB or a file in docs/, or letting the TTL pass, makes the next question miss and
+recompute. Each test uses its own copy of the DB and docs.
+"""
+import os
+import shutil
+import sqlite3
+import time
+
+import pytest
+
+from agent.rag.retrieval import Retriever
+from agent.runner import make_agent
+from bench.generate_db import generate
+
+AOV = "Using the AOV definition from the KPI docs, what was the Average Order Value during 'Winter Classics 1997'?"
+AOV_PARAPHRASE = "AOV for Winter Classics 1997?"
+AOV_SUMMER = "Average order value over the 'Summer Beverages 1997' dates?"
+MARGIN = "Per the KPI definition of gross margin, who was the top customer by gross margin in 1997?"
+POLICY = "According to the product policy, what is the return window (days) for unopened Beverages?"
+DOCS = os.path.join(os.path.dirname(__file__), os.pardir, "docs")
+
+
+@pytest.fixture(scope="module")
+def base_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "northwind_sf2.sqlite")
+    generate(path, scale=2)
+    return path
+
+
+@pytest.fixture
+def db(base_db, tmp_path):
+    path = str(tmp_path / "northwind.sqlite")
+    shutil.copy(base_db, path)
+    return path
+
+
+@pytest.fixture
+def docs(tmp_path):
+    path = str(tmp_path / "docs")
+    shutil.copytree(DOCS, path)
+    return path
+
+
+def _agent(db, docs, ttl=None):
+    agent = make_agent(db, Retriever(docs_path=docs), answer_cache_size=64, answer_ttl=ttl)
+    agent.answer_cache.recheck = 0  # notice file changes at once
+    return agent
+
+
+def _uncached(db, docs, question, format_hint):
+    return make_agent(db, Retriever(docs_path=docs)).repair_and_run("q", question, format_hint)
+
+
+def test_hits_match_uncached_answers(db, docs):
+    agent = _agent(db, docs)
+    for question, paraphrase, hint in [(AOV, AOV_PARAPHRASE, "float"),
+                                       (MARGIN, MARGIN.lower(), "{customer:str, margin:float}")]:
+        first = agent.repair_and_run("q", question, hint)
+        assert first == _uncached(db, docs, question, hint)
+        misses = agent.answer_cache.misses
+        assert agent.repair_and_run("q", paraphrase, hint) == first
+        assert agent.answer_cache.misses == misses
+    assert agent.answer_cache.hits == 2
+
+
+def test_different_intent_misses(db, docs):
+    agent = _agent(db, docs)
+    winter = agent.repair_and_run("q", AOV, "float")
+    summer = agent.repair_and_run("q", AOV_SUMMER, "float")
+    assert summer == _uncached(db, docs, AOV_SUMMER, "float") and summer["params"] != winter["params"]
+    # Same intent, another format: a separate entry
+    agent.repair_and_run("q", AOV, "int")
+    assert agent.answer_cache.hits == 0 and agent.answer_cache.stats()["entries"] == 3
+
+
+def test_rag_only_answers_not_cached(db, docs):
+    agent = _agent(db, docs)
+    for _ in range(2):
+        assert agent.repair_and_run("q", POLICY, "int")["final_answer"] == 14
+    assert agent.answer_cache.stats() == {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0}
+
+
+def test_db_change_invalidates(db, docs):
+    agent = _agent(db, docs)
+    before = agent.repair_and_run("q", AOV, "float")
+    conn = sqlite3.connect(db)
+    conn.execute('UPDATE "Order Details" SET Quantity = Quantity * 2')
+    conn.commit()
+    conn.close()
+    after = agent.repair_and_run("q", AOV, "float")
+    assert agent.answer_cache.hits == 0
+    assert after == _uncached(db, docs, AOV, "float") and after["final_answer"] != before["final_answer"]
+
+
+def test_docs_change_invalidates(db, docs):
+    agent = _agent(db, docs)
+    agent.repair_and_run("q", AOV, "float")
+    with open(f"{docs}/kpi_definitions.md", "a", encoding="utf-8") as f:
+        f.write("\nRevised: AOV excludes cancelled orders.\n")
+    agent.repair_and_run("q", AOV, "float")
+    assert agent.answer_cache.hits == 0 and agent.answer_cache.misses == 2
+
+
+def test_ttl_expires(db, docs):
+    agent = _agent(db, docs, ttl=0.05)
+    agent.repair_and_run("q", AOV, "float")
+    agent.repair_and_run("q", AOV, "float")
+    time.sleep(0.1)
+    agent.repair_and_run("q", AOV, "float")
+    assert agent.answer_cache.hits == 1 and agent.answer_cache.misses == 2
+
+
+def test_callers_cannot_edit_cached_answers(db, docs):
+    agent = _agent(db, docs)
+    agent.repair_and_run("q", AOV, "float")
+    hit = agent.repair_and_run("q", AOV, "float")
+    expected = dict(hit, citations=list(hit["citations"]))
+    hit["final_answer"] = -1
+    hit["citations"].append("edited")
+    assert agent.repair_and_run("q", AOV, "float") == expected
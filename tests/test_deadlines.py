@@ -0,0 +1,126 @@
+"""Per-question deadlines and the negative-result memo.
+
+A query past its deadline is cancelled inside SQLite and reported as a "timeout:"
+error. The memo skips queries that are known to fail on the current DB: syntax and
+schema errors, empty results and timeouts. A timeout is skipped only while the new
+budget is no larger. Any change to the DB file gives the query a fresh chance.
+"""
+import shutil
+import sqlite3
+import time
+
+import pytest
+
+from agent.runner import make_agent
+from agent.templates import AOV_WINDOW_SQL, TOP_CUSTOMER_MARGIN_SQL
+from agent.tools.sqlite_tool import SQLiteTool, classify_error
+from bench.generate_db import generate
+
+# Runs for far longer than any test budget unless cancelled
+SLOW_SQL = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n LIMIT 1000000000) "
+            "SELECT COUNT(*) FROM n")
+MISSING_SQL = 'SELECT COUNT(*) FROM "Returns"'
+AOV_QUESTION = "What was the Average Order Value during 'Winter Classics 1997'?"
+WINTER = ("1997-12-01", "1997-12-31")
+
+
+@pytest.fixture(scope="module")
+def base_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "northwind_sf2.sqlite")
+    generate(path, scale=2)
+    return path
+
+
+@pytest.fixture
+def db(base_db, tmp_path):
+    path = str(tmp_path / "northwind.sqlite")
+    shutil.copy(base_db, path)
+    return path
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Patch an agent's SQLiteTool.run to record every query that reaches SQLite."""
+    calls = []
+
+    def patch(agent):
+        run = agent.sqlite.run
+
+        def counted(sql, params=(), deadline=None):
+            calls.append(sql)
+            return run(sql, params, deadline)
+
+        monkeypatch.setattr(agent.sqlite, "run", counted)
+        return calls
+    return patch
+
+
+def test_query_cancelled_at_the_deadline(db):
+    tool = SQLiteTool(db, pool_size=1)
+    start = time.monotonic()
+    cols, rows, err = tool.run(SLOW_SQL, deadline=start + 0.1)
+    assert time.monotonic() - start < 2
+    assert rows == [] and err.startswith("timeout:") and classify_error(err) == "timeout"
+    # The deadline has already passed: nothing is started
+    assert tool.run("SELECT 1", deadline=time.monotonic() - 1)[2].startswith("timeout:")
+    # The connection is reused without the cancelled query's progress handler
+    assert tool.run(TOP_CUSTOMER_MARGIN_SQL, ("1997-01-01", "1997-12-31"))[2] is None
+    tool.close()
+
+
+def test_deadline_does_not_change_results(db):
+    tool = SQLiteTool(db)
+    for sql, params in [(AOV_WINDOW_SQL, WINTER), (TOP_CUSTOMER_MARGIN_SQL, ("1997-01-01", "1997-12-31"))]:
+        assert tool.run(sql, params, deadline=time.monotonic() + 30) == tool.run(sql, params)
+    tool.close()
+
+
+def test_schema_error_memoized_until_the_db_changes(db, runs):
+    agent = make_agent(db)
+    calls = runs(agent)
+    first = agent.execute_sql(MISSING_SQL)
+    assert classify_error(first[2]) == "schema"
+    assert agent.execute_sql(MISSING_SQL) == first
+    assert len(calls) == 1 and agent.negative_memo.hits == 1
+    conn = sqlite3.connect(db)
+    conn.execute('CREATE TABLE "Returns" (OrderID INTEGER)')
+    conn.commit()
+    conn.close()
+    cols, rows, err = agent.execute_sql(MISSING_SQL)
+    assert len(calls) == 2 and err == "" and rows == [(0,)]
+
+
+def test_empty_result_memoized(db, runs):
+    agent = make_agent(db)
+    calls = runs(agent)
+    sql = 'SELECT OrderID FROM "Orders" WHERE OrderDate BETWEEN ? AND ?'
+    for _ in range(3):
+        assert agent.execute_sql(sql, ("1990-01-01", "1990-12-31"))[1:] == ([], "")
+    assert len(calls) == 1
+    # Other params are a different query
+    assert agent.execute_sql(sql, WINTER)[1]
+    assert len(calls) == 2
+
+
+def test_timeout_memoized_only_for_no_larger_budget(db, runs):
+    agent = make_agent(db)
+    calls = runs(agent)
+    err = agent.execute_sql(SLOW_SQL, deadline=time.monotonic() + 0.2)[2]
+    assert classify_error(err) == "timeout"
+    # Less time than the run that timed out: skipped
+    assert agent.execute_sql(SLOW_SQL, deadline=time.monotonic() + 0.05)[2] == err
+    assert len(calls) == 1 and agent.negative_memo.hits == 1
+    # More time: tried again
+    assert classify_error(agent.execute_sql(SLOW_SQL, deadline=time.monotonic() + 0.4)[2]) == "timeout"
+    assert len(calls) == 2
+
+
+def test_question_timeout_is_not_retried(db, runs, monkeypatch):
+    agent = make_agent(db, time_budget=0.3)
+    calls = runs(agent)
+    monkeypatch.setattr(agent, "nl2sql", lambda question, plan: (SLOW_SQL, ()))
+    start = time.monotonic()
+    res = agent.repair_and_run("q", AOV_QUESTION, "float", docs=[])
+    assert time.monotonic() - start < 2
+    assert res["explanation"] == "Failed after repairs (timeout)" and res["sql"] == SLOW_SQL
+    assert len(calls) == 1
@@ -0,0 +1,165 @@
+"""Fused batch SQL and sharded scatter-gather against the single-question template SQL.
+
+Both rewrite a template into a different query (one statement over many windows, or
+partial aggregates merged in Python), so each result is checked against running the
+template itself on a generated DB, compared at answer precision (results_match). A
+sharded result re-run on the source DB because it was near a half cent must be
+exactly the template's.
+"""
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from agent.templates import (AOV_SQL, AOV_WINDOW_SQL, CATEGORY_REVENUE_SQL, CATEGORY_REVENUE_WINDOW_SQL, FUSED,
+                             TOP3_PRODUCTS_SQL, TOP_CATEGORY_QTY_SQL, TOP_CUSTOMER_MARGIN_SQL)
+from agent.tools.kpi_engine import results_match
+from agent.tools.shards import ShardedExecutor, split
+from agent.tools.sqlite_tool import SQLiteTool
+from bench.generate_db import generate
+
+# Orders in the generated DB run from mid-1996 to mid-1998
+WINDOWS = [
+    ("1997-06-01", "1997-06-30"),
+    ("1997-06-15", "1997-07-15"),  # overlaps the previous one
+    ("1996-12-01", "1997-01-31"),  # crosses a year (and shard) boundary
+    ("1996-01-01", "1998-12-31"),  # everything
+    ("1997-03-10", "1997-03-10"),  # a single day
+    ("1990-01-01", "1990-12-31"),  # no orders
+    ("1997-08-01", "1997-07-01"),  # lo > hi: no orders
+]
+CATEGORIES = ["Beverages", "Produce", "No Such Category"]
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "northwind_sf2.sqlite")
+    generate(path, scale=2)
+    return path
+
+
+@pytest.fixture(scope="module")
+def tool(db):
+    tool = SQLiteTool(db)
+    yield tool
+    tool.close()
+
+
+@pytest.fixture(scope="module")
+def sharded(db, tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("shards"))
+    split(db, out_dir)
+    executor = ShardedExecutor(os.path.join(out_dir, "manifest.json"))
+    yield executor
+    executor.close()
+
+
+def _fused_rows(tool, sql, params):
+    """Rows per param tuple from the fused query, filled in the way HybridAgent.fuse does."""
+    fused_sql, fused_params = FUSED[sql](params)
+    cols, rows, err = tool.run(fused_sql, fused_params)
+    assert err is None
+    by_k = {r[0]: [tuple(r[1:])] for r in rows}
+    return [by_k.get(k, [(None,) * (len(cols) - 1)]) for k in range(len(params))]
+
+
+def test_fused_aov_matches_single_queries(tool):
+    params = list(WINDOWS)
+    for p, rows in zip(params, _fused_rows(tool, AOV_WINDOW_SQL, params)):
+        assert results_match(rows, tool.run(AOV_WINDOW_SQL, p)[1]), p
+
+
+def test_fused_category_revenue_matches_single_queries(tool):
+    params = [(c, *w) for c in CATEGORIES for w in WINDOWS]
+    for p, rows in zip(params, _fused_rows(tool, CATEGORY_REVENUE_WINDOW_SQL, params)):
+        assert results_match(rows, tool.run(CATEGORY_REVENUE_WINDOW_SQL, p)[1]), p
+
+
+def test_fused_single_window(tool):
+    p = WINDOWS[0]
+    assert results_match(_fused_rows(tool, AOV_WINDOW_SQL, [p])[0], tool.run(AOV_WINDOW_SQL, p)[1])
+
+
+def _cases():
+    yield "top3_products_revenue", TOP3_PRODUCTS_SQL, ()
+    yield "aov_window", AOV_SQL + ";", ()
+    yield "category_revenue_window", CATEGORY_REVENUE_SQL + ";", ("Beverages",)
+    yield "category_revenue_window", CATEGORY_REVENUE_SQL + ";", ("No Such Category",)
+    for w in WINDOWS:
+        yield "aov_window", AOV_WINDOW_SQL, w
+        yield "top_category_quantity_summer", TOP_CATEGORY_QTY_SQL, w
+        yield "top_customer_margin_1997", TOP_CUSTOMER_MARGIN_SQL, w
+        for c in CATEGORIES:
+            yield "category_revenue_window", CATEGORY_REVENUE_WINDOW_SQL, (c, *w)
+
+
+@pytest.mark.parametrize("template_id, sql, params", list(_cases()))
+def test_sharded_matches_single_db(tool, sharded, template_id, sql, params):
+    before = sharded.rechecked
+    cols, rows, err = sharded.run(template_id, params)
+    assert err is None
+    expected = tool.run(sql, params)[1]
+    assert results_match(rows, expected)
+    if sharded.rechecked > before:
+        assert rows == expected
+
+
+def test_near_half_cent_rechecked_on_source(db, tool, sharded):
+    # All-time top-3 revenue on this DB has a product at 120932.125 in decimal, which a
+    # float sum may round to either cent depending on the order lines are added in
+    before = sharded.rechecked
+    rows = sharded.run("top3_products_revenue", ())[1]
+    assert sharded.rechecked == before + 1
+    assert rows == tool.run(TOP3_PRODUCTS_SQL)[1]
+
+
+def test_no_recheck_on_a_changed_source(db, tmp_path):
+    source = str(tmp_path / "northwind.sqlite")
+    shutil.copy(db, source)
+    split(source, str(tmp_path / "shards"))
+    conn = sqlite3.connect(source)
+    conn.execute('DELETE FROM "Orders" WHERE OrderID % 2 = 0')
+    conn.commit()
+    conn.close()
+    executor = ShardedExecutor(str(tmp_path / "shards" / "manifest.json"))
+    try:
+        cols, rows, err = executor.run("top3_products_revenue", ())
+        assert err is None and len(rows) == 3
+        assert executor.rechecked == 0
+    finally:
+        executor.close()
+
+
+def test_split_covers_every_order(db, tool, sharded):
+    total = sum(sharded._tool(s.path).run('SELECT COUNT(*) FROM "Orders"')[1][0][0] for s in sharded.shards)
+    assert total == tool.run('SELECT COUNT(*) FROM "Orders"')[1][0][0]
+
+
+def test_empty_manifest(tmp_path):
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps({"shards": []}))
+    executor = ShardedExecutor(str(manifest))
+    assert executor.run("top3_products_revenue", ()) == (["product", "revenue"], [], None)
+    assert executor.run("aov_window", WINDOWS[0]) == (["aov"], [(None,)], None)
+    assert executor.run("top_customer_margin_1997", WINDOWS[0])[1:] == ([], None)
+
+
+def test_split_keeps_lines_without_an_order(tmp_path):
+    # Top-3 products does not join Orders, so lines whose order row is gone still count
+    path = str(tmp_path / "orphans.sqlite")
+    generate(path, scale=2)
+    conn = sqlite3.connect(path)
+    conn.execute('DELETE FROM "Orders" WHERE OrderID % 7 = 0')
+    conn.commit()
+    conn.close()
+    split(path, str(tmp_path / "shards"))
+    executor = ShardedExecutor(str(tmp_path / "shards" / "manifest.json"))
+    tool = SQLiteTool(path)
+    try:
+        assert results_match(executor.run("top3_products_revenue", ())[1], tool.run(TOP3_PRODUCTS_SQL)[1])
+        assert results_match(executor.run("aov_window", ())[1], tool.run(AOV_SQL + ";")[1])
+    finally:
+        executor.close()
+        tool.close()
@@ -0,0 +1,111 @@
+"""Rollup rewrites against the raw template SQL, and when the agent may use them.
+
+Each rollup variant in agent/templates.py is run on the attached rollup file and
+compared with the template SQL on the order lines (at answer precision, results_match),
+after a full build and after an incremental refresh. The agent must fall back to the
+template SQL whenever the rollup file is missing or stale.
+"""
+import shutil
+import sqlite3
+
+import pytest
+
+from agent.runner import make_agent
+from agent.templates import (AOV_SQL, AOV_WINDOW_SQL, CATEGORY_REVENUE_SQL, CATEGORY_REVENUE_WINDOW_SQL,
+                             ROLLUP_AOV_SQL, ROLLUP_AOV_WINDOW_SQL, ROLLUP_CATEGORY_REVENUE_SQL,
+                             ROLLUP_CATEGORY_REVENUE_WINDOW_SQL, ROLLUP_TOP_CATEGORY_QTY_SQL,
+                             ROLLUP_TOP_CUSTOMER_MARGIN_SQL, TOP_CATEGORY_QTY_SQL, TOP_CUSTOMER_MARGIN_SQL)
+from agent.tools.kpi_engine import results_match
+from agent.tools.rollups import SCHEMA, RollupStore
+from agent.tools.sqlite_tool import SQLiteTool
+from bench.generate_db import generate
+
+WINDOWS = [
+    ("1997-06-01", "1997-06-30"),
+    ("1996-12-01", "1997-01-31"),
+    ("1996-01-01", "1998-12-31"),
+    ("1997-03-10", "1997-03-10"),
+    ("1990-01-01", "1990-12-31"),
+]
+CATEGORIES = ["Beverages", "Produce", "No Such Category"]
+AOV_QUESTION = "What was the Average Order Value during 'Winter Classics 1997'?"
+
+
+def _cases():
+    yield AOV_SQL + ";", ROLLUP_AOV_SQL + ";", ()
+    for c in CATEGORIES:
+        yield CATEGORY_REVENUE_SQL + ";", ROLLUP_CATEGORY_REVENUE_SQL + ";", (c,)
+    for w in WINDOWS:
+        yield AOV_WINDOW_SQL, ROLLUP_AOV_WINDOW_SQL, w
+        yield TOP_CATEGORY_QTY_SQL, ROLLUP_TOP_CATEGORY_QTY_SQL, w
+        yield TOP_CUSTOMER_MARGIN_SQL, ROLLUP_TOP_CUSTOMER_MARGIN_SQL, w
+        for c in CATEGORIES:
+            yield CATEGORY_REVENUE_WINDOW_SQL, ROLLUP_CATEGORY_REVENUE_WINDOW_SQL, (c, *w)
+
+
+def _add_order(path: str):
+    """Append one order (copying the last order's lines) past the high-water mark."""
+    conn = sqlite3.connect(path)
+    last = conn.execute('SELECT MAX(OrderID) FROM "Orders"').fetchone()[0]
+    conn.execute('INSERT INTO "Orders" SELECT OrderID + 1, CustomerID, EmployeeID, OrderDate, RequiredDate, '
+                 'ShippedDate, ShipVia, Freight FROM "Orders" WHERE OrderID = ?', (last,))
+    conn.execute('INSERT INTO "Order Details" SELECT OrderID + 1, ProductID, UnitPrice, Quantity, Discount '
+                 'FROM "Order Details" WHERE OrderID = ?', (last,))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def base_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "northwind_sf2.sqlite")
+    generate(path, scale=2)
+    return path
+
+
+@pytest.fixture
+def db(base_db, tmp_path):
+    path = str(tmp_path / "northwind.sqlite")
+    shutil.copy(base_db, path)
+    return path
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_rollup_variants_match_template_sql(db, tmp_path, incremental):
+    store = RollupStore(str(tmp_path / "rollups.sqlite"), db)
+    store.refresh()
+    if incremental:
+        _add_order(db)
+        assert store.refresh()["mode"] == "incremental"
+    assert store.is_fresh()
+    tool = SQLiteTool(db, attach={SCHEMA: store.path})
+    try:
+        for sql, rollup_sql, params in _cases():
+            cols, rows, err = tool.run(sql, params)
+            r_cols, r_rows, r_err = tool.run(rollup_sql, params)
+            assert err is None and r_err is None
+            assert r_cols == cols
+            assert results_match(r_rows, rows), (rollup_sql, params)
+    finally:
+        tool.close()
+
+
+def test_agent_without_rollup_file(db, tmp_path):
+    agent = make_agent(db, rollups_path=str(tmp_path / "missing_rollups.sqlite"))
+    res = agent.repair_and_run("q", AOV_QUESTION, "float", docs=[])
+    assert "rollup." not in res["sql"]
+    assert res["confidence"] == 0.9 and res["final_answer"] > 0
+
+
+def test_agent_uses_rollups_only_while_fresh(db, tmp_path):
+    rollups_path = str(tmp_path / "rollups.sqlite")
+    RollupStore(rollups_path, db).refresh()
+    agent = make_agent(db, rollups_path=rollups_path)
+    fresh = agent.repair_and_run("q", AOV_QUESTION, "float", docs=[])
+    assert fresh["sql"] == ROLLUP_AOV_WINDOW_SQL
+    _add_order(db)
+    stale = agent.repair_and_run("q", AOV_QUESTION, "float", docs=[])
+    assert stale["sql"] == AOV_WINDOW_SQL and stale["confidence"] == 0.9
+    # A new agent over stale rollups does not attach them at all
+    later = make_agent(db, rollups_path=rollups_path)
+    assert SCHEMA not in later.sqlite.attach
+    assert later.repair_and_run("q", AOV_QUESTION, "float", docs=[])["sql"] == AOV_WINDOW_SQL
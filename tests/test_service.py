@@ -0,0 +1,203 @@
+"""The asyncio service over real sockets: validation, coalescing and overload rejection.
+
+The agent is the real one on a generated DB; where a test needs computations to stay
+in flight, its repair_and_run is held on a threading.Event until the test releases it.
+"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+from agent.runner import make_agent
+from agent.service import MAX_BODY, AgentService
+from bench.generate_db import generate
+
+AOV_QUESTION = "What was the Average Order Value during 'Winter Classics 1997'?"
+TOP3_QUESTION = "Top 3 products by total revenue all-time."
+
+
+@pytest.fixture(scope="module")
+def agent(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "northwind_sf2.sqlite")
+    generate(path, scale=2)
+    return make_agent(path)
+
+
+@pytest.fixture
+def gate(agent, monkeypatch):
+    """Hold every computation until gate.set(); gate.calls counts the computations."""
+    gate = threading.Event()
+    gate.calls = 0
+    run = agent.repair_and_run
+
+    def held(*args, **kwargs):
+        gate.calls += 1
+        gate.wait(10)
+        return run(*args, **kwargs)
+
+    monkeypatch.setattr(agent, "repair_and_run", held)
+    yield gate
+    gate.set()
+
+
+def _serve(service: AgentService, protocol: str, client):
+    """Run client(port) against the service listening on a free local port."""
+    async def main():
+        handler = service.handle_http if protocol == "http" else service.handle_jsonl
+        server = await asyncio.start_server(handler, "127.0.0.1", 0, limit=MAX_BODY)
+        async with server:
+            return await client(server.sockets[0].getsockname()[1])
+    try:
+        return asyncio.run(main())
+    finally:
+        service.executor.shutdown(wait=True)
+
+
+async def _post(port: int, body: bytes):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST /answer HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+                 "Connection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    payload = json.loads(await reader.readexactly(int(headers["content-length"])))
+    writer.close()
+    return status, headers, payload
+
+
+async def _until(condition):
+    for _ in range(1000):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("condition not reached")
+
+
+MALFORMED = [
+    (b"not json", None),
+    (b"\xff\xfe", None),
+    (b"[1, 2]", None),
+    (b'"question"', None),
+    (b'{"id": 1}', 1),
+    (b'{"id": 2, "question": ""}', 2),
+    (b'{"id": 3, "question": "   "}', 3),
+    (b'{"id": 4, "question": 42}', 4),
+    (b'{"id": 5, "question": "Top 3 products?", "format_hint": 3}', 5),
+    (b'{"id": 6, "question": "Top 3 products?", "format_hint": ["int"]}', 6),
+]
+
+
+def test_http_rejects_malformed_bodies(agent, gate):
+    service = AgentService(agent, workers=2)
+
+    async def client(port):
+        return [await _post(port, body) for body, _ in MALFORMED]
+
+    for (status, _, payload), (_, job_id) in zip(_serve(service, "http", client), MALFORMED):
+        assert status == 400 and payload["id"] == job_id and payload["error"]
+    assert gate.calls == 0
+    assert service.stats["invalid"] == len(MALFORMED) and service.stats["errors"] == 0
+
+
+def test_jsonl_rejects_malformed_lines(agent):
+    service = AgentService(agent, workers=2)
+    lines = [body for body, _ in MALFORMED if b"\n" not in body]
+    good = {"id": "ok", "question": AOV_QUESTION, "format_hint": "float"}
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"\n".join(lines + [json.dumps(good).encode("utf-8")]) + b"\n")
+        writer.write_eof()
+        out = [json.loads(line) async for line in reader]
+        writer.close()
+        return out
+
+    out = _serve(service, "jsonl", client)
+    answered = [o for o in out if o["id"] == "ok"]
+    errors = [o for o in out if o["id"] != "ok"]
+    assert len(answered) == 1 and answered[0]["final_answer"] > 0
+    assert all(o["error"] for o in errors)
+    assert sorted(map(repr, (o["id"] for o in errors))) == sorted(map(repr, (i for _, i in MALFORMED)))
+    assert service.stats["invalid"] == len(lines) and service.stats["computed"] == 1
+
+
+def test_missing_format_hint_defaults_to_empty(agent):
+    service = AgentService(agent, workers=2)
+
+    async def client(port):
+        return await _post(port, json.dumps({"id": "q1", "question": TOP3_QUESTION}).encode("utf-8"))
+
+    status, _, payload = _serve(service, "http", client)
+    assert status == 200 and payload["id"] == "q1" and "error" not in payload
+    # No hint: the query still runs, the answer is left unformatted (HybridAgent.synthesize)
+    assert payload["sql"] and payload["final_answer"] == ""
+
+
+def test_concurrent_duplicates_are_coalesced(agent, gate):
+    service = AgentService(agent, workers=2)
+    job = {"question": AOV_QUESTION, "format_hint": "float"}
+
+    async def client(port):
+        first = asyncio.create_task(_post(port, json.dumps(dict(job, id=0)).encode("utf-8")))
+        await _until(lambda: service.stats["computed"] == 1)
+        rest = [asyncio.create_task(_post(port, json.dumps(dict(job, id=i)).encode("utf-8"))) for i in (1, 2)]
+        await _until(lambda: service.stats["coalesced"] == 2)
+        gate.set()
+        return await asyncio.gather(first, *rest)
+
+    responses = _serve(service, "http", client)
+    assert gate.calls == 1
+    assert [p["id"] for _, _, p in responses] == [0, 1, 2]
+    assert all(status == 200 for status, _, _ in responses)
+    assert len({p["final_answer"] for _, _, p in responses}) == 1
+    assert service.stats["computed"] == 1 and service.stats["coalesced"] == 2
+
+
+def test_overload_rejected_with_503(agent, gate):
+    service = AgentService(agent, workers=2, max_pending=1)
+    held = {"id": "held", "question": AOV_QUESTION, "format_hint": "float"}
+    other = {"id": "other", "question": TOP3_QUESTION, "format_hint": "list[{product:str, revenue:float}]"}
+
+    async def client(port):
+        first = asyncio.create_task(_post(port, json.dumps(held).encode("utf-8")))
+        await _until(lambda: len(service._inflight) == 1)
+        rejected = await _post(port, json.dumps(other).encode("utf-8"))
+        # The same question as the one in flight still joins it
+        joined = asyncio.create_task(_post(port, json.dumps(dict(held, id="joined")).encode("utf-8")))
+        await _until(lambda: service.stats["coalesced"] == 1)
+        gate.set()
+        return rejected, await first, await joined
+
+    (status, headers, payload), first, joined = _serve(service, "http", client)
+    assert status == 503 and headers["retry-after"] == "1"
+    assert payload == {"id": "other", "error": "overloaded"}
+    assert first[0] == 200 and joined[0] == 200 and joined[2]["id"] == "joined"
+    assert service.stats["rejected"] == 1 and gate.calls == 1
+
+
+def test_jsonl_overload_error_line(agent, gate):
+    service = AgentService(agent, workers=2, max_pending=1)
+    held = {"id": "held", "question": AOV_QUESTION, "format_hint": "float"}
+    other = {"id": "other", "question": TOP3_QUESTION, "format_hint": "list[{product:str, revenue:float}]"}
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write((json.dumps(held) + "\n").encode("utf-8"))
+        await _until(lambda: len(service._inflight) == 1)
+        writer.write((json.dumps(other) + "\n").encode("utf-8"))
+        rejected = json.loads(await reader.readline())
+        gate.set()
+        answered = json.loads(await reader.readline())
+        writer.close()
+        return rejected, answered
+
+    rejected, answered = _serve(service, "jsonl", client)
+    assert rejected == {"id": "other", "error": "overloaded"}
+    assert answered["id"] == "held" and answered["final_answer"] > 0
@@ -0,0 +1,125 @@
+"""SQLiteTool: its connection pool, and the streaming (iter_rows) and columnar
+(run_columns) result modes checked row for row against run()."""
+import threading
+
+import pytest
+
+from agent.runner import make_agent
+from agent.templates import TOP3_PRODUCTS_SQL, TOP_CUSTOMER_MARGIN_SQL
+from agent.tools.sqlite_tool import PoolClosed, SQLiteTool, classify_error
+from bench.generate_db import generate
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("db") / "northwind_sf2.sqlite")
+    generate(path, scale=2)
+    return path
+
+
+def test_pool_close_drops_idle_connections(db):
+    tool = SQLiteTool(db, pool_size=2)
+    held = tool.pool.acquire()
+    assert tool.run('SELECT COUNT(*) FROM "Orders"')[2] is None  # leaves an idle connection
+    tool.close()
+    assert tool.pool._idle.empty()
+    with pytest.raises(PoolClosed):
+        tool.pool.acquire()
+    # A connection released after close() is not handed out again
+    tool.pool.release(held)
+    assert tool.pool._idle.empty()
+    with pytest.raises(PoolClosed):
+        tool.pool.acquire()
+    cols, rows, err = tool.run('SELECT COUNT(*) FROM "Orders"')
+    assert rows == [] and "closed" in err
+
+
+def test_pool_close_wakes_no_waiter_with_a_closed_connection(db):
+    tool = SQLiteTool(db, pool_size=1)
+    held = tool.pool.acquire()
+    errors = []
+
+    def wait_for_connection():
+        try:
+            tool.pool.acquire(timeout=5)
+        except Exception as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=wait_for_connection)
+    waiter.start()
+    tool.close()
+    tool.pool.release(held)
+    waiter.join()
+    assert len(errors) == 1 and isinstance(errors[0], PoolClosed)
+
+
+QUERIES = [
+    ('SELECT OrderID, CustomerID, OrderDate, Freight FROM "Orders" ORDER BY OrderID', ()),
+    ('SELECT * FROM "Order Details" WHERE OrderID BETWEEN ? AND ? ORDER BY OrderID, ProductID', (10300, 10400)),
+    (TOP3_PRODUCTS_SQL, ()),
+    (TOP_CUSTOMER_MARGIN_SQL, ("1997-01-01", "1997-12-31")),
+    ('SELECT OrderID FROM "Orders" WHERE OrderDate < ?', ("1900-01-01",)),
+    # A column that is NULL in the first batches and text in later ones
+    ('SELECT OrderID, CASE WHEN OrderID % 50 = 0 THEN CustomerID END AS c FROM "Orders" ORDER BY OrderID', ()),
+]
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 1000])
+@pytest.mark.parametrize("max_rows", [None, 0, 5])
+def test_streaming_and_columnar_match_run(db, batch_size, max_rows):
+    tool = SQLiteTool(db, pool_size=1)
+    try:
+        for sql, params in QUERIES:
+            cols, rows, err = tool.run(sql, params)
+            assert err is None
+            expected = rows if max_rows is None else rows[:max_rows]
+            s_cols, stream, s_err = tool.iter_rows(sql, params, batch_size=batch_size, max_rows=max_rows)
+            assert s_err is None and s_cols == cols
+            assert list(stream) == expected
+            c_cols, data, c_err = tool.run_columns(sql, params, batch_size=batch_size, max_rows=max_rows)
+            assert c_err is None and c_cols == cols
+            assert all(len(data[c]) == len(expected) for c in cols)
+            assert [tuple(data[c][i] for c in cols) for i in range(len(expected))] == expected
+    finally:
+        tool.close()
+
+
+def test_columnar_frame_matches_run(db):
+    pd = pytest.importorskip("pandas")
+    tool = SQLiteTool(db)
+    sql, params = QUERIES[1]
+    cols, rows, _ = tool.run(sql, params)
+    f_cols, frame, err = tool.run_columns(sql, params, batch_size=100, as_frame=True)
+    assert err is None and f_cols == cols and isinstance(frame, pd.DataFrame)
+    assert list(frame.itertuples(index=False, name=None)) == rows
+    tool.close()
+
+
+def test_stream_releases_its_connection(db):
+    tool = SQLiteTool(db, pool_size=1, acquire_timeout=0.05)
+    cols, stream, err = tool.iter_rows('SELECT * FROM "Order Details"', batch_size=10)
+    rows = iter(stream)
+    next(rows)
+    # The only connection is held by the unfinished stream
+    assert classify_error(tool.run('SELECT 1')[2]) == "busy"
+    stream.close()
+    assert tool.run('SELECT 1')[1] == [(1,)]
+    # A failing query hands its connection back too
+    assert tool.iter_rows('SELECT * FROM no_such_table')[2]
+    assert tool.run('SELECT 1')[1] == [(1,)]
+    with tool.iter_rows('SELECT * FROM "Orders"')[1] as stream:
+        next(iter(stream))
+    assert tool.run('SELECT 1')[1] == [(1,)]
+    tool.close()
+
+
+@pytest.mark.parametrize("sql, params, format_hint", [
+    (TOP3_PRODUCTS_SQL, (), "list[{product:str, revenue:float}]"),
+    (TOP_CUSTOMER_MARGIN_SQL, ("1997-01-01", "1997-12-31"), "{customer:str, margin:float}"),
+])
+def test_synthesize_from_a_stream(db, sql, params, format_hint):
+    agent = make_agent(db)
+    cols, rows, _ = agent.sqlite.run(sql, params)
+    from_list = agent.synthesize("q", "", rows, cols, [], sql, format_hint)
+    cols, stream, _ = agent.sqlite.iter_rows(sql, params, batch_size=1)
+    assert agent.synthesize("q", "", stream, cols, [], sql, format_hint) == from_list